@@ -27,5 +27,7 @@ setup(
         "scipy>=1.7.1",
         "axographio>=0.3.1"
     ],
-    entry_points={"console_scripts": ["ascam=src.ascam:main"]},
+    entry_points={
+        "console_scripts": ["ascam=src.ascam:main", "ascam-batch=src.batch:main"]
+    },
 )
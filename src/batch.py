@@ -0,0 +1,384 @@
+#!/usr/bin/env python
+"""
+Headless batch processing of recordings with ASCAM.
+
+The processing is described by a pipeline spec, a JSON file (or a YAML file
+if PyYAML is installed) that lists the files to process and the steps that
+are applied to each of them in order, e.g.
+
+    {
+        "files": ["data/*.mat"],
+        "output_dir": "results",
+        "load": {"sampling_rate": 40000},
+        "steps": [
+            {"step": "baseline_correction", "method": "Polynomial", "degree": 1},
+            {"step": "gauss_filter", "filter_freq": 1000},
+            {"step": "idealize", "amplitudes": [0, -0.7], "trace_unit": "pA"},
+            {"step": "export_events", "time_unit": "ms"},
+            {"step": "detect_first_activation", "threshold": -0.35,
+             "trace_unit": "pA"},
+            {"step": "export_first_activation"},
+            {"step": "save_project"}
+        ]
+    }
+
+The files are processed in parallel by a pool of worker processes, the
+outputs of a file are named after it and written to `output_dir`. Nothing in
+this module imports Qt, so it runs on machines without a display.
+"""
+import os
+import sys
+import glob
+import json
+import getopt
+import logging
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+try:
+    from .core import Recording, IdealizationCache
+    from .utils import initialize_logger
+    from .constants import CURRENT_UNIT_FACTORS, TIME_UNIT_FACTORS
+except ImportError:
+    from src.core import Recording, IdealizationCache
+    from src.utils import initialize_logger
+    from src.constants import CURRENT_UNIT_FACTORS, TIME_UNIT_FACTORS
+
+
+debug_logger = logging.getLogger("ascam.debug")
+ana_logger = logging.getLogger("ascam.analysis")
+
+
+class PipelineState:
+    """What the steps of a pipeline share while processing one file."""
+
+    def __init__(self, recording, output_stem):
+        """Parameters:
+            recording [Recording] - the data of the file
+            output_stem [str] - path of the outputs without extension, the
+                steps append a suffix to it"""
+
+        self.recording = recording
+        self.output_stem = output_stem
+        self.idealization_cache = None
+        self.outputs = []
+
+    def output(self, suffix):
+        path = self.output_stem + suffix
+        self.outputs.append(path)
+        return path
+
+
+def baseline_correction(state, **params):
+    state.recording.baseline_correction(**params)
+
+
+def gauss_filter(state, filter_freq):
+    state.recording.gauss_filter_series(filter_freq)
+
+
+def ck_filter(
+    state,
+    window_lengths,
+    weight_exponent,
+    weight_window,
+    apriori_f_weights=False,
+    apriori_b_weights=False,
+):
+    state.recording.CK_filter_series(
+        window_lengths,
+        weight_exponent,
+        weight_window,
+        apriori_f_weights,
+        apriori_b_weights,
+    )
+
+
+def select_series(state, datakey):
+    if datakey not in state.recording:
+        raise ValueError(
+            f"series '{datakey}' does not exist, the recording has "
+            f"{list(state.recording.keys())}"
+        )
+    state.recording.current_datakey = datakey
+
+
+def idealize(
+    state,
+    amplitudes,
+    thresholds=None,
+    resolution=None,
+    interpolation_factor=1,
+    trace_unit="A",
+    time_unit="s",
+    refinement=None,
+):
+    """Idealize the current series, the amplitudes and thresholds are given
+    in `trace_unit` and the resolution in `time_unit`. `refinement` is
+    'linear' or 'cubic' to place the crossings between samples."""
+    trace_factor = CURRENT_UNIT_FACTORS[trace_unit]
+    amplitudes = np.asarray(amplitudes, dtype=float) / trace_factor
+    if thresholds is not None:
+        thresholds = np.asarray(thresholds, dtype=float) / trace_factor
+    if resolution is not None:
+        resolution = resolution / TIME_UNIT_FACTORS[time_unit]
+    cache = IdealizationCache(
+        state.recording,
+        amplitudes,
+        thresholds,
+        resolution,
+        interpolation_factor,
+        refinement=refinement,
+    )
+    cache.idealize_series()
+    state.recording.idealization_parameters = cache.parameters
+    state.idealization_cache = cache
+
+
+def export_events(state, time_unit="us", trace_unit="pA", suffix="_events.csv"):
+    if state.idealization_cache is None:
+        raise ValueError("'export_events' needs an 'idealize' step before it")
+    path = state.idealization_cache.export_events(
+        state.output(suffix), time_unit, trace_unit
+    )
+    # the format is given by the suffix, '.csv' is appended to unknown ones
+    state.outputs[-1] = path
+
+
+def detect_first_activation(state, threshold, trace_unit="A"):
+    state.recording.detect_fa(threshold / CURRENT_UNIT_FACTORS[trace_unit])
+
+
+def export_first_activation(
+    state,
+    time_unit="ms",
+    trace_unit="pA",
+    lists=None,
+    suffix="_first_activation.csv",
+):
+    state.recording.export_first_activation(
+        state.output(suffix),
+        time_unit=time_unit,
+        lists_to_save=lists,
+        trace_unit=trace_unit,
+    )
+
+
+def save_project(state, suffix=""):
+    path = state.recording.save_project(state.output(suffix))
+    # the project path gets its extension from `save_project`
+    state.outputs[-1] = path
+
+
+# the steps of a pipeline by the name used in the spec
+STEPS = {
+    "baseline_correction": baseline_correction,
+    "gauss_filter": gauss_filter,
+    "ck_filter": ck_filter,
+    "select_series": select_series,
+    "idealize": idealize,
+    "export_events": export_events,
+    "detect_first_activation": detect_first_activation,
+    "export_first_activation": export_first_activation,
+    "save_project": save_project,
+}
+
+
+def load_pipeline(filename):
+    """Read a pipeline spec from a JSON or YAML file and check it, see
+    `check_pipeline`."""
+    with open(filename) as file:
+        if os.path.splitext(filename)[1].lower() in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError(
+                    "Reading YAML pipelines requires PyYAML, install it or "
+                    "write the pipeline as JSON."
+                )
+            pipeline = yaml.safe_load(file)
+        else:
+            pipeline = json.load(file)
+    check_pipeline(pipeline)
+    return pipeline
+
+
+def check_pipeline(pipeline):
+    """Raise a ValueError if the spec has unknown steps, so that mistakes are
+    found before any file is processed."""
+    if not isinstance(pipeline, dict):
+        raise ValueError("The pipeline has to be a mapping with a list of 'steps'.")
+    for n, step in enumerate(pipeline.get("steps", [])):
+        name = step.get("step")
+        if name not in STEPS:
+            raise ValueError(
+                f"Step {n} of the pipeline is '{name}', the known steps are "
+                f"{list(STEPS)}."
+            )
+
+
+def expand_files(patterns):
+    """Return the files matching a list of glob patterns, in order and
+    without duplicates. Patterns that match nothing are kept as they are so
+    that the missing file is reported."""
+    files = []
+    for pattern in patterns:
+        for filename in sorted(glob.glob(pattern)) or [pattern]:
+            if filename not in files:
+                files.append(filename)
+    return files
+
+
+def process_file(filename, pipeline, output_dir="."):
+    """Load a file and run the steps of the pipeline on it.
+
+    Parameters:
+        filename [str] - the recording, any file `Recording.from_file` loads
+        pipeline [dict] - the spec, see the module docstring
+        output_dir [str] - the directory of the outputs
+    Returns:
+        outputs [list] - the paths of the files that were written"""
+    ana_logger.info(f"batch processing '{filename}'")
+    recording = Recording.from_file(filename, **pipeline.get("load", {}))
+    stem = os.path.splitext(os.path.basename(filename.rstrip(os.sep)))[0]
+    state = PipelineState(recording, os.path.join(output_dir, stem))
+    for step in pipeline.get("steps", []):
+        params = {key: value for key, value in step.items() if key != "step"}
+        debug_logger.debug(f"running step {step['step']} on {filename}")
+        STEPS[step["step"]](state, **params)
+    return state.outputs
+
+
+def _process_file(args):
+    """Run `process_file` and return the error instead of raising it, so
+    that one broken file does not stop the batch."""
+    filename = args[0]
+    try:
+        return filename, process_file(*args), None
+    except Exception:
+        return filename, [], traceback.format_exc()
+
+
+def run_pipeline(pipeline, files=None, output_dir=None, n_workers=None):
+    """Process files with a pipeline, in parallel if `n_workers` is not 1.
+
+    Parameters:
+        pipeline [dict] - the spec, see the module docstring
+        files [list] - glob patterns of the files, default to the 'files' of
+            the spec
+        output_dir [str] - the directory of the outputs, defaults to the
+            'output_dir' of the spec or the current directory
+        n_workers [int] - number of worker processes, by default one per CPU
+    Returns:
+        results [list] - tuples of the file name, the paths of the outputs
+            and the traceback if processing the file failed, else None"""
+    check_pipeline(pipeline)
+    files = expand_files(files or pipeline.get("files", []))
+    if output_dir is None:
+        output_dir = pipeline.get("output_dir", ".")
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(filename, pipeline, output_dir) for filename in files]
+    if n_workers is None:
+        n_workers = min(len(tasks), os.cpu_count() or 1)
+    if n_workers <= 1:
+        results = [_process_file(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(n_workers) as pool:
+            results = list(pool.map(_process_file, tasks))
+    for filename, outputs, error in results:
+        if error is None:
+            ana_logger.info(f"finished '{filename}', wrote {outputs}")
+        else:
+            ana_logger.error(f"failed to process '{filename}':\n{error}")
+    return results
+
+
+def parse_options(argv):
+    """
+    Parse the command line options of the batch mode.
+
+    Returns:
+        pipeline (string) - path of the pipeline spec
+        files (list) - files to process instead of those in the spec
+        output_dir (string) - directory of the outputs
+        n_workers (int) - number of worker processes
+        debug (bool) - if true print contents of debug log to console
+        silent (bool) - if true do not print contents of analysis log to console
+        logdir (string) - the directory in which the log should be saved
+    """
+    output_dir = None
+    n_workers = None
+    debug = False
+    silent = False
+    logdir = "./ASCAM_logfiles"
+    try:
+        options, args = getopt.getopt(
+            argv,
+            "o:j:dsl:h",
+            ["output=", "jobs=", "debug", "silent", "logdir=", "help"],
+        )
+    except getopt.GetoptError as err:
+        print(err)
+        display_help()
+        sys.exit(2)
+
+    for opt, arg in options:
+        if opt in ("-o", "--output"):
+            output_dir = arg
+        elif opt in ("-j", "--jobs"):
+            n_workers = int(arg)
+        elif opt in ("-d", "--debug"):
+            debug = True
+        elif opt in ("-s", "--silent"):
+            silent = True
+        elif opt in ("-l", "--logdir"):
+            logdir = arg
+        elif opt in ("-h", "--help"):
+            display_help()
+            sys.exit(0)
+
+    if not args:
+        display_help()
+        sys.exit(2)
+    return args[0], args[1:], output_dir, n_workers, debug, silent, logdir
+
+
+def display_help():
+    """
+    Print a manual for calling the batch mode to the commandline.
+    """
+    print(
+        """Usage: ascam-batch [options] pipeline.json [files ...]
+
+            files : files to process, by default the 'files' of the pipeline
+            -o --output : directory of the outputs
+            -j --jobs : number of files processed in parallel
+            -d --debug : print debug messages to console
+            -s --silent : do not print content of analysis log to console
+            -l --logdir : directory in which the log file should be saved
+            -h --help : display this message"""
+    )
+
+
+def main(argv=None):
+    pipeline, files, output_dir, n_workers, debug, silent, logdir = parse_options(
+        sys.argv[1:] if argv is None else argv
+    )
+    initialize_logger(logdir, silent, debug)
+    logging.info("-" * 20 + "Start of new ASCAM batch" + "-" * 20)
+    try:
+        pipeline = load_pipeline(pipeline)
+    except (OSError, ValueError) as err:
+        print(err)
+        sys.exit(2)
+    results = run_pipeline(pipeline, files, output_dir, n_workers)
+    failed = [filename for filename, _, error in results if error is not None]
+    if failed:
+        print(f"{len(failed)} of {len(results)} files failed: {failed}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,23 @@
 DEFAULT_GAUSS_CUTOFF_FREQ = 1000
 
+# `.mat` files larger than this are loaded lazily, episodes are decoded when
+# they are first accessed and kept in a cache of the given size (in bytes)
+LAZY_LOADING_FILE_SIZE = 2 ** 30
+EPISODE_CACHE_BYTES = 2 ** 29
+# memory budget (in bytes) for the idealizations kept for all parameters
+IDEALIZATION_CACHE_BYTES = 2 ** 28
+# memory budget (in bytes) for the sorted samples kept for histograms
+HISTOGRAM_CACHE_BYTES = 2 ** 28
+# memory budget (in bytes) for the decimated signals kept for plotting
+PLOT_CACHE_BYTES = 2 ** 27
+# memory budget (in bytes) for the overview images of the series
+OVERVIEW_CACHE_BYTES = 2 ** 26
+# memory budget (in bytes) for the spline coefficients of interpolated episodes
+SPLINE_CACHE_BYTES = 2 ** 27
+# number of episodes the background idealization processes between checks
+# for cancellation and for episodes that are requested in the foreground
+BACKGROUND_CHUNK_EPISODES = 16
+
 CURRENT_UNIT_FACTORS = {"fA": 1e15, "pA": 1e12, "nA": 1e9, "µA": 1e6, "mA": 1e3, "A": 1}
 VOLTAGE_UNIT_FACTORS = {"uV": 1e6, "mV": 1e3, "V": 1}
 TIME_UNIT_FACTORS = {"us": 1e6, "ms": 1e3, "s": 1}
@@ -1,3 +1,7 @@
 from .episode import Episode
-from .idealization import IdealizationCache
+from .series import Series
+from .events import EventTable, RLEIdealization, EVENT_DTYPE
+from .parallel import SeriesExecutor
+from .idealization import IdealizationCache, BackgroundIdealization
 from .recording import Recording
+from .event_export import read_events
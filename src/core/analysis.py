@@ -1,27 +1,156 @@
 import warnings
-import copy
 import logging
 
 import numpy as np
-from scipy.interpolate import CubicSpline as spCubicSpline
+from scipy.interpolate import CubicSpline as spCubicSpline, PPoly
 
-from ..utils.tools import interval_selection, piezo_selection
+from ..utils.tools import interval_selection, select_indices
+from .masks import selection_mask, mask_runs
+from .events import RLEIdealization
 
 
 ana_logger = logging.getLogger("ascam.analysis")
 debug_logger = logging.getLogger("ascam.debug")
 
+# above this number of thresholds samples are classified by binary search
+SEARCHSORTED_MIN_THRESHOLDS = 16
+# number of samples of the original trace whose spline is computed at once
+INTERPOLATION_CHUNK_SAMPLES = 4096
+# samples added on either side of a chunk, the influence of a sample on a
+# cubic spline decays by a factor of ~3.7 per sample so with this overlap the
+# spline of a chunk equals the spline of the whole trace to rounding error
+INTERPOLATION_OVERLAP_SAMPLES = 32
+# number of interpolated values (summed over the rows of a block) that are
+# evaluated and classified at once
+INTERPOLATION_CHUNK_VALUES = 2**20
+# the ways the threshold crossings of an idealization at the native sampling
+# rate can be placed between samples, see `Idealizer.refine_crossings`
+CROSSING_REFINEMENTS = ("linear", "cubic")
+# bisection steps locating a crossing on the cubic through four samples,
+# enough for a precision of 1e-9 samples
+CUBIC_REFINEMENT_STEPS = 30
+
+
+def interpolation_time(time, interpolation_factor):
+    """Return the time points at which a signal sampled at `time` is
+    evaluated when it is interpolated by `interpolation_factor`."""
+
+    if interpolation_factor == 1:
+        return time
+    return np.arange(time[0], time[-1], (time[1] - time[0]) / interpolation_factor)
+
 
 def interpolate(
     signal, time, interpolation_factor
 ):
-    """Interpolate the signal with a cubic spline."""
+    """Interpolate the signal with a cubic spline, if `signal` is a 2D block
+    every row is interpolated."""
+
+    spline = spCubicSpline(time, signal, axis=-1)
+    interpolated_time = interpolation_time(time, interpolation_factor)
+    return spline(interpolated_time), interpolated_time
+
+
+class ChunkedSpline:
+    """Cubic spline through a signal computed in overlapping chunks.
+
+    The spline of every chunk of `chunk_size` samples is fitted to the chunk
+    extended by `overlap` samples on both sides and only its coefficients
+    for the intervals of the chunk are kept, so no more than one chunk is
+    solved at a time. The coefficients take four times the memory of the
+    signal, independent of the interpolation factor, and can be evaluated
+    again when only the thresholds of an idealization change."""
+
+    def __init__(
+        self,
+        signal,
+        time,
+        chunk_size=INTERPOLATION_CHUNK_SAMPLES,
+        overlap=INTERPOLATION_OVERLAP_SAMPLES,
+    ):
+        """Parameters:
+            signal [array] - a 1D signal or a 2D block with one per row
+            time [1D array] - the time of the samples
+            chunk_size [int] - number of samples in a chunk
+            overlap [int] - number of samples added to each side of a chunk"""
+
+        signal = np.asarray(signal, dtype=float)
+        n_samples = signal.shape[-1]
+        self.time = time
+        self.ndim = signal.ndim
+        # the layout of `CubicSpline.c`, the rows of a block come last
+        self.coefficients = np.empty((4, n_samples - 1) + signal.shape[:-1])
+        for start in range(0, n_samples - 1, chunk_size):
+            stop = min(start + chunk_size, n_samples - 1)
+            first = max(start - overlap, 0)
+            last = min(stop + overlap, n_samples - 1)
+            spline = spCubicSpline(
+                time[first : last + 1], signal[..., first : last + 1], axis=-1
+            )
+            self.coefficients[:, start:stop] = spline.c[
+                :, start - first : stop - first
+            ]
+        self._ppoly = PPoly.construct_fast(
+            self.coefficients, self.time, axis=self.ndim - 1
+        )
+
+    @classmethod
+    def stack(cls, splines):
+        """Join the splines of 1D signals with the same time points into the
+        spline of the 2D block with one signal per row."""
+        spline = cls.__new__(cls)
+        spline.time = splines[0].time
+        spline.ndim = 2
+        spline.coefficients = np.stack([s.coefficients for s in splines], axis=-1)
+        spline._ppoly = PPoly.construct_fast(spline.coefficients, spline.time, axis=1)
+        return spline
+
+    def __repr__(self):
+        return f"ChunkedSpline({self.n_rows} rows, {len(self.time)} samples)"
+
+    def __call__(self, time):
+        """Evaluate the spline at the given time points."""
+        return self._ppoly(time)
+
+    @property
+    def n_rows(self):
+        return 1 if self.ndim == 1 else self.coefficients.shape[2]
+
+    @property
+    def nbytes(self):
+        return self.coefficients.nbytes
+
 
-    spline = spCubicSpline(time, signal)
-    interpolation_time = np.arange(
-        time[0], time[-1], (time[1] - time[0]) / interpolation_factor
-    )
-    return spline(interpolation_time), interpolation_time
+def fit_splines(signals, time):
+    """Return the `ChunkedSpline` of every row of a 2D block, as a list so
+    that it can be used with `SeriesExecutor.map_episodes`."""
+
+    return [ChunkedSpline(signal, time) for signal in signals]
+
+
+def check_refinement(refinement, interpolation_factor=1):
+    """Raise a ValueError if crossings cannot be refined this way."""
+
+    if refinement is None:
+        return
+    if refinement not in CROSSING_REFINEMENTS:
+        raise ValueError(
+            f"Unknown refinement '{refinement}', use one of {CROSSING_REFINEMENTS}."
+        )
+    if interpolation_factor != 1:
+        raise ValueError(
+            "Crossings are refined at the native sampling rate, they cannot "
+            "be combined with interpolation."
+        )
+
+
+def episode_rng(seed, n_episode):
+    """Return the random number generator for an episode, unseeded if `seed`
+    is None."""
+
+    if seed is None:
+        return np.random.default_rng()
+    return np.random.default_rng([seed, n_episode])
 
 
 class Idealizer:
@@ -36,39 +165,260 @@ class Idealizer:
         thresholds = None,
         resolution = None,
         interpolation_factor = 1,
+        rng = None,
+        spline = None,
+        refinement = None,
     ):
-        """Get idealization for single episode."""
+        """Get idealization for single episode, `rng` is the random number
+        generator passed to `resolve`. An interpolated signal is evaluated
+        and classified chunk by chunk, the `ChunkedSpline` of the signal can
+        be passed in to reuse it. If `refinement` is given the crossings are
+        placed between samples, see `refine_crossings`.
+
+        Returns:
+            idealization [RLEIdealization] - the idealization
+            time [1D array] - its time vector"""
 
         if thresholds is None or thresholds.size != amplitudes.size - 1:
             thresholds = (amplitudes[1:] + amplitudes[:-1]) / 2
+        check_refinement(refinement, interpolation_factor)
 
         if interpolation_factor != 1:
-            signal, time = interpolate(signal, time, interpolation_factor)
-
-        idealization = cls.threshold_crossing(signal, amplitudes, thresholds)
+            if spline is None:
+                spline = ChunkedSpline(signal, time)
+            time = interpolation_time(time, interpolation_factor)
+            (idealization,) = cls.classify_spline(spline, time, amplitudes, thresholds)
+            idealization.time = time
+        else:
+            levels = cls.classify(signal, amplitudes, thresholds)
+            idealization = RLEIdealization.from_levels(
+                levels, cls.level_amplitudes(amplitudes), time
+            )
+            if refinement is not None:
+                idealization.crossings = cls.refine_crossings(
+                    signal, idealization, thresholds, refinement
+                )
 
         if resolution is not None:
-            idealization = cls.apply_resolution(idealization, time, resolution)
+            idealization = cls.resolve(idealization, time, resolution, rng)
         return idealization, time
 
+    @classmethod
+    def idealize_series(
+        cls,
+        signals,
+        time,
+        amplitudes,
+        thresholds = None,
+        resolution = None,
+        interpolation_factor = 1,
+        seed = None,
+        n_episodes = None,
+        refinement = None,
+        splines = None,
+    ):
+        """Get the idealizations of a 2D block of signals, one per row.
+
+        The whole block is classified at once, or chunk by chunk if it is
+        interpolated, only the resolution is applied row by row. The time vector of the
+        idealizations is the same for all rows and can be obtained from
+        `interpolation_time`. The random numbers used by the resolution are
+        drawn from `episode_rng(seed, n_episode)` with the number of the
+        episode in each row, so the result does not depend on how a series
+        is split into blocks. The idealizations are returned as a list of
+        `RLEIdealization`s without time vector, so that they are cheap to
+        send between processes. If `refinement` is given the crossings are
+        placed between samples, see `refine_crossings`. The `ChunkedSpline`s
+        of the rows can be passed in as `splines` to reuse them when the
+        signals are interpolated."""
+
+        if thresholds is None or thresholds.size != amplitudes.size - 1:
+            thresholds = (amplitudes[1:] + amplitudes[:-1]) / 2
+        check_refinement(refinement, interpolation_factor)
+
+        if interpolation_factor != 1:
+            if splines is None:
+                spline = ChunkedSpline(signals, time)
+            else:
+                spline = ChunkedSpline.stack(splines)
+            time = interpolation_time(time, interpolation_factor)
+            idealizations = cls.classify_spline(spline, time, amplitudes, thresholds)
+        else:
+            levels = cls.classify(signals, amplitudes, thresholds)
+            level_amplitudes = cls.level_amplitudes(amplitudes)
+            idealizations = [
+                RLEIdealization.from_levels(row, level_amplitudes) for row in levels
+            ]
+            if refinement is not None:
+                for signal, idealization in zip(signals, idealizations):
+                    idealization.crossings = cls.refine_crossings(
+                        signal, idealization, thresholds, refinement
+                    )
+
+        if resolution is not None:
+            if n_episodes is None:
+                n_episodes = range(len(idealizations))
+            return [
+                cls.resolve(
+                    idealization, time, resolution, episode_rng(seed, n_episode)
+                )
+                for idealization, n_episode in zip(idealizations, n_episodes)
+            ]
+        return idealizations
+
+    @classmethod
+    def classify_spline(
+        cls,
+        spline,
+        time,
+        amplitudes,
+        thresholds = None,
+        chunk_values = INTERPOLATION_CHUNK_VALUES,
+    ):
+        """Classify a spline at the given time points without evaluating it
+        at all of them at once.
+
+        The spline is evaluated on chunks of `time` with at most
+        `chunk_values` values over all rows, and of every chunk only the
+        samples at which the level changes are kept.
+        Arguments:
+            spline [ChunkedSpline] - the spline of a signal or a block
+            time [1D array] - the time points, see `interpolation_time`
+            amplitudes - amplitudes to which signal will be idealized
+            thresholds - the thresholds between the amplitudes
+            chunk_values [int] - number of values evaluated at once
+        Returns:
+            idealizations [list] - one `RLEIdealization` without time vector
+                per row of the spline"""
+
+        level_amplitudes = cls.level_amplitudes(amplitudes)
+        n_rows = spline.n_rows
+        step = max(chunk_values // n_rows, 2)
+        # the level of the last sample of the previous chunk of every row
+        previous = np.full(n_rows, -1, dtype=np.int8)
+        row_levels = [[] for _ in range(n_rows)]
+        row_starts = [[] for _ in range(n_rows)]
+        for start in range(0, len(time), step):
+            levels = cls.classify(
+                spline(time[start : start + step]), amplitudes, thresholds
+            ).reshape(n_rows, -1)
+            changes = np.empty(levels.shape, dtype=bool)
+            changes[:, 0] = levels[:, 0] != previous
+            np.not_equal(levels[:, 1:], levels[:, :-1], out=changes[:, 1:])
+            rows, indices = np.nonzero(changes)
+            bounds = np.searchsorted(rows, np.arange(n_rows + 1))
+            for row in range(n_rows):
+                row_indices = indices[bounds[row] : bounds[row + 1]]
+                row_levels[row].append(levels[row, row_indices])
+                row_starts[row].append(row_indices + start)
+            previous = levels[:, -1]
+        return [
+            RLEIdealization(
+                np.concatenate(levels),
+                np.concatenate(starts),
+                len(time),
+                level_amplitudes,
+            )
+            for levels, starts in zip(row_levels, row_starts)
+        ]
+
     @staticmethod
-    def threshold_crossing(
+    def refine_crossings(signal, idealization, thresholds, method="linear"):
+        """Locate the threshold crossings of an idealization between the
+        samples of the signal.
+
+        A run starting at sample `s` begins where the signal crosses the
+        thresholds between the levels of the two runs, which lies between
+        the samples `s - 1` and `s`. If several thresholds are crossed at
+        once their mean is used. The crossing is found on the line through
+        the two samples or, for `method="cubic"`, on the cubic through the
+        samples `s - 2` to `s + 1`. Only the samples next to the crossings
+        are used, so this costs about as much as `threshold_crossing`.
+        Arguments:
+            signal [1D array] - the signal at the native sampling rate
+            idealization [RLEIdealization] - its idealization
+            thresholds - the thresholds the idealization was created with
+            method [str] - one of `CROSSING_REFINEMENTS`
+        Returns:
+            crossings [1D float array] - the position of the start of each
+                run in samples, the first run starts at 0"""
+
+        signal = np.asarray(signal, dtype=float)
+        starts = idealization.starts[1:]
+        levels = idealization.levels.astype(np.int64)
+        # the thresholds in the order of the levels, level `k` lies between
+        # the thresholds `k - 1` and `k`
+        thresholds = np.sort(np.asarray(thresholds, dtype=float))[::-1]
+        cumulative = np.r_[0, np.cumsum(thresholds)]
+        low = np.minimum(levels[:-1], levels[1:])
+        high = np.maximum(levels[:-1], levels[1:])
+        threshold = (cumulative[high] - cumulative[low]) / (high - low)
+
+        before = signal[starts - 1]
+        after = signal[starts]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fraction = np.clip((threshold - before) / (after - before), 0, 1)
+        fraction[~np.isfinite(fraction)] = 1
+        if method == "cubic":
+            # the Lagrange polynomial through the samples at -1, 0, 1 and 2,
+            # the ends of the signal are repeated
+            outer_before = signal[np.maximum(starts - 2, 0)]
+            outer_after = signal[np.minimum(starts + 1, signal.size - 1)]
+
+            def cubic(u):
+                return (
+                    -u * (u - 1) * (u - 2) / 6 * outer_before
+                    + (u + 1) * (u - 1) * (u - 2) / 2 * before
+                    - (u + 1) * u * (u - 2) / 2 * after
+                    + (u + 1) * u * (u - 1) / 6 * outer_after
+                    - threshold
+                )
+
+            # the cubic takes the values of the samples at 0 and 1, which
+            # lie on either side of the threshold
+            lower = np.zeros(starts.size)
+            upper = np.ones(starts.size)
+            rising = after > before
+            for _ in range(CUBIC_REFINEMENT_STEPS):
+                middle = (lower + upper) / 2
+                below = (cubic(middle) < 0) == rising
+                lower = np.where(below, middle, lower)
+                upper = np.where(below, upper, middle)
+            fraction = (lower + upper) / 2
+        elif method != "linear":
+            raise ValueError(
+                f"Unknown refinement '{method}', use one of {CROSSING_REFINEMENTS}."
+            )
+        return np.r_[0.0, starts - 1 + fraction]
+
+    @staticmethod
+    def level_amplitudes(amplitudes):
+        """Return the amplitudes in the order of the level codes returned by
+        `classify`, i.e. sorted in descending order."""
+
+        return np.sort(np.asarray(amplitudes, dtype=float))[::-1]
+
+    @staticmethod
+    def classify(
         signal,
         amplitudes,
         thresholds = None,
     ):
-        """Perform a threshold-crossing idealization on the signal.
+        """Map every sample of the signal to the level of its amplitude.
 
+        The level of a sample is the number of thresholds that lie above it,
+        that is its index in the amplitudes sorted in descending order (see
+        `level_amplitudes`). The amplitudes of the idealization are
+        `level_amplitudes(amplitudes)[levels]`.
         Arguments:
-            signal - data to be idealized
+            signal - data to be idealized, a 1D signal or a 2D block of them
             amplitudes - amplitudes to which signal will be idealized
             thresholds - the thresholds above/below which signal is mapped
-                to an amplitude"""
+                to an amplitude
+        Returns:
+            levels [int8 array] - the level codes, same shape as signal"""
 
-        amplitudes = copy.copy(
-            np.sort(amplitudes)
-        )  # sort amplitudes in descending order
-        amplitudes = amplitudes[::-1]
+        amplitudes = Idealizer.level_amplitudes(amplitudes)
 
         # if thresholds are not or incorrectly supplied take midpoint between
         # amplitudes as thresholds
@@ -78,75 +428,155 @@ class Idealizer:
                 f"{amplitudes.size - 1} but there are {thresholds.size}.\n"
                 f"Thresholds = {thresholds}."
             )
-
+            thresholds = None
+        if thresholds is None:
             thresholds = (amplitudes[1:] + amplitudes[:-1]) / 2
 
-        # for convenience we include the trivial case of only 1 amplitude
-        if amplitudes.size == 1:
-            idealization = np.ones(signal.size) * amplitudes
-        else:
-            idealization = np.zeros(len(signal))
-            # np.where returns a tuple containing array so we have to get the
-            # first element to get the indices
-            inds = np.where(signal > thresholds[0])[0]
-            idealization[inds] = amplitudes[0]
-            for thresh, amp in zip(thresholds, amplitudes[1:]):
-                inds = np.where(signal < thresh)[0]
-                idealization[inds] = amp
+        # the level is the number of thresholds strictly greater than the
+        # sample, for a few thresholds counting with one comparison per
+        # threshold is much faster than a binary search per sample
+        thresholds = np.sort(np.asarray(thresholds, dtype=float))
+        if thresholds.size > SEARCHSORTED_MIN_THRESHOLDS:
+            levels = thresholds.size - np.searchsorted(thresholds, signal, side="right")
+            return levels.astype(np.int8)
+        levels = np.zeros(np.shape(signal), dtype=np.int8)
+        for threshold in thresholds:
+            levels += signal < threshold
+        return levels
+
+    @staticmethod
+    def threshold_crossing(
+        signal,
+        amplitudes,
+        thresholds = None,
+    ):
+        """Perform a threshold-crossing idealization on the signal.
+
+        Arguments:
+            signal - data to be idealized
+            amplitudes - amplitudes to which signal will be idealized
+            thresholds - the thresholds above/below which signal is mapped
+                to an amplitude"""
 
-        return idealization
+        levels = Idealizer.classify(signal, amplitudes, thresholds)
+        return Idealizer.level_amplitudes(amplitudes)[levels]
 
     @staticmethod
     def apply_resolution(
-        idealization, time, resolution
+        idealization, time, resolution, rng=None
     ):
         """Remove from the idealization any events that are too short.
 
         Args:
             idealization - an idealized current trace
             time - the corresponding time array
-            resolution - the minimum duration for an event"""
+            resolution - the minimum duration for an event
+            rng - `np.random.Generator` used to decide whether a short event
+                is merged into the next or the previous event"""
         ana_logger.debug(f"Apply resolution={resolution}.")
 
-        events = Idealizer.extract_events(idealization, time)
-
-        i = 0
-        end_ind = len(events[:, 1])
-        while i < end_ind:
-            if events[i, 1] < resolution:
-                i_start = int(np.where(time == events[i, 2])[0])
-                i_end = int(np.where(time == events[i, 3])[0]) + 1
-                # add the first but not the last event to the next,
-                # otherwise, flip a coin
-                if (np.random.binomial(1, 0.5) or i == 0) and i != end_ind - 1:
-                    i_end = int(np.where(time == events[i + 1, 3])[0]) + 1
-                    idealization[i_start:i_end] = events[i + 1, 0]
-                    # set amplitude
-                    events[i, 0] = events[i + 1, 0]
-                    # add duration
-                    events[i, 1] += events[i + 1, 1]
-                    # set end_time
-                    events[i, 3] = events[i + 1, 3]
-                    # delete next event
-                    events = np.delete(events, i + 1, axis=0)
-                else:  # add to the previous event
-                    i_start = int(np.where(time == events[i - 1, 2])[0])
-                    idealization[i_start:i_end] = events[i - 1, 0]
-                    # add duration
-                    events[i - 1, 1] += events[i, 1]
-                    # set end_time
-                    events[i - 1, 3] = events[i, 3]
-                    # delete current event
-                    events = np.delete(events, i, axis=0)
-                # now one less event to iterate over
-                end_ind -= 1
-            else:
-                i += 1
-        if np.any(Idealizer.extract_events(idealization, time)[:, 1] < resolution):
+        values, _, lengths = Idealizer.runs(idealization)
+        # compare numbers of samples rather than times, rounding removes the
+        # floating point error of the division
+        min_length = np.round(resolution / (time[1] - time[0]), 9)
+        values, lengths = Idealizer.resolve_runs(values, lengths, min_length, rng)
+        if lengths.size > 1 and np.any(lengths < min_length):
+            ana_logger.warning(
+                "Filter events below the resolution failed! Some events are still too short."
+            )
+        return np.repeat(values, lengths)
+
+    @staticmethod
+    def resolve(idealization, time, resolution, rng=None):
+        """Remove the events that are too short from an `RLEIdealization`,
+        like `apply_resolution` but without rendering the trace."""
+        ana_logger.debug(f"Apply resolution={resolution}.")
+
+        min_length = np.round(resolution / (time[1] - time[0]), 9)
+        levels, lengths = Idealizer.resolve_runs(
+            idealization.levels, idealization.lengths, min_length, rng
+        )
+        if lengths.size > 1 and np.any(lengths < min_length):
             ana_logger.warning(
                 "Filter events below the resolution failed! Some events are still too short."
             )
-        return idealization
+        resolved = RLEIdealization.from_runs(
+            levels, lengths, idealization.amplitudes, idealization.time
+        )
+        if idealization.crossings is not None:
+            # the remaining runs start where runs of the idealization started
+            resolved.crossings = idealization.crossings[
+                np.searchsorted(idealization.starts, resolved.starts)
+            ]
+        return resolved
+
+    @staticmethod
+    def runs(idealization):
+        """Split an idealization into runs of constant value.
+
+        Returns:
+            values [1D array] - the value of each run
+            starts [1D int array] - the index of the first sample of each run
+            lengths [1D int array] - the number of samples in each run"""
+
+        starts = np.flatnonzero(idealization[1:] != idealization[:-1]) + 1
+        starts = np.r_[0, starts]
+        lengths = np.diff(np.r_[starts, len(idealization)])
+        return idealization[starts], starts, lengths
+
+    @staticmethod
+    def resolve_runs(values, lengths, min_length, rng=None):
+        """Merge runs shorter than `min_length` into their neighbours.
+
+        A short run is merged into the next run (which takes over its
+        samples) and the result is checked again, or, with probability one
+        half, into the preceding run. The first run is always merged into
+        the next and the last into the previous one. Every run is visited
+        once, so the cost is linear in the number of runs.
+        Args:
+            values [1D array] - the value of each run
+            lengths [1D int array] - the number of samples in each run
+            min_length [float] - the minimum number of samples of a run
+            rng - `np.random.Generator` for the coin flips
+        Returns:
+            values, lengths - the runs after merging"""
+
+        if rng is None:
+            rng = np.random.default_rng()
+        n_runs = len(lengths)
+        # runs that are final, apart from runs merged into them from behind
+        out_values = list()
+        out_lengths = list()
+        values_list = values.tolist()
+        lengths_list = lengths.tolist()
+        value, length = values_list[0], lengths_list[0]
+        i = 1
+        while True:
+            if length < min_length:
+                coin = rng.random() < 0.5
+                if (coin or not out_lengths) and i < n_runs:
+                    # the next run absorbs this one and is checked again
+                    value = values_list[i]
+                    length += lengths_list[i]
+                    i += 1
+                    continue
+                if out_lengths:
+                    out_lengths[-1] += length
+                else:
+                    # a single short run cannot be merged into anything
+                    out_values.append(value)
+                    out_lengths.append(length)
+            else:
+                out_values.append(value)
+                out_lengths.append(length)
+            if i == n_runs:
+                break
+            value, length = values_list[i], lengths_list[i]
+            i += 1
+        return (
+            np.array(out_values, dtype=values.dtype),
+            np.array(out_lengths, dtype=int),
+        )
 
     @staticmethod
     def extract_events(
@@ -201,9 +631,103 @@ class Idealizer:
 def detect_first_activation(
     time, signal, threshold
 ):
-    """Return the time where a signal first crosses below a threshold."""
+    """Return the time where a signal first crosses below a threshold.
+
+    If `signal` is a 2D block of signals the first crossing of every row is
+    returned."""
+
+    return time[np.argmax(signal < threshold, axis=-1)]
+
+
+def baseline_correction_series(
+    signals,
+    piezo=None,
+    time=None,
+    sampling_rate=4e4,
+    intervals = None,
+    degree = 1,
+    method = "Polynomial",
+    selection = "piezo",
+    active = False,
+    deviation = 0.05,
+    masks = None,
+):
+    """Apply `baseline_correction` to every row of a 2D block of signals.
+
+    Rows whose baseline is estimated from the same samples are corrected
+    together: the polynomials are fitted with a single least squares solve
+    with one right hand side per row and the offsets are the means of the
+    rows. With intervals or without a selection this holds for all rows,
+    with the piezo selection for the rows with the same mask.
+    Parameters:
+        signals [2D array] - one signal per row
+        piezo [2D array] - the piezo voltages of the signals, one per row
+        masks [list of 1D bool arrays] - the samples selected by the piezo
+            voltage in each row, used instead of `piezo` if given
+    The other parameters are those of `baseline_correction`."""
+
+    signals = np.asarray(signals, dtype=float)
+    selection = selection.lower()
+    if selection == "piezo":
+        if masks is None:
+            masks = selection_mask(piezo, active, deviation)
+        groups = _group_rows(masks)
+    else:
+        groups = [(None, slice(None))]
+    if len(groups) == 1:
+        # all rows are fitted together, no need to copy them
+        groups = [(groups[0][0], slice(None))]
+    else:
+        output = np.empty_like(signals)
+    for mask, rows in groups:
+        block = signals[rows]
+        if selection == "intervals":
+            t, s = interval_selection(time, block, intervals, sampling_rate)
+        elif selection == "piezo":
+            indices = list(zip(*mask_runs(mask)))
+            t, s = select_indices(time, indices), select_indices(block, indices)
+        else:
+            t, s = time, block
+        baselines = _fit_baselines(time, t, s, method, degree)
+        if baselines.shape == block.shape:
+            corrected = np.subtract(block, baselines, out=baselines)
+        else:
+            corrected = block - baselines
+        if len(groups) == 1:
+            return corrected
+        output[rows] = corrected
+    return output
+
+
+def _group_rows(masks):
+    """Group the rows of a list of boolean masks by the masks, returns a list
+    of (mask, rows) pairs."""
+    groups = dict()
+    for row, mask in enumerate(masks):
+        key = np.packbits(mask).tobytes()
+        groups.setdefault(key, (mask, list()))[1].append(row)
+    return [(mask, np.array(rows)) for mask, rows in groups.values()]
+
 
-    return time[np.argmax(signal < threshold)]
+def _fit_baselines(time, t, s, method, degree):
+    """Return the baselines of the rows of `s`, sampled at `t`, evaluated
+    at `time`."""
+    if method.lower() == "offset":
+        return np.mean(s, axis=-1, keepdims=True)
+    elif method.lower() == "polynomial":
+        # the scaled Vandermonde matrix of `t` is factorized once, as in
+        # `np.polyfit`, and its pseudo-inverse is applied to all rows
+        lhs = np.vander(t, degree + 1)
+        scale = np.sqrt((lhs * lhs).sum(axis=0))
+        pinv = np.linalg.pinv(lhs / scale, rcond=len(t) * np.finfo(float).eps)
+        coeffs = np.einsum("ij,kj->ik", pinv, s) / scale[:, np.newaxis]
+        # evaluated by Horner's scheme for all rows at once
+        baselines = np.repeat(coeffs[0][:, np.newaxis], len(time), axis=1)
+        for coeff in coeffs[1:]:
+            baselines *= time
+            baselines += coeff[:, np.newaxis]
+        return baselines
+    raise ValueError(f"Unknown baseline correction method '{method}'.")
 
 
 def baseline_correction(
@@ -217,6 +741,7 @@ def baseline_correction(
     selection = "piezo",
     active = False,
     deviation = 0.05,
+    mask = None,
 ):
     """Perform polynomial/offset baseline correction on the given signal.
 
@@ -231,24 +756,21 @@ def baseline_correction(
         method - `baseline` can subtract a fitted polynomial of
                  desired degree OR subtract the mean
         degree - if method is 'poly', the degree of the polynomial
+        mask - boolean array of the samples selected by the piezo voltage,
+               e.g. from `PiezoMasks.mask`, replaces the piezo selection
     Returns:
         original signal less the fitted baseline"""
 
-    if selection.lower() == "intervals":
-        t, s = interval_selection(time, signal, intervals, sampling_rate)
-    elif selection.lower() == "piezo":
-        t, s = piezo_selection(time, piezo, signal, active, deviation)
-    else:
-        t = time
-        s = signal
-
-    if method.lower() == "offset":
-        offset = np.mean(s)
-        output = signal - offset
-    elif method.lower() == "polynomial":
-        coeffs = np.polyfit(t, s, degree)
-        baseline = np.zeros_like(time)
-        for i in range(degree + 1):
-            baseline += coeffs[i] * (time ** (degree - i))
-        output = signal - baseline
-    return output
+    return baseline_correction_series(
+        np.asarray(signal)[np.newaxis],
+        None if piezo is None else np.asarray(piezo)[np.newaxis],
+        time,
+        sampling_rate,
+        intervals,
+        degree,
+        method,
+        selection,
+        active,
+        deviation,
+        None if mask is None else [mask],
+    )[0]
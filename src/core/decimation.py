@@ -0,0 +1,166 @@
+import logging
+
+import numpy as np
+
+
+debug_logger = logging.getLogger("ascam.debug")
+
+# number of bins of a level of a `MinMaxPyramid` combined into one bin of
+# the next level
+PYRAMID_FACTOR = 4
+# number of columns of the image of a `SeriesOverview`
+OVERVIEW_COLUMNS = 1024
+
+
+class MinMaxPyramid:
+    """Minimum and maximum of a signal in bins of increasing size.
+
+    Level `k` holds the extrema of bins of `PYRAMID_FACTOR ** k` samples,
+    level 0 is the signal itself. Drawing the extrema of each bin as a
+    vertical line gives the same picture as drawing all samples of the bin,
+    so a plot that is `n_pixels` wide needs only the level whose bins are
+    about one pixel wide."""
+
+    def __init__(self, time, data, factor=PYRAMID_FACTOR):
+        """Parameters:
+            time [1D array] - the uniformly spaced time points of the samples
+            data [1D array] - the signal
+            factor [int] - the number of bins combined at each level"""
+
+        self.time = time
+        self.data = data
+        self.factor = factor
+        self.mins = [data]
+        self.maxs = [data]
+        while len(self.mins[-1]) > factor:
+            starts = np.arange(0, len(self.mins[-1]), factor)
+            self.mins.append(np.minimum.reduceat(self.mins[-1], starts))
+            self.maxs.append(np.maximum.reduceat(self.maxs[-1], starts))
+
+    def __repr__(self):
+        return f"MinMaxPyramid({len(self.data)} samples, {len(self.mins)} levels)"
+
+    @property
+    def nbytes(self):
+        return sum(m.nbytes for m in self.mins[1:] + self.maxs[1:])
+
+    @property
+    def n_levels(self):
+        return len(self.mins)
+
+    def level(self, n_samples, n_pixels):
+        """Return the coarsest level with at least `n_pixels` bins in
+        `n_samples` samples."""
+        level = 0
+        while (
+            level + 1 < self.n_levels
+            and n_samples / self.factor ** (level + 1) >= n_pixels
+        ):
+            level += 1
+        return level
+
+    def envelope(self, t_start=None, t_stop=None, n_pixels=1000):
+        """Return the points to plot for the signal between two times.
+
+        Parameters:
+            t_start, t_stop [float] - the time range, defaults to the whole
+                signal
+            n_pixels [int] - the width of the plot in pixels
+        Returns:
+            time [1D array] - the time points
+            data [1D array] - the samples if the range holds no more than
+                about `n_pixels` samples, otherwise the minimum and maximum
+                of each bin, both at the start time of the bin
+        The first and the last sample are always included so that the plot
+        has the bounds of the whole signal, e.g. for auto ranging."""
+
+        start = 0 if t_start is None else np.searchsorted(self.time, t_start)
+        stop = len(self.data) if t_stop is None else np.searchsorted(self.time, t_stop)
+        level = self.level(stop - start, max(int(n_pixels), 1))
+        size = self.factor ** level
+        # whole bins that cover the range and one more on each side so that
+        # the line continues to the edges of the plot
+        first = max(start // size - 1, 0)
+        last = min(-(-stop // size) + 1, len(self.mins[level]))
+        if last <= first:
+            first, last = 0, len(self.mins[level])
+        if level == 0:
+            time, data = self.time[first:last], self.data[first:last]
+        else:
+            time = np.repeat(self.time[first * size : last * size : size], 2)
+            data = np.empty(time.size)
+            data[0::2] = self.mins[level][first:last]
+            data[1::2] = self.maxs[level][first:last]
+        # the samples at the ends of the signal if they are outside the range
+        head = slice(0, 1 if first > 0 else 0)
+        tail = slice(len(self.data) - (1 if last * size < len(self.data) else 0), None)
+        if head.stop or tail.start < len(self.data):
+            time = np.concatenate([self.time[head], time, self.time[tail]])
+            data = np.concatenate([self.data[head], data, self.data[tail]])
+        return time, data
+
+
+class SeriesOverview:
+    """Image of all episodes of a series, one row per episode.
+
+    Every row holds the mean current of the episode in `n_columns` bins of
+    (nearly) equal length. The image is computed once from the full traces
+    and is small enough to be drawn for tens of thousands of episodes."""
+
+    def __init__(self, series, n_columns=OVERVIEW_COLUMNS, executor=None):
+        """Parameters:
+            series [Series] - the data
+            n_columns [int] - the number of bins per episode, at most the
+                number of samples
+            executor [SeriesExecutor] - used to decimate series that are
+                held in memory"""
+
+        self.series = series
+        n_columns = max(min(n_columns, series.n_samples), 1)
+        if executor is not None and not series.is_lazy:
+            image = executor.map_rows(
+                decimate_rows, [series.trace], out_width=n_columns, n_columns=n_columns
+            )
+        else:
+            # lazy series are read one episode at a time
+            image = np.empty((len(series), n_columns))
+            for position in range(len(series)):
+                image[position] = decimate_rows(
+                    series.row("trace", position)[np.newaxis], n_columns
+                )
+        self.image = image.astype(np.float32)
+        debug_logger.debug(f"created overview of {self.image.shape}")
+
+    def __repr__(self):
+        return f"SeriesOverview({self.image.shape[0]} x {self.image.shape[1]})"
+
+    @property
+    def nbytes(self):
+        return self.image.nbytes
+
+    @property
+    def n_columns(self):
+        return self.image.shape[1]
+
+    @property
+    def time_range(self):
+        """The first and the last time point of the episodes."""
+        time = self.series.time
+        if not time.size:
+            return 0.0, 1.0
+        return time[0], time[-1]
+
+    def episode(self, row):
+        """Return the number of the episode shown in a row, None if there is
+        no such row."""
+        if not 0 <= row < len(self.series):
+            return None
+        return int(self.series.n_episodes[row])
+
+
+def decimate_rows(block, n_columns):
+    """Mean of each row of a 2D block in `n_columns` bins of (nearly) equal
+    size."""
+    edges = np.linspace(0, block.shape[1], n_columns + 1).astype(int)
+    sums = np.add.reduceat(block, edges[:-1], axis=1)
+    return sums / np.diff(edges)
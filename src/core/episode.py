@@ -1,54 +1,29 @@
 import numpy as np
 
 
-from ..utils import piezo_selection
-from ..constants import CURRENT_UNIT_FACTORS, VOLTAGE_UNIT_FACTORS, TIME_UNIT_FACTORS
-from .filtering import gaussian_filter, ChungKennedyFilter
-from .analysis import baseline_correction, detect_first_activation, Idealizer
+from .filtering import gaussian_filter, VectorizedChungKennedyFilter
+from .analysis import (
+    baseline_correction,
+    detect_first_activation,
+    episode_rng,
+    Idealizer,
+)
+from .events import RLEIdealization
 
 
 class Episode:
-    def __init__(
-        self,
-        time,
-        trace,
-        n_episode=0,
-        piezo=None,
-        command=None,
-        sampling_rate=4e4,
-        input_time_unit="s",
-        input_trace_unit="A",
-        input_piezo_unit="V",
-        input_command_unit="V",
-    ):
-        """Episode objects hold all the information about an epoch and
-        should be used to store raw and manipulated data
+    def __init__(self, series, index, n_episode=0):
+        """Episode objects are views into one row of a `Series`, they hold
+        the results of analyses of that episode and give access to its data.
 
         Parameters:
-            time [1D array of floats] - containing time (in seconds)
-            trace [1D array of floats] - containing the current
-                                                trace
-            piezo [1D array of floats] - the voltage applied to the
-                                         Piezo device
-            command [1D array of floats] - voltage applied to
-                                                  cell
+            series [Series] - the series whose data this episode views
+            index [int] - the row of the episode in the arrays of the series
             n_episode [int] - the number of measurements on this cell that
-                          came before this one
-            filterType [string] - type of filter used"""
+                          came before this one"""
 
-        # units when given input
-        self.time = time / TIME_UNIT_FACTORS[input_time_unit]
-        self.trace = trace / CURRENT_UNIT_FACTORS[input_trace_unit]
-        self._id_time = time / TIME_UNIT_FACTORS[input_time_unit]
-
-        if piezo is not None:
-            self.piezo = piezo / VOLTAGE_UNIT_FACTORS[input_piezo_unit]
-        else:
-            self.piezo = None
-        if command is not None:
-            self.command = command / VOLTAGE_UNIT_FACTORS[input_command_unit]
-        else:
-            self.command = None
+        self._series = series
+        self._index = index
 
         # results of analyses
         self.first_activation = None
@@ -58,6 +33,64 @@ class Episode:
         # metadata about the episode
         self.n_episode = int(n_episode)
 
+    @property
+    def idealization(self):
+        """The idealization as an `RLEIdealization`, use `np.asarray` to
+        get the idealized trace."""
+        return self._idealization
+
+    @idealization.setter
+    def idealization(self, value):
+        if value is not None and not isinstance(value, RLEIdealization):
+            value = RLEIdealization.from_dense(value)
+        self._idealization = value
+        self._series.idealized[self._index] = value is not None
+
+    @property
+    def id_time(self):
+        """The time vector of the idealization, it is held by the
+        idealization."""
+        if self._idealization is None:
+            return None
+        return self._idealization.time
+
+    @id_time.setter
+    def id_time(self, value):
+        if self._idealization is not None:
+            self._idealization.time = value
+
+    @property
+    def time(self):
+        return self._series.time
+
+    @property
+    def trace(self):
+        return self._series.row("trace", self._index)
+
+    @trace.setter
+    def trace(self, value):
+        self._series.writable("trace")[self._index] = value
+
+    @property
+    def piezo(self):
+        return self._series.row("piezo", self._index)
+
+    @piezo.setter
+    def piezo(self, value):
+        self._series.writable("piezo")[self._index] = value
+
+    @property
+    def command(self):
+        return self._series.row("command", self._index)
+
+    @command.setter
+    def command(self, value):
+        self._series.writable("command")[self._index] = value
+
+    @property
+    def sampling_rate(self):
+        return self._series.sampling_rate
+
     @property
     def first_activation_amplitude(self):
         if self.first_activation is None:
@@ -67,8 +100,18 @@ class Episode:
         return self.trace[np.argmin(np.abs(self.time - self.first_activation))]
 
     def idealize(
-        self, amplitudes, thresholds=None, resolution=None, interpolation_factor=1
+        self,
+        amplitudes,
+        thresholds=None,
+        resolution=None,
+        interpolation_factor=1,
+        seed=None,
+        spline=None,
+        refinement=None,
     ):
+        """Idealize the trace, `spline` is the `ChunkedSpline` of the trace
+        used if it is interpolated, it is computed if not given. See
+        `Idealizer.idealize_episode`."""
         self.idealization, self.id_time = Idealizer.idealize_episode(
             self.trace,
             self.time,
@@ -76,6 +119,9 @@ class Episode:
             thresholds,
             resolution,
             interpolation_factor,
+            episode_rng(seed, self.n_episode),
+            spline,
+            refinement,
         )
 
     def gauss_filter_episode(self, filter_frequency=1e3, sampling_rate=4e4):
@@ -98,7 +144,7 @@ class Episode:
     ):
         """Replace the current _trace by the CK fitered version of itself."""
 
-        ck_filter = ChungKennedyFilter(
+        ck_filter = VectorizedChungKennedyFilter(
             window_lengths,
             weight_exponent,
             weight_window,
@@ -119,6 +165,9 @@ class Episode:
     ):
         """Apply a baseline correction to the episode."""
 
+        mask = None
+        if selection.lower() == "piezo":
+            mask = self._series.piezo_masks.mask(self._index, active, deviation)
         self.trace = baseline_correction(
             time=self.time,
             signal=self.trace,
@@ -130,14 +179,15 @@ class Episode:
             selection=selection,
             active=active,
             deviation=deviation,
+            mask=mask,
         )
 
     def check_standarddeviation_all(self, stdthreshold=5e-13):
         """Check the standard deviation of the episode against a reference
         value."""
 
-        _, trace = piezo_selection(
-            self.time, self.piezo, self.trace, active=False, deviation=0.01
+        trace = self._series.piezo_masks.select(
+            self._index, self.trace, active=False, deviation=0.01
         )
         tracestd = np.std(trace)
         if tracestd > stdthreshold:
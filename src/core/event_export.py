@@ -0,0 +1,250 @@
+import os
+import json
+import logging
+
+import numpy as np
+
+from .events import EventTable, EVENT_DTYPE
+from ..constants import PRECISIONS
+
+
+debug_logger = logging.getLogger("ascam.debug")
+
+# number of episodes whose events are written at once
+EXPORT_CHUNK_EPISODES = 64
+# the formats events can be exported to by their file extension
+EVENT_FORMATS = {
+    ".csv": "csv",
+    ".parquet": "parquet",
+    ".feather": "feather",
+    ".events": "binary",
+}
+# parameters that are only written to the header of CSV files when they are
+# set, files without them keep the header of earlier versions
+CSV_OPTIONAL_PARAMETERS = ("refinement",)
+
+
+def event_columns(time_unit="us", trace_unit="pA"):
+    """The names of the columns of exported events."""
+    return [
+        "Episode Number",
+        f"Amplitude [{trace_unit}]",
+        f"Duration [{time_unit}]",
+        f"t_start [{time_unit}]",
+        f"t_stop [{time_unit}]",
+    ]
+
+
+def event_format(filepath):
+    """Return the format of an event file from its extension, None if the
+    extension is not known."""
+    return EVENT_FORMATS.get(os.path.splitext(filepath)[1].lower())
+
+
+def event_writer(filepath, time_unit="us", trace_unit="pA", parameters=None):
+    """Return the writer for the format given by the extension of
+    `filepath`, files without a known extension are written as CSV with
+    '.csv' appended to their name."""
+    writers = {
+        "csv": CSVEventWriter,
+        "parquet": ArrowEventWriter,
+        "feather": ArrowEventWriter,
+        "binary": BinaryEventWriter,
+    }
+    format = event_format(filepath)
+    if format is None:
+        format = "csv"
+        filepath += ".csv"
+    return writers[format](filepath, time_unit, trace_unit, parameters)
+
+
+class EventWriter:
+    """Write the events of a series to a file one `EventTable` at a time, so
+    that only the events of the table being written are held in memory.
+
+    Writers are context managers, the file is complete once they are
+    closed."""
+
+    def __init__(self, filepath, time_unit="us", trace_unit="pA", parameters=None):
+        """Parameters:
+            filepath [str] - the file to write
+            time_unit [str] - the unit of durations and times
+            trace_unit [str] - the unit of amplitudes
+            parameters [dict] - the parameters of the idealization, stored in
+                the header or the metadata of the file"""
+
+        self.filepath = filepath
+        self.time_unit = time_unit
+        self.trace_unit = trace_unit
+        self.parameters = dict() if parameters is None else parameters
+        self.n_events = 0
+
+    def __repr__(self):
+        return f"{type(self).__name__}('{self.filepath}', {self.n_events} events)"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, table):
+        self._write(table)
+        self.n_events += len(table)
+
+    def _write(self, table):
+        raise NotImplementedError
+
+    def close(self):
+        debug_logger.debug(f"wrote {self.n_events} events to {self.filepath}")
+
+
+class CSVEventWriter(EventWriter):
+    """Events as CSV, laid out like a `pandas.DataFrame.to_csv` of the table
+    with the parameters in the first line. Numbers are rounded to the
+    precision of their unit as in `round_off_tables`.
+
+    The first line is written as by earlier versions of ASCAM, e.g.
+    `amplitudes = [ 0.e+00 -1.e-12] [A];resolution = None [s]`, i.e. lists
+    are written as numpy arrays and units follow the values."""
+
+    def __init__(self, filepath, time_unit="us", trace_unit="pA", parameters=None):
+        super().__init__(filepath, time_unit, trace_unit, parameters)
+        self.file = open(filepath, "w")
+        self.file.write(self.header(self.parameters) + "\n")
+        self.file.write("," + ",".join(event_columns(time_unit, trace_unit)) + "\n")
+        # the index of the rows and the episode number are integers
+        self.fmt = ",".join(
+            ["%d", "%d"]
+            + [
+                f"%.{PRECISIONS[unit]}f"
+                for unit in (trace_unit, time_unit, time_unit, time_unit)
+            ]
+        )
+
+    @staticmethod
+    def header(parameters):
+        """Return the first line of the file for a dict of parameters whose
+        keys may end in their unit, e.g. 'resolution [s]'."""
+        fields = []
+        for key, value in parameters.items():
+            if key in CSV_OPTIONAL_PARAMETERS and value is None:
+                continue
+            name, _, unit = key.partition(" [")
+            if isinstance(value, list):
+                value = np.asarray(value)
+            fields.append(f"{name} = {value}" + (f" [{unit}" if unit else ""))
+        return ";".join(fields)
+
+    def _write(self, table):
+        array = np.empty((len(table), 6))
+        array[:, 0] = np.arange(self.n_events, self.n_events + len(table))
+        array[:, 1:] = table.to_array(self.time_unit, self.trace_unit)
+        # formatting Python floats is faster than `np.savetxt`
+        fmt = self.fmt + "\n"
+        self.file.write("".join([fmt % tuple(row) for row in array.tolist()]))
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+class ArrowEventWriter(EventWriter):
+    """Events as Parquet or Feather (Arrow IPC) file, each table is written
+    as one row group or record batch. Requires pyarrow."""
+
+    def __init__(self, filepath, time_unit="us", trace_unit="pA", parameters=None):
+        super().__init__(filepath, time_unit, trace_unit, parameters)
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError(
+                "Exporting events to Parquet or Feather requires pyarrow."
+            )
+        self.pyarrow = pyarrow
+        columns = event_columns(time_unit, trace_unit)
+        self.schema = pyarrow.schema(
+            [(columns[0], pyarrow.int32())]
+            + [(name, pyarrow.float64()) for name in columns[1:]],
+            metadata={"parameters": json.dumps(self.parameters, default=str)},
+        )
+        if event_format(filepath) == "parquet":
+            import pyarrow.parquet
+
+            self.writer = pyarrow.parquet.ParquetWriter(filepath, self.schema)
+        else:
+            import pyarrow.ipc
+
+            self.writer = pyarrow.ipc.new_file(filepath, self.schema)
+
+    def _write(self, table):
+        array = table.to_array(self.time_unit, self.trace_unit)
+        columns = [table.episode] + [array[:, i] for i in range(1, 5)]
+        self.writer.write_table(
+            self.pyarrow.Table.from_arrays(columns, schema=self.schema)
+        )
+
+    def close(self):
+        self.writer.close()
+        super().close()
+
+
+class BinaryEventWriter(EventWriter):
+    """Events as the raw records of `EVENT_DTYPE`, with a JSON sidecar
+    (`filepath + '.json'`) holding the amplitudes of the levels, the time
+    vector and the parameters. The units are not used, the records hold
+    level codes and sample indices, refined crossings are not kept. Read
+    with `read_events`."""
+
+    def __init__(self, filepath, time_unit="us", trace_unit="pA", parameters=None):
+        super().__init__(filepath, time_unit, trace_unit, parameters)
+        self.file = open(filepath, "wb")
+        self.amplitudes = None
+        self.time = None
+
+    def _write(self, table):
+        if self.amplitudes is None:
+            self.amplitudes = table.amplitudes
+            self.time = table.time
+        table.records.astype(EVENT_DTYPE, copy=False).tofile(self.file)
+
+    def close(self):
+        self.file.close()
+        time = np.zeros(0) if self.time is None else self.time
+        sidecar = dict(
+            dtype=[list(field) for field in EVENT_DTYPE.descr],
+            n_events=self.n_events,
+            amplitudes=[] if self.amplitudes is None else self.amplitudes.tolist(),
+            time_start=float(time[0]) if time.size else 0.0,
+            sampling_interval=float(time[1] - time[0]) if time.size > 1 else 0.0,
+            n_samples=int(time.size),
+            parameters=self.parameters,
+        )
+        with open(self.filepath + ".json", "w") as file:
+            json.dump(sidecar, file, indent=2, default=str)
+        super().close()
+
+
+def read_events(filepath, mmap_mode=None):
+    """Read the `EventTable` written by a `BinaryEventWriter`.
+
+    Parameters:
+        filepath [str] - the file of the records
+        mmap_mode [str] - if given the records are memory mapped with this
+            mode instead of read into memory, see `np.memmap`
+    Returns:
+        events [EventTable]"""
+    with open(filepath + ".json") as file:
+        sidecar = json.load(file)
+    dtype = np.dtype([tuple(field) for field in sidecar["dtype"]])
+    if mmap_mode is None:
+        records = np.fromfile(filepath, dtype=dtype)
+    elif sidecar["n_events"]:
+        records = np.memmap(filepath, dtype=dtype, mode=mmap_mode)
+    else:
+        records = np.zeros(0, dtype=dtype)
+    time = (
+        sidecar["time_start"]
+        + np.arange(sidecar["n_samples"]) * sidecar["sampling_interval"]
+    )
+    return EventTable(records, sidecar["amplitudes"], time)
@@ -0,0 +1,357 @@
+import logging
+
+import numpy as np
+
+from ..constants import CURRENT_UNIT_FACTORS, TIME_UNIT_FACTORS
+
+
+debug_logger = logging.getLogger("ascam.debug")
+
+# one record per event, `start_idx` and `stop_idx` are the indices of the
+# first and the last sample of the event in the (interpolated) time vector
+EVENT_DTYPE = np.dtype(
+    [
+        ("episode", np.int32),
+        ("level", np.int8),
+        ("start_idx", np.int64),
+        ("stop_idx", np.int64),
+    ]
+)
+
+
+class EventTable:
+    """Table of the events in idealized episodes.
+
+    The events are stored as records of `EVENT_DTYPE`, amplitudes, times and
+    durations are computed from the level codes and sample indices when they
+    are requested. If the crossings of the idealization were refined between
+    samples the times and durations are computed from the refined `bounds`
+    instead, an event then starts at its refined crossing and stops one
+    sampling interval before the refined crossing of the next event."""
+
+    def __init__(self, records, amplitudes, time, bounds=None):
+        """Parameters:
+            records [array of EVENT_DTYPE] - the events
+            amplitudes [1D array] - the amplitude of each level, i.e. sorted
+                in descending order (see `Idealizer.level_amplitudes`)
+            time [1D array] - the time vector of the idealizations
+            bounds [2D float array] - the position in samples where each
+                event starts and where the next one starts, None if the
+                events start at whole samples"""
+
+        self.records = records
+        self.amplitudes = np.asarray(amplitudes, dtype=float)
+        self.time = time
+        self.bounds = bounds
+
+    @classmethod
+    def from_levels(cls, levels, amplitudes, time, n_episode=0):
+        """Create the table of a single idealized episode.
+
+        Parameters:
+            levels [1D int array] - level code of every sample
+            amplitudes [1D array] - the amplitude of each level
+            time [1D array] - the time vector of the idealization
+            n_episode [int] - number of the episode"""
+
+        starts = np.flatnonzero(levels[1:] != levels[:-1]) + 1
+        records = np.empty(starts.size + 1, dtype=EVENT_DTYPE)
+        records["episode"] = n_episode
+        records["start_idx"][0] = 0
+        records["start_idx"][1:] = starts
+        records["stop_idx"][:-1] = starts - 1
+        records["stop_idx"][-1] = len(levels) - 1
+        records["level"] = levels[records["start_idx"]]
+        return cls(records, amplitudes, time)
+
+    @classmethod
+    def from_idealization(cls, idealization, amplitudes, time, n_episode=0):
+        """Create the table of an episode from its idealized trace."""
+
+        amplitudes = np.asarray(amplitudes, dtype=float)
+        if isinstance(idealization, RLEIdealization) and np.array_equal(
+            amplitudes, idealization.amplitudes
+        ):
+            # the runs are the events
+            return cls(
+                idealization.records(n_episode), amplitudes, time, idealization.bounds
+            )
+        levels = np.argmin(
+            np.abs(idealization[:, np.newaxis] - amplitudes[np.newaxis]), axis=1
+        ).astype(np.int8)
+        return cls.from_levels(levels, amplitudes, time, n_episode)
+
+    @classmethod
+    def concatenate(cls, tables, amplitudes=None, time=None):
+        """Join the tables of several episodes into one table, the records
+        are copied once into a single preallocated array."""
+
+        if amplitudes is None:
+            amplitudes = tables[0].amplitudes
+        if time is None:
+            time = tables[0].time
+        records = np.empty(sum(len(t) for t in tables), dtype=EVENT_DTYPE)
+        refined = any(table.bounds is not None for table in tables)
+        bounds = np.empty((len(records), 2)) if refined else None
+        position = 0
+        for table in tables:
+            records[position : position + len(table)] = table.records
+            if refined:
+                bounds[position : position + len(table)] = table.sample_bounds
+            position += len(table)
+        return cls(records, amplitudes, time, bounds)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        """Select events with a slice, indices or a boolean mask."""
+        return EventTable(
+            self.records[index],
+            self.amplitudes,
+            self.time,
+            None if self.bounds is None else self.bounds[index],
+        )
+
+    def __repr__(self):
+        return f"EventTable({len(self)} events)"
+
+    @property
+    def episode(self):
+        return self.records["episode"]
+
+    @property
+    def level(self):
+        return self.records["level"]
+
+    @property
+    def start_idx(self):
+        return self.records["start_idx"]
+
+    @property
+    def stop_idx(self):
+        return self.records["stop_idx"]
+
+    @property
+    def n_samples(self):
+        return self.records["stop_idx"] - self.records["start_idx"] + 1
+
+    @property
+    def sampling_interval(self):
+        return self.time[1] - self.time[0]
+
+    @property
+    def sample_bounds(self):
+        """The position in samples where each event starts and where the
+        next one starts, refined if the crossings were refined."""
+        if self.bounds is not None:
+            return self.bounds
+        return np.column_stack(
+            [self.records["start_idx"], self.records["stop_idx"] + 1]
+        ).astype(float)
+
+    @property
+    def amplitude(self):
+        return self.amplitudes[self.records["level"]]
+
+    @property
+    def duration(self):
+        if self.bounds is not None:
+            return (self.bounds[:, 1] - self.bounds[:, 0]) * self.sampling_interval
+        return self.n_samples * self.sampling_interval
+
+    @property
+    def t_start(self):
+        if self.bounds is not None:
+            return self.time[0] + self.bounds[:, 0] * self.sampling_interval
+        return self.time[self.records["start_idx"]]
+
+    @property
+    def t_stop(self):
+        if self.bounds is not None:
+            return self.time[0] + (self.bounds[:, 1] - 1) * self.sampling_interval
+        return self.time[self.records["stop_idx"]]
+
+    def to_array(self, time_unit="s", trace_unit="A"):
+        """Return the events as a float array with the episode number,
+        amplitude, duration, start and stop time in its columns."""
+
+        time_factor = TIME_UNIT_FACTORS[time_unit]
+        array = np.empty((len(self), 5))
+        array[:, 0] = self.episode
+        array[:, 1] = self.amplitude * CURRENT_UNIT_FACTORS[trace_unit]
+        array[:, 2] = self.duration * time_factor
+        array[:, 3] = self.t_start * time_factor
+        array[:, 4] = self.t_stop * time_factor
+        return array
+
+
+class RLEIdealization(np.lib.mixins.NDArrayOperatorsMixin):
+    """Idealization of an episode stored as runs of constant level.
+
+    Only the level code and the first sample of every run are kept, the
+    idealized trace is rendered when it is needed. It behaves like the
+    dense array in numpy functions and arithmetic (`np.asarray`, `* 1e12`,
+    slicing), the events of the episode are its runs."""
+
+    def __init__(
+        self, levels, starts, n_samples, amplitudes, time=None, crossings=None
+    ):
+        """Parameters:
+            levels [1D int array] - the level code of each run
+            starts [1D int array] - the index of the first sample of each
+                run, the first run starts at 0
+            n_samples [int] - the length of the idealized trace
+            amplitudes [1D array] - the amplitude of each level, i.e. sorted
+                in descending order (see `Idealizer.level_amplitudes`)
+            time [1D array] - the time vector of the idealization, usually
+                shared by all episodes of a series
+            crossings [1D float array] - the position in samples where each
+                run starts if the crossings were refined between samples
+                (see `Idealizer.refine_crossings`), else None"""
+
+        self.levels = np.asarray(levels, dtype=np.int8)
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.n_samples = int(n_samples)
+        self.amplitudes = np.asarray(amplitudes, dtype=float)
+        self.time = time
+        self.crossings = crossings
+
+    @classmethod
+    def from_levels(cls, levels, amplitudes, time=None):
+        """Encode the level code of every sample."""
+
+        levels = np.asarray(levels)
+        starts = np.flatnonzero(levels[1:] != levels[:-1]) + 1
+        starts = np.r_[0, starts] if levels.size else starts
+        return cls(levels[starts], starts, levels.size, amplitudes, time)
+
+    @classmethod
+    def from_runs(cls, levels, lengths, amplitudes, time=None):
+        """Encode runs given by their level codes and numbers of samples,
+        neighbouring runs of the same level are joined."""
+
+        levels = np.asarray(levels)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        starts = np.zeros(lengths.size, dtype=np.int64)
+        np.cumsum(lengths[:-1], out=starts[1:])
+        keep = np.r_[True, levels[1:] != levels[:-1]][: levels.size]
+        return cls(levels[keep], starts[keep], lengths.sum(), amplitudes, time)
+
+    @classmethod
+    def from_dense(cls, idealization, amplitudes=None, time=None):
+        """Encode an idealized trace, the amplitudes default to its distinct
+        values."""
+
+        idealization = np.asarray(idealization, dtype=float)
+        if amplitudes is None:
+            amplitudes = np.unique(idealization)[::-1]
+        amplitudes = np.asarray(amplitudes, dtype=float)
+        starts = np.flatnonzero(idealization[1:] != idealization[:-1]) + 1
+        starts = np.r_[0, starts] if idealization.size else starts
+        levels = np.argmin(
+            np.abs(idealization[starts, np.newaxis] - amplitudes[np.newaxis]), axis=1
+        )
+        # neighbouring runs can have the same nearest amplitude
+        keep = np.r_[True, levels[1:] != levels[:-1]][: levels.size]
+        return cls(levels[keep], starts[keep], idealization.size, amplitudes, time)
+
+    def __repr__(self):
+        return f"RLEIdealization({self.n_runs} runs, {self.n_samples} samples)"
+
+    def __len__(self):
+        return self.n_samples
+
+    @property
+    def shape(self):
+        return (self.n_samples,)
+
+    @property
+    def size(self):
+        return self.n_samples
+
+    @property
+    def n_runs(self):
+        return self.levels.size
+
+    @property
+    def nbytes(self):
+        nbytes = self.levels.nbytes + self.starts.nbytes
+        if self.crossings is not None:
+            nbytes += self.crossings.nbytes
+        return nbytes
+
+    @property
+    def stops(self):
+        """The index after the last sample of each run."""
+        return np.r_[self.starts[1:], self.n_samples]
+
+    @property
+    def lengths(self):
+        return self.stops - self.starts
+
+    @property
+    def values(self):
+        """The amplitude of each run."""
+        return self.amplitudes[self.levels]
+
+    def dense(self, start=0, stop=None):
+        """Render the idealized trace between two samples."""
+        start, stop, _ = slice(start, stop).indices(self.n_samples)
+        if stop <= start:
+            return np.zeros(0)
+        first = np.searchsorted(self.starts, start, side="right") - 1
+        last = np.searchsorted(self.starts, stop, side="left")
+        lengths = np.minimum(self.stops[first:last], stop) - np.maximum(
+            self.starts[first:last], start
+        )
+        return np.repeat(self.values[first:last], lengths)
+
+    def __array__(self, dtype=None, copy=None):
+        array = self.dense()
+        return array if dtype is None else array.astype(dtype)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        inputs = [
+            x.dense() if isinstance(x, RLEIdealization) else x for x in inputs
+        ]
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice) and index.step in (None, 1):
+            return self.dense(index.start, index.stop)
+        return self.dense()[index]
+
+    def records(self, n_episode=0):
+        """Return the runs as records of `EVENT_DTYPE`."""
+        records = np.empty(self.n_runs, dtype=EVENT_DTYPE)
+        records["episode"] = n_episode
+        records["level"] = self.levels
+        records["start_idx"] = self.starts
+        records["stop_idx"] = self.stops - 1
+        return records
+
+    @property
+    def bounds(self):
+        """The refined position in samples where each run starts and where
+        the next one starts, None if the crossings were not refined."""
+        if self.crossings is None:
+            return None
+        return np.column_stack(
+            [self.crossings, np.r_[self.crossings[1:], self.n_samples]]
+        )
+
+    def event_table(self, n_episode=0):
+        """Return the `EventTable` of the episode."""
+        return EventTable(
+            self.records(n_episode), self.amplitudes, self.time, self.bounds
+        )
+
+    def outline(self):
+        """Return the points of a line through the first and the last sample
+        of every run, which draws the same picture as the whole trace with
+        two points per run."""
+        time = np.empty(2 * self.n_runs)
+        time[0::2] = self.time[self.starts]
+        time[1::2] = self.time[self.stops - 1]
+        return time, np.repeat(self.values, 2)
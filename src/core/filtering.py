@@ -1,6 +1,15 @@
 import logging
 
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import fftconvolve, oaconvolve
+
+
+# windows with at most this many taps are applied by direct convolution
+DIRECT_MAX_TAPS = 16
+# from this many samples per episode on longer windows are applied with
+# overlap-add instead of a single FFT over the whole episode
+OVERLAP_ADD_MIN_SAMPLES = 2 ** 18
 
 
 def apply_filter(signal, window):
@@ -62,6 +71,57 @@ def gaussian_filter(signal, filter_frequency, sampling_rate=4e4):
     return output
 
 
+def select_convolution_method(n_taps, n_samples):
+    """Choose the convolution backend for a window of `n_taps` coefficients
+    applied to episodes of `n_samples` samples."""
+
+    if n_taps <= DIRECT_MAX_TAPS:
+        return "direct"
+    elif n_samples >= OVERLAP_ADD_MIN_SAMPLES:
+        return "overlap-add"
+    return "fft"
+
+
+def apply_filter_series(signals, window, method="auto"):
+    """Apply a filter window to every row of a 2D block of signals at once.
+
+    The block is padded with the values at its edges, as in `apply_filter`,
+    and all rows are convolved with the window in a single call.
+    Parameters:
+        signals [2D array] - one signal per row
+        window [1D array] - filter coefficients, of odd length
+        method [string] - 'direct', 'fft', 'overlap-add' or 'auto' to choose
+            based on the length of the window
+    Returns:
+        output [2D array] - the filtered signals, same shape as the input"""
+
+    signals = np.atleast_2d(signals)
+    if method == "auto":
+        method = select_convolution_method(len(window), signals.shape[1])
+
+    pad_length = int((len(window) - 1) / 2)  # `len(window)` is always odd
+    padded = np.pad(signals, ((0, 0), (pad_length, pad_length)), mode="edge")
+    if method == "direct":
+        # the windows of the padded block are views, so this is a single
+        # matrix-vector product without copying the data
+        output = sliding_window_view(padded, len(window), axis=1) @ window[::-1]
+    elif method == "fft":
+        output = fftconvolve(padded, window[np.newaxis], mode="valid", axes=1)
+    elif method == "overlap-add":
+        output = oaconvolve(padded, window[np.newaxis], mode="valid", axes=1)
+    else:
+        raise ValueError(f"Unknown convolution method '{method}'.")
+    return output
+
+
+def gaussian_filter_series(signals, filter_frequency, sampling_rate=4e4, method="auto"):
+    """Apply a gaussian filter to every row of a 2D block of signals, the
+    window is calculated only once for the whole block."""
+
+    window = gaussian_window(filter_frequency, sampling_rate)
+    return apply_filter_series(signals, window, method)
+
+
 class ChungKennedyFilter:
     """Create a "Chung-Kennedy" filter as described in
 	https://doi.org/10.1016/0165-0270(91)90118-J"""
@@ -316,3 +376,182 @@ class ChungKennedyFilter:
         filtered = forward_w * forward_p + backward_w * backward_p
         filtered = np.sum(filtered, axis=0)
         return filtered
+
+
+def _cumulative_sum(data):
+    """Cumulative sum along the last axis with a leading zero, so that
+    `csum[..., j] - csum[..., i]` is the sum of `data[..., i:j]`."""
+
+    csum = np.zeros(data.shape[:-1] + (data.shape[-1] + 1,))
+    np.cumsum(data, axis=-1, out=csum[..., 1:])
+    return csum
+
+
+def _shifted_cumulative_sum(csum, shift):
+    """Return `csum[..., t + shift]` for every time point t of the data, with
+    the index capped to the valid range of the cumulative sum."""
+
+    len_data = csum.shape[-1] - 1
+    out = np.empty(csum.shape[:-1] + (len_data,))
+    # time points with t + shift below zero, in range, and beyond the end
+    low = min(max(-shift, 0), len_data)
+    high = min(max(len_data + 1 - shift, low), len_data)
+    out[..., :low] = csum[..., :1]
+    out[..., low:high] = csum[..., low + shift : high + shift]
+    out[..., high:] = csum[..., -1:]
+    return out
+
+
+def _window_sums(csum, before, after):
+    """Sum the data over the windows `[t - before, t + after)` for every time
+    point t, windows are cut off at the edges of the data.
+
+    Parameters:
+        csum [array] - cumulative sum of the data from `_cumulative_sum`
+        before [int] - number of points before t at which the window starts,
+            negative values start the window after t
+        after [int] - the window ends `after` points after t, t itself is
+            included if `after > 0`
+    Returns:
+        sums [array] - the window sums, same shape as the data"""
+
+    sums = _shifted_cumulative_sum(csum, after)
+    sums -= _shifted_cumulative_sum(csum, -before)
+    return sums
+
+
+class VectorizedChungKennedyFilter(ChungKennedyFilter):
+    """Chung-Kennedy filter computed from sliding window sums.
+
+    The output is the same as that of `ChungKennedyFilter`, but every
+    prediction and weight is taken as the difference of two cumulative sums
+    instead of adding up shifted copies of the data, so the cost is
+    O(n * n_predictors) regardless of the window lengths and the weight
+    window. All methods work along the last axis, so a 2D block holding one
+    episode per row is filtered in one call."""
+
+    def predict_forward(self, data, window_width):
+        """Calculate the forward prediction, see
+        `ChungKennedyFilter.predict_forward`."""
+
+        # the mean of the `window_width` points before each time point
+        forward_prediction = _window_sums(_cumulative_sum(data), window_width, 0)
+        if self.mode == "increasing":
+            # the first prediction is the first data point and the following
+            # ones are divided by the increasing window widths exactly as in
+            # the loop version
+            forward_prediction[..., 0] = data[..., 0]
+            t = np.arange(data.shape[-1])
+            forward_prediction /= np.minimum(t + 1, window_width)
+        elif self.mode == "padded":
+            forward_prediction /= window_width
+        else:
+            raise ValueError(
+                f"Mode {self.mode} is an unknown method for dealing with edges"
+            )
+        return forward_prediction
+
+    def predict_backward(self, data, window_width):
+        """Calculate the backward prediction, see
+        `ChungKennedyFilter.predict_backward`."""
+
+        csum = _cumulative_sum(data)
+        if self.mode == "increasing":
+            # the loop version sums the next `window_width - 1` points
+            backward_prediction = _window_sums(csum, -1, window_width)
+            backward_prediction[..., -1] = data[..., -1]
+            t = np.arange(data.shape[-1])
+            backward_prediction /= np.minimum(window_width, data.shape[-1] - t)
+        elif self.mode == "padded":
+            backward_prediction = _window_sums(csum, -1, window_width + 1)
+            backward_prediction /= window_width
+        else:
+            raise ValueError(
+                f"Mode {self.mode} is an unknown method for dealing with edges"
+            )
+        return backward_prediction
+
+    def _weights(self, data, predictions, apriori_weights, backward):
+        """Turn the squared prediction errors summed over the weight window
+        into weights, the window trails the time point for forward predictors
+        and leads it for backward predictors."""
+
+        predictions = np.asarray(predictions)
+        if predictions.ndim == np.ndim(data):
+            predictions = predictions[np.newaxis]
+
+        csum = _cumulative_sum((data - predictions) ** 2)
+        if backward:
+            weights = _window_sums(csum, 0, self.weight_window)
+        else:
+            weights = _window_sums(csum, self.weight_window - 1, 1)
+        # see `ChungKennedyFilter.calculate_forward_weights` for why tiny
+        # errors are replaced by 1
+        weights[weights < 1e-20] = 1
+        # raising the reciprocal to a positive power lets numpy use its fast
+        # paths for common exponents such as 1 and 2
+        np.reciprocal(weights, out=weights)
+        weights **= self.weight_exponent
+        apriori_weights = np.asarray(apriori_weights, dtype=float)
+        weights *= apriori_weights.reshape((-1,) + (1,) * (weights.ndim - 1))
+        return weights
+
+    def calculate_forward_weights(self, data, predictions):
+        """Calculate the weights of the forward predictors, see
+        `ChungKennedyFilter.calculate_forward_weights`."""
+
+        return self._weights(data, predictions, self.apriori_f_weights, False)
+
+    def calculate_backward_weights(self, data, predictions):
+        """Calculate the weights of the backward predictors, see
+        `ChungKennedyFilter.calculate_backward_weights`."""
+
+        return self._weights(data, predictions, self.apriori_b_weights, True)
+
+    def apply_filter(self, data):
+        """Apply the Chung Kennedy filter to the given data.
+
+		Parameters:
+			data [1D or 2D array] - data to be filtered, one episode per row
+		Returns:
+			filtered [1D or 2D array] - the filtered version of the data"""
+
+        data = np.asarray(data, dtype=float)
+        forward_p = np.stack(
+            [self.predict_forward(data, window) for window in self.window_lengths]
+        )
+        backward_p = np.stack(
+            [self.predict_backward(data, window) for window in self.window_lengths]
+        )
+
+        forward_w = self.calculate_forward_weights(data, forward_p)
+        backward_w = self.calculate_backward_weights(data, backward_p)
+
+        # normalize the weights to sum to one by dividing by the sum
+        sum_weights = np.sum(forward_w, axis=0) + np.sum(backward_w, axis=0)
+        forward_w /= sum_weights
+        backward_w /= sum_weights
+
+        filtered = forward_w * forward_p + backward_w * backward_p
+        filtered = np.sum(filtered, axis=0)
+        return filtered
+
+
+def ck_filter_series(
+    signals,
+    window_lengths,
+    weight_exponent,
+    weight_window,
+    apriori_f_weights=False,
+    apriori_b_weights=False,
+):
+    """Apply the Chung-Kennedy filter to every row of a 2D block of signals."""
+
+    ck_filter = VectorizedChungKennedyFilter(
+        window_lengths,
+        weight_exponent,
+        weight_window,
+        apriori_f_weights,
+        apriori_b_weights,
+    )
+    return ck_filter.apply_filter(signals)
@@ -0,0 +1,183 @@
+import logging
+import itertools
+
+import numpy as np
+
+from ..utils import LRUCache, interval_selection
+
+
+debug_logger = logging.getLogger("ascam.debug")
+
+# distinguishes the entries of histograms that share a cache
+_histogram_ids = itertools.count()
+
+
+class SeriesHistogram:
+    """Histogram of the current in the episodes of a series.
+
+    The counts of every episode are kept on a bin grid shared by the whole
+    series, the histogram of any set of episodes is the sum of their counts.
+    The first counts are computed with `np.histogram` of each episode. When
+    the bins are changed the selected samples of each episode are sorted
+    and kept in an `LRUCache`, so that counting them for further bins only
+    needs a binary search per bin edge. Series whose samples do not fit into
+    the cache are counted with `np.histogram` every time instead."""
+
+    def __init__(
+        self,
+        series,
+        select_piezo=True,
+        active=True,
+        deviation=0.05,
+        intervals=False,
+        sampling_rate=None,
+        n_bins=50,
+        cache=None,
+    ):
+        """Parameters:
+            series [Series] - the data
+            select_piezo [bool] - use only the samples selected by the piezo
+                voltage, see `PiezoMasks`
+            active [bool] - select the samples where the piezo is active
+            deviation [float] - the deviation used by the piezo selection
+            intervals [list] - use only the samples in these intervals if
+                the piezo is not used, see `interval_selection`
+            sampling_rate [float] - the sampling rate for the intervals
+            n_bins [int] - number of bins
+            cache [LRUCache] - holds the sorted samples of the episodes, it
+                can be shared by several histograms"""
+
+        self.series = series
+        self.select_piezo = select_piezo
+        self.active = active
+        self.deviation = deviation
+        self.intervals = intervals
+        self.sampling_rate = sampling_rate
+        self.cache = LRUCache() if cache is None else cache
+        self._id = next(_histogram_ids)
+
+        n_rows = len(series)
+        self.low = np.full(n_rows, np.inf)
+        self.high = np.full(n_rows, -np.inf)
+        # number of selected samples in each episode
+        self.sizes = np.zeros(n_rows, dtype=np.int64)
+        for position in range(n_rows):
+            samples = self.samples(position)
+            self.sizes[position] = samples.size
+            if samples.size:
+                self.low[position] = samples.min()
+                self.high[position] = samples.max()
+        self.edges = None
+        self.counts = None
+        self.selected = np.ones(n_rows, dtype=bool)
+        self.total = None
+        self._count(n_bins, sort=False)
+
+    def __repr__(self):
+        return (
+            f"SeriesHistogram({len(self.series)} episodes, {self.n_bins} bins, "
+            f"{self.selected.sum()} selected)"
+        )
+
+    @property
+    def n_bins(self):
+        if self.edges is None:
+            return 0
+        return len(self.edges) - 1
+
+    def samples(self, position):
+        """Return the samples of an episode that enter the histogram."""
+        series = self.series
+        trace = series.row("trace", position)
+        if self.select_piezo:
+            return series.piezo_masks.select(
+                position, trace, self.active, self.deviation
+            )
+        if self.intervals:
+            return interval_selection(
+                series.time, trace, self.intervals, self.sampling_rate
+            )[1]
+        return trace
+
+    @property
+    def fits_cache(self):
+        """Whether the sorted samples of all episodes fit into the cache."""
+        if self.cache.max_bytes is None:
+            return True
+        return 8 * self.sizes.sum() <= self.cache.max_bytes
+
+    def count(self, position, edges, sort=True):
+        """Count the samples of an episode in the bins with the given edges,
+        if `sort` is true the samples are sorted and cached for the next
+        time."""
+        key = (self._id, position)
+        samples = self.cache.get(key)
+        if samples is not None:
+            return bin_sorted(samples, edges)
+        samples = self.samples(position)
+        if not sort:
+            return np.histogram(samples, edges)[0]
+        samples = np.sort(samples)
+        self.cache.put(key, samples)
+        return bin_sorted(samples, edges)
+
+    def rebin(self, n_bins):
+        """Count the samples of every episode on a new grid of `n_bins`
+        bins spanning the range of the whole series."""
+        self._count(n_bins, sort=self.fits_cache)
+
+    def _count(self, n_bins, sort):
+        debug_logger.debug(f"counting the samples of the series in {n_bins} bins")
+        low, high = self.low.min(initial=np.inf), self.high.max(initial=-np.inf)
+        if low > high:
+            low, high = 0, 1
+        # same edges as `np.histogram` of the samples of the whole series
+        self.edges = np.histogram_bin_edges([], n_bins, range=(low, high))
+        self.counts = np.empty((len(self.series), n_bins), dtype=np.int64)
+        for position in range(len(self.series)):
+            self.counts[position] = self.count(position, self.edges, sort)
+        self.total = self.counts[self.selected].sum(axis=0)
+
+    def add(self, positions):
+        """Add the counts of the episodes in the given rows to the
+        histogram."""
+        positions = np.unique(np.asarray(positions, dtype=int))
+        positions = positions[~self.selected[positions]]
+        self.total += self.counts[positions].sum(axis=0)
+        self.selected[positions] = True
+
+    def subtract(self, positions):
+        """Remove the counts of the episodes in the given rows from the
+        histogram."""
+        positions = np.unique(np.asarray(positions, dtype=int))
+        positions = positions[self.selected[positions]]
+        self.total -= self.counts[positions].sum(axis=0)
+        self.selected[positions] = False
+
+    def select(self, positions=None):
+        """Make the histogram that of the episodes in the given rows, or of
+        all episodes if `positions` is None."""
+        selected = np.zeros_like(self.selected)
+        if positions is None:
+            selected[:] = True
+        else:
+            selected[np.asarray(positions, dtype=int)] = True
+        self.add(np.flatnonzero(selected & ~self.selected))
+        self.subtract(np.flatnonzero(~selected & self.selected))
+
+    def histogram(self, density=False):
+        """Return the heights and the edges of the bins of the histogram of
+        the selected episodes."""
+        heights = self.total.copy()
+        if density:
+            heights = heights / np.diff(self.edges) / heights.sum()
+        return heights, self.edges
+
+
+def bin_sorted(samples, edges):
+    """Count sorted samples in bins like `np.histogram`, all bins but the
+    last are half open and the last one includes its right edge."""
+    indices = np.empty(len(edges), dtype=np.int64)
+    indices[:-1] = np.searchsorted(samples, edges[:-1], side="left")
+    indices[-1] = np.searchsorted(samples, edges[-1], side="right")
+    return np.diff(indices)
@@ -1,9 +1,20 @@
 import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 
-from .analysis import Idealizer
-from ..constants import CURRENT_UNIT_FACTORS, TIME_UNIT_FACTORS
-from ..utils import round_off_tables
+from .analysis import Idealizer, interpolation_time, check_refinement
+from .events import EventTable
+from .event_export import event_writer, EXPORT_CHUNK_EPISODES
+from .parallel import SeriesExecutor
+from ..constants import (
+    CURRENT_UNIT_FACTORS,
+    TIME_UNIT_FACTORS,
+    BACKGROUND_CHUNK_EPISODES,
+    SPLINE_CACHE_BYTES,
+)
 
 
 debug_logger = logging.getLogger("ascam.debug")
@@ -18,6 +29,8 @@ class IdealizationCache:
         thresholds=None,
         resolution=None,
         interpolation_factor=None,
+        seed=None,
+        refinement=None,
     ):
         self.data = data
 
@@ -25,124 +38,307 @@ class IdealizationCache:
         self.thresholds = thresholds
         self.resolution = resolution
         self.interpolation_factor = interpolation_factor
+        # seed of the coin flips of the resolution, every episode draws from
+        # its own generator so idealizations can be reproduced one by one
+        if seed is None:
+            seed = data.idealization_seed
+        self.seed = seed
+        # how the crossings are placed between samples, see
+        # `Idealizer.refine_crossings`, the event tables and dwell times use
+        # the refined crossings
+        check_refinement(refinement, interpolation_factor)
+        self.refinement = refinement
+        # `BackgroundIdealization` of the current series, if one was started
+        self.worker = None
+        # time vectors of the idealizations keyed by the id of the time
+        # vector of the series, see `id_time`
+        self._id_times = dict()
+        self.activate()
+
+    @property
+    def key(self):
+        """The parameters as a hashable tuple, together with the datakey and
+        the number of an episode they identify its idealization in the
+        `idealization_store` of the recording."""
+        return idealization_key(**self.parameters)
+
+    def activate(self):
+        """Make the episodes of the current series hold the idealizations
+        with the parameters of this cache, taking those that were computed
+        before from the store of the recording. The other series are brought
+        up to date when they become the current series."""
+        key = self.key
+        self.data.active_idealization = key
+        datakey = self.data.current_datakey
+        if datakey not in self.data or self.data.idealization_keys.get(datakey) == key:
+            return
+        debug_logger.debug(
+            f"activating idealization with {self.parameters} on series {datakey}"
+        )
+        store = self.data.idealization_store
+        series = self.data.series
+        id_time = self.id_time(series)
+        for episode in series:
+            idealization = store.get((datakey, episode.n_episode) + key)
+            episode.idealization = idealization
+            episode.id_time = None if idealization is None else id_time
+        self.data.idealization_keys[datakey] = key
+
+    def _store(self, episode):
+        self.data.idealization_store.put(
+            (self.data.current_datakey, episode.n_episode) + self.key,
+            episode.idealization,
+        )
+
+    def id_time(self, series=None):
+        """Return the time vector of the idealizations of a series, the
+        episodes of a series share one array."""
+        if series is None:
+            series = self.data.series
+        time = series.time
+        cached = self._id_times.get(id(time))
+        if cached is None or cached[0] is not time:
+            cached = (time, interpolation_time(time, self.interpolation_factor))
+            self._id_times[id(time)] = cached
+        return cached[1]
+
+    @property
+    def parameters(self):
+        """The parameters of the idealization as a dict."""
+        return dict(
+            amplitudes=self.amplitudes,
+            thresholds=self.thresholds,
+            resolution=self.resolution,
+            interpolation_factor=self.interpolation_factor,
+            seed=self.seed,
+            refinement=self.refinement,
+        )
 
     @property
     def ind_idealized(self):
         """Return the set of numbers of the episodes in the currently selected series
         that have been idealized with the current parameters."""
-        return {
-            episode.n_episode
-            for episode in self.data.series
-            if episode.idealization is not None
-        }
+        series = self.data.series
+        return set(series.n_episodes[series.idealized].tolist())
 
     def idealization(self, n_episode=None):
         """Return the idealization of a given episode or idealize the episode and then return it."""
         if n_episode is None:
             n_episode = self.data.current_ep_ind
-        out = [
-            episode.idealization
-            for episode in self.data.series
-            if episode.n_episode == n_episode
-        ]
-        if out:  # if an idealization exists return it
-            return out[0]
+        episode = self.data.series.episode(n_episode)
+        if episode is not None:  # if an idealization exists return it
+            return episode.idealization
         else:  # else idealize the episode and then return
             self.idealize_episode(n_episode)
-            self.idealization(n_episode)
+            return self.idealization(n_episode)
 
     def time(self, n_episode=None):
         """Return the time vector corresponding to the idealization of the given episode,
         if it is not idealized, idealize it first and then return the time."""
         if n_episode is None:
             n_episode = self.data.current_ep_ind
-        out = [
-            episode.id_time
-            for episode in self.data.series
-            if episode.n_episode == n_episode
-        ]
-        if out:
-            return out[0]
+        episode = self.data.series.episode(n_episode)
+        if episode is not None:
+            return episode.id_time
         else:
             self.idealize_episode(n_episode)
-            self.time(n_episode)
+            return self.time(n_episode)
 
     @property
     def all_ep_inds(self):
-        return {e.n_episode for e in self.data.series}
+        return set(self.data.series.n_episodes.tolist())
 
     def clear_idealization(self):
+        """Remove the idealizations from the episodes, they remain in the
+        store of the recording."""
         for series in self.data.values():
-            for episode in [
-                episode for episode in series if episode.idealization is not None
-            ]:
-                episode.idealization = None
-                episode.id_time = None
+            for position in np.flatnonzero(series.idealized):
+                series[position].idealization = None
+                series[position].id_time = None
+        self.data.active_idealization = None
+        self.data.idealization_keys.clear()
+
+    def start_background(self, progress=None):
+        """Start idealizing the episodes of the current series that are not
+        idealized yet in a background thread.
+
+        The results are moved into the episodes by `collect`, which has to be
+        called from the thread that uses the recording, e.g. from a timer in
+        the GUI. Episodes that are requested with `idealize_episode` before
+        the worker reaches them are idealized right away.
+        Parameters:
+            progress [function] - called as `progress(n_done, n_total)` from
+                the worker thread after each chunk of episodes
+        Returns:
+            worker [BackgroundIdealization]"""
+        self.activate()
+        self.cancel_background()
+        self.worker = BackgroundIdealization(self, progress=progress)
+        return self.worker
+
+    def cancel_background(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker = None
+
+    def collect(self):
+        """Move the idealizations finished in the background into the
+        episodes, returns the number of episodes that were updated."""
+        if self.worker is None:
+            return 0
+        return self.worker.collect()
 
     def idealize_episode(self, n_episode=None):
+        self.activate()
         if n_episode is None:
             n_episode = self.data.current_ep_ind
-        if n_episode not in self.ind_idealized:
+        self.collect()
+        if not self.data.series.idealized[self.data.series.position(n_episode)]:
             debug_logger.debug(
                 f"idealizing episode {n_episode} of "
                 f"series {self.data.current_datakey}"
             )
-            self.data.episode(n_episode).idealize(
+            episode = self.data.episode(n_episode)
+            # the spline only depends on the trace, changing the thresholds
+            # or amplitudes reuses it
+            spline = None
+            if self.interpolation_factor != 1:
+                spline = self.data.episode_spline(n_episode)
+            episode.idealize(
                 self.amplitudes,
                 self.thresholds,
                 self.resolution,
                 self.interpolation_factor,
+                self.seed,
+                spline,
+                self.refinement,
             )
+            episode.id_time = self.id_time()
+            self._store(episode)
+            if self.worker is not None:
+                self.worker.discard(n_episode)
 
         else:
             debug_logger.debug(f"episode number {n_episode} already idealized")
 
     def idealize_series(self):
         debug_logger.debug(f"idealizing series {self.data.current_datakey}")
-        to_idealize = self.all_ep_inds - self.ind_idealized
-        for i in to_idealize:
-            self.idealize_episode(i)
+        self.activate()
+        # the rest of the series is idealized in parallel rather than by the
+        # single background thread
+        self.collect()
+        if self.worker is not None and self.worker.series is self.data.series:
+            self.cancel_background()
+        self._idealize_rows(np.flatnonzero(~self.data.series.idealized))
 
-    def get_events(self, time_unit="s", trace_unit="A"):
-        if self.all_ep_inds != self.ind_idealized:
+    def _idealize_rows(self, rows):
+        """Idealize the episodes in the given rows of the current series in
+        parallel and store their idealizations."""
+        if not len(rows):
+            return
+        series = self.data.series
+        if self.interpolation_factor in (None, 1):
+            self._idealize_chunk(series, rows)
+            return
+        # the splines of the episodes are cached so that they are reused
+        # when only the thresholds or amplitudes change, the rows are
+        # idealized in chunks whose splines fit into the cache
+        # four coefficients of eight bytes per sample
+        chunk_size = max(1, SPLINE_CACHE_BYTES // (32 * max(series.n_samples, 1)))
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start : start + chunk_size]
+            splines = self.data.episode_splines(series.n_episodes[chunk].tolist())
+            self._idealize_chunk(series, chunk, splines)
+
+    def _idealize_chunk(self, series, rows, splines=None):
+        to_idealize = series.select(rows)
+        row_kwargs = dict(n_episodes=series.n_episodes[rows])
+        if splines is not None:
+            row_kwargs["splines"] = splines
+        idealizations = self.data.executor.map_episodes(
+            Idealizer.idealize_series,
+            [series.trace[rows]],
+            row_kwargs=row_kwargs,
+            time=series.time,
+            amplitudes=self.amplitudes,
+            thresholds=self.thresholds,
+            resolution=self.resolution,
+            interpolation_factor=self.interpolation_factor,
+            seed=self.seed,
+            refinement=self.refinement,
+        )
+        id_time = self.id_time(series)
+        for episode, idealization in zip(to_idealize, idealizations):
+            episode.idealization = idealization
+            episode.id_time = id_time
+            self._store(episode)
+
+    def event_table(self):
+        """Return the `EventTable` of all episodes in the current series,
+        idealizing the series first if necessary."""
+        if not self.data.series.idealized.all():
             self.idealize_series()
-        event_array = np.zeros((0, 5)).astype(object)
-        for episode in self.data.series:
-            # create a column containing the episode number
-            ep_events = Idealizer.extract_events(
-                self.idealization(episode.n_episode), self.time()
+        amplitudes = Idealizer.level_amplitudes(self.amplitudes)
+        tables = [
+            EventTable.from_idealization(
+                episode.idealization, amplitudes, episode.id_time, episode.n_episode
             )
-            episode_number = episode.n_episode * np.ones(len(ep_events[:, 0]))
-            # glue that column to the event
-            ep_events = np.concatenate(
-                (episode_number[:, np.newaxis], ep_events), axis=1
+            for episode in self.data.series
+        ]
+        return EventTable.concatenate(tables)
+
+    def event_tables(self, chunk_size=EXPORT_CHUNK_EPISODES):
+        """Yield the `EventTable`s of the episodes of the current series in
+        chunks of `chunk_size` episodes, each chunk is idealized when it is
+        reached if necessary. Only the events of one chunk are held in
+        memory at a time."""
+        self.activate()
+        self.collect()
+        if self.worker is not None and self.worker.series is self.data.series:
+            self.cancel_background()
+        series = self.data.series
+        amplitudes = Idealizer.level_amplitudes(self.amplitudes)
+        for start in range(0, len(series), chunk_size):
+            rows = np.arange(start, min(start + chunk_size, len(series)))
+            self._idealize_rows(rows[~series.idealized[rows]])
+            yield EventTable.concatenate(
+                [
+                    EventTable.from_idealization(
+                        series[row].idealization,
+                        amplitudes,
+                        series[row].id_time,
+                        series[row].n_episode,
+                    )
+                    for row in rows
+                ]
             )
-            event_array = np.concatenate((event_array, ep_events), axis=0)
-        event_array[:, 1] *= CURRENT_UNIT_FACTORS[trace_unit]
-        event_array[:, 2:] *= TIME_UNIT_FACTORS[time_unit]
-        return event_array
+
+    def get_events(self, time_unit="s", trace_unit="A"):
+        """Return the events of the current series as an array with the
+        episode number, amplitude, duration, start and stop time in its
+        columns."""
+        return self.event_table().to_array(time_unit, trace_unit)
 
     def dwell_time_hist(
         self, amp, n_bins=None, time_unit="ms", log_times=True, root_counts=True
     ):
-        events = self.get_events(time_unit)
+        events = self.event_table()
         debug_logger.debug(f"getting events for amplitude {amp}")
         # np.isclose works best on order of unity (with default tolerances
         # rather than figure out tolerances for e-12 multiply the
         # amp values by the expected units pA
         factor = CURRENT_UNIT_FACTORS["pA"]
-        mask = np.isclose(
-            np.asarray(events[:, 1], dtype=np.float) * factor, amp * factor
-        )
+        levels = np.flatnonzero(np.isclose(events.amplitudes * factor, amp * factor))
         debug_logger.debug(f"multiplied amps by pA, amp={amp*factor}")
-        data = events[:, 2][mask]
+        data = events[np.isin(events.level, levels)].duration
+        data = data * TIME_UNIT_FACTORS[time_unit]
         if log_times:
-            data = np.log10(data.astype(float))
+            data = np.log10(data)
         debug_logger.debug(f"there are {len(data)} events")
         if n_bins is None:
             n_bins = int(self.get_n_bins(data))
         heights, bins = np.histogram(data, n_bins)
-        heights = np.asarray(heights, dtype=np.float)
+        heights = np.asarray(heights, dtype=float)
         if root_counts:
             heights = np.sqrt(heights)
         return heights, bins
@@ -153,34 +349,228 @@ class IdealizationCache:
         std = np.std(data)
         return round(3.49 * std * n ** (1 / 3))
 
-    def export_events(self, filepath, time_unit="us", trace_unit="pA"):
-        """Export a table of events in the current (idealized) series and
-        duration to a csv file."""
-        debug_logger.debug(f"export_events")
-
-        import pandas as pd
-
-        if not filepath.endswith(".csv"):
-            filepath += ".csv"
-        header = [
-            "Episode Number",
-            f"Amplitude [{trace_unit}]",
-            f"Duration [{time_unit}]",
-            f"t_start [{time_unit}]",
-            f"t_stop [{time_unit}]",
-        ]
-        params = (
-            f"amplitudes = {self.amplitudes} [A];"
-            + f"thresholds = {self.thresholds} [A];"
-            + f"resolution = {self.resolution} [s];"
-            + f"interpolation_factor = {self.interpolation_factor}\n"
+    def export_events(
+        self,
+        filepath,
+        time_unit="us",
+        trace_unit="pA",
+        chunk_size=EXPORT_CHUNK_EPISODES,
+    ):
+        """Export a table of the events in the current series to a file,
+        idealizing the episodes that are not idealized yet.
+
+        The events are written chunk by chunk as the episodes are idealized.
+        The format is given by the extension of `filepath`: '.csv',
+        '.parquet' or '.feather' (these two need pyarrow) or '.events' for
+        the raw records (see `BinaryEventWriter`). Other files are written
+        as CSV with '.csv' appended to the name.
+        Returns:
+            the path of the file"""
+        debug_logger.debug(f"export_events to {filepath}")
+
+        parameters = {
+            "amplitudes [A]": np.asarray(self.amplitudes).tolist(),
+            "thresholds [A]": None
+            if self.thresholds is None
+            else np.asarray(self.thresholds).tolist(),
+            "resolution [s]": self.resolution,
+            "interpolation_factor": self.interpolation_factor,
+            "refinement": self.refinement,
+        }
+        with event_writer(filepath, time_unit, trace_unit, parameters) as writer:
+            for table in self.event_tables(chunk_size):
+                writer.write(table)
+        return writer.filepath
+
+
+class BackgroundIdealization:
+    """Idealize the episodes of a series in a background thread.
+
+    The episodes are idealized in chunks of `BACKGROUND_CHUNK_EPISODES`, the
+    results are kept by the worker until `collect` moves them into the
+    episodes so that the recording is only modified by the thread that uses
+    it. The worker stops when it is cancelled or when other idealization
+    parameters are activated on the recording."""
+
+    def __init__(self, cache, datakey=None, chunk_size=BACKGROUND_CHUNK_EPISODES,
+                 progress=None):
+        """Parameters:
+            cache [IdealizationCache] - the parameters of the idealization
+            datakey [string] - the series to idealize, defaults to the
+                current one
+            chunk_size [int] - number of episodes idealized at once
+            progress [function] - called as `progress(n_done, n_total)` from
+                the worker thread after each chunk"""
+
+        self.cache = cache
+        self.key = cache.key
+        if datakey is None:
+            datakey = cache.data.current_datakey
+        self.datakey = datakey
+        self.series = cache.data[datakey]
+        self.chunk_size = chunk_size
+        self.progress_callback = progress
+
+        self._pending = deque(
+            self.series.n_episodes[~self.series.idealized].tolist()
+        )
+        self._results = dict()
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self.n_total = len(self._pending)
+        self.n_done = 0
+        debug_logger.debug(
+            f"idealizing {self.n_total} episodes of series {datakey} "
+            f"in the background"
+        )
+        self._pool = ThreadPoolExecutor(max_workers=1)
+        self._future = self._pool.submit(self._run)
+        self._pool.shutdown(wait=False)
+
+    def __repr__(self):
+        return (
+            f"BackgroundIdealization({self.datakey}, "
+            f"{self.n_done}/{self.n_total} episodes)"
         )
-        export_array = self.get_events(time_unit, trace_unit)
-        export_array = pd.DataFrame(export_array, columns=header)
-        # truncate floats for duration and timestamps to 1 micro second
-        export_array = round_off_tables(
-            export_array, ["int", trace_unit, time_unit, time_unit, time_unit]
+
+    @property
+    def progress(self):
+        """Fraction of the episodes that have been idealized."""
+        if not self.n_total:
+            return 1.0
+        return self.n_done / self.n_total
+
+    @property
+    def done(self):
+        return self._future.done()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Stop after the current chunk, results that were not collected yet
+        are discarded."""
+        debug_logger.debug(f"cancelling {self}")
+        self._cancelled.set()
+        with self._lock:
+            self._pending.clear()
+            self._results.clear()
+
+    def prioritize(self, n_episodes):
+        """Move episodes to the front of the queue."""
+        with self._lock:
+            for n_episode in reversed(list(np.atleast_1d(n_episodes))):
+                try:
+                    self._pending.remove(n_episode)
+                except ValueError:
+                    continue
+                self._pending.appendleft(n_episode)
+
+    def discard(self, n_episode):
+        """Remove an episode that was idealized in the foreground from the
+        queue."""
+        with self._lock:
+            try:
+                self._pending.remove(n_episode)
+            except ValueError:
+                return
+            self.n_done += 1
+
+    def wait(self, timeout=None):
+        """Block until all episodes are idealized or the worker stopped."""
+        self._future.result(timeout)
+
+    def _is_active(self):
+        data = self.cache.data
+        return (
+            not self._cancelled.is_set()
+            and data.active_idealization == self.key
+            and data.get(self.datakey) is self.series
         )
-        with open(filepath, "w") as f:
-            f.write(params)
-        export_array.to_csv(filepath, mode="a")
+
+    def _run(self):
+        series = self.series
+        while True:
+            with self._lock:
+                if not self._is_active() or not self._pending:
+                    break
+                chunk = [
+                    self._pending.popleft()
+                    for _ in range(min(self.chunk_size, len(self._pending)))
+                ]
+            # rows are read one by one so that lazy series are not decoded
+            # as a whole
+            signals = np.stack(
+                [series.row("trace", series.position(n)) for n in chunk]
+            )
+            splines = None
+            if self.cache.interpolation_factor not in (None, 1):
+                # the splines are fitted in this thread and cached for
+                # other parameters
+                splines = self.cache.data.episode_splines(
+                    chunk, self.datakey, SeriesExecutor()
+                )
+            idealizations = Idealizer.idealize_series(
+                signals,
+                series.time,
+                self.cache.amplitudes,
+                self.cache.thresholds,
+                self.cache.resolution,
+                self.cache.interpolation_factor,
+                seed=self.cache.seed,
+                n_episodes=chunk,
+                refinement=self.cache.refinement,
+                splines=splines,
+            )
+            with self._lock:
+                if self._cancelled.is_set():
+                    break
+                self._results.update(zip(chunk, idealizations))
+                self.n_done += len(chunk)
+                n_done = self.n_done
+            if self.progress_callback is not None:
+                self.progress_callback(n_done, self.n_total)
+        debug_logger.debug(f"background idealization stopped: {self}")
+
+    def collect(self):
+        """Move the finished idealizations into the episodes and the store of
+        the recording and return their number, results are dropped if the
+        parameters or the series changed in the meantime."""
+        with self._lock:
+            results, self._results = self._results, dict()
+        if not results or not self._is_active():
+            return 0
+        id_time = self.cache.id_time(self.series)
+        store = self.cache.data.idealization_store
+        n_collected = 0
+        for n_episode, idealization in results.items():
+            position = self.series.position(n_episode)
+            if self.series.idealized[position]:
+                continue
+            episode = self.series[position]
+            episode.idealization = idealization
+            episode.id_time = id_time
+            store.put((self.datakey, n_episode) + self.key, idealization)
+            n_collected += 1
+        return n_collected
+
+
+def idealization_key(
+    amplitudes, thresholds, resolution, interpolation_factor, seed, refinement=None
+):
+    """Return the parameters of an idealization as a hashable tuple."""
+    return (
+        _as_tuple(amplitudes),
+        _as_tuple(thresholds),
+        resolution,
+        interpolation_factor,
+        seed,
+        refinement,
+    )
+
+
+def _as_tuple(array):
+    if array is None:
+        return None
+    return tuple(np.asarray(array, dtype=float).ravel().tolist())
@@ -0,0 +1,283 @@
+import os
+import json
+import logging
+import zipfile
+
+import numpy as np
+
+from .events import EventTable
+from .event_export import BinaryEventWriter
+from ..constants import CURRENT_UNIT_FACTORS, TIME_UNIT_FACTORS
+
+
+debug_logger = logging.getLogger("ascam.debug")
+
+# number of time points written at once to CSV files
+CSV_CHUNK_SAMPLES = 4096
+# the formats idealizations can be exported to by their file extension
+IDEALIZATION_FORMATS = {
+    ".csv": "csv",
+    ".npy": "npy",
+    ".npz": "npz",
+    ".h5": "hdf5",
+    ".hdf5": "hdf5",
+    ".rle": "rle",
+}
+
+
+def idealization_format(filepath):
+    """Return the format of an idealization file from its extension, None
+    if the extension is not known."""
+    return IDEALIZATION_FORMATS.get(os.path.splitext(filepath)[1].lower())
+
+
+def idealization_writer(filepath, time, episodes, **kwargs):
+    """Return the writer for the format given by the extension of
+    `filepath`, files without a known extension are written as CSV with
+    '.csv' appended to their name. The keyword arguments are passed to the
+    writer, see `IdealizationWriter`."""
+    writers = {
+        "csv": CSVIdealizationWriter,
+        "npy": NpyIdealizationWriter,
+        "npz": NpzIdealizationWriter,
+        "hdf5": HDF5IdealizationWriter,
+        "rle": RLEIdealizationWriter,
+    }
+    format = idealization_format(filepath)
+    if format is None:
+        format = "csv"
+        filepath += ".csv"
+    return writers[format](filepath, time, episodes, **kwargs)
+
+
+class IdealizationWriter:
+    """Write the idealizations of the episodes of a series to a file one
+    episode at a time.
+
+    The dense formats hold a matrix with one row per episode of the
+    idealized current in `trace_unit`, the time vector is stored with it in
+    `time_unit`. Writers are context managers, the file is complete once
+    they are closed."""
+
+    def __init__(
+        self,
+        filepath,
+        time,
+        episodes,
+        time_unit="s",
+        trace_unit="A",
+        amplitudes=None,
+        parameters=None,
+    ):
+        """Parameters:
+            filepath [str] - the file to write
+            time [1D array] - the time vector of the idealizations
+            episodes [list of int] - the numbers of the episodes in the order
+                they will be written
+            time_unit [str] - the unit of the time vector
+            trace_unit [str] - the unit of the idealized current
+            amplitudes [1D array] - the amplitudes of the idealization, in A
+            parameters [dict] - the parameters of the idealization, stored in
+                the header or the metadata of the file"""
+
+        self.filepath = filepath
+        self.time = np.asarray(time)
+        self.episodes = np.asarray(episodes, dtype=np.int64)
+        self.time_unit = time_unit
+        self.trace_unit = trace_unit
+        self.amplitudes = amplitudes
+        self.parameters = dict() if parameters is None else parameters
+        self.time_factor = TIME_UNIT_FACTORS[time_unit]
+        self.trace_factor = CURRENT_UNIT_FACTORS[trace_unit]
+        self.n_written = 0
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}('{self.filepath}', "
+            f"{self.n_written}/{len(self.episodes)} episodes)"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, idealization):
+        """Write the idealization of the next episode."""
+        self._write(idealization)
+        self.n_written += 1
+
+    def _write(self, idealization):
+        raise NotImplementedError
+
+    def close(self):
+        debug_logger.debug(
+            f"wrote the idealization of {self.n_written} episodes to {self.filepath}"
+        )
+
+    @property
+    def header(self):
+        return ";".join(f"{key} = {value}" for key, value in self.parameters.items())
+
+
+class CSVIdealizationWriter(IdealizationWriter):
+    """The time and the idealized episodes as the columns of a CSV file, as
+    written by `np.savetxt`.
+
+    The rows of a CSV file span all episodes, so the writer keeps references
+    to the idealizations (which are held by the episodes anyway) and writes
+    them in blocks of `CSV_CHUNK_SAMPLES` time points when it is closed."""
+
+    def __init__(self, filepath, time, episodes, **kwargs):
+        super().__init__(filepath, time, episodes, **kwargs)
+        self.idealizations = []
+
+    def _write(self, idealization):
+        self.idealizations.append(idealization)
+
+    def close(self):
+        header = (
+            self.header
+            + "\n Time, "
+            + ", ".join(["Episode number " + str(n) for n in self.episodes])
+        )
+        with open(self.filepath, "w") as file:
+            file.write("# " + header.replace("\n", "\n# ") + "\n")
+            for start in range(0, len(self.time), CSV_CHUNK_SAMPLES):
+                stop = start + CSV_CHUNK_SAMPLES
+                block = np.empty(
+                    (len(self.time[start:stop]), len(self.idealizations) + 1)
+                )
+                block[:, 0] = self.time[start:stop] * self.time_factor
+                for k, idealization in enumerate(self.idealizations):
+                    block[:, k + 1] = idealization[start:stop] * self.trace_factor
+                np.savetxt(file, block, delimiter=",")
+        self.idealizations = []
+        super().close()
+
+
+class NpyIdealizationWriter(IdealizationWriter):
+    """A `.npy` file of the matrix whose first row is the time vector and
+    whose other rows are the idealized episodes, i.e. the CSV file
+    transposed. The rows are written through a memory map."""
+
+    def __init__(self, filepath, time, episodes, **kwargs):
+        super().__init__(filepath, time, episodes, **kwargs)
+        self.array = np.lib.format.open_memmap(
+            filepath, mode="w+", shape=(len(self.episodes) + 1, len(self.time))
+        )
+        self.array[0] = self.time * self.time_factor
+
+    def _write(self, idealization):
+        self.array[self.n_written + 1] = idealization * self.trace_factor
+
+    def close(self):
+        self.array.flush()
+        del self.array
+        super().close()
+
+
+class NpzIdealizationWriter(IdealizationWriter):
+    """A `.npz` archive with the arrays 'time', 'episodes', 'amplitudes',
+    'parameters' (as a JSON string) and 'idealization', which has one row per
+    episode and is streamed into the archive row by row."""
+
+    def __init__(self, filepath, time, episodes, **kwargs):
+        super().__init__(filepath, time, episodes, **kwargs)
+        self.archive = zipfile.ZipFile(filepath, mode="w", allowZip64=True)
+        self._add("time", self.time * self.time_factor)
+        self._add("episodes", self.episodes)
+        self._add(
+            "amplitudes",
+            np.zeros(0) if self.amplitudes is None else np.asarray(self.amplitudes),
+        )
+        self._add("parameters", np.array(json.dumps(self.parameters, default=str)))
+        # the rows of the idealization are appended to an open member
+        self.member = self.archive.open("idealization.npy", mode="w", force_zip64=True)
+        np.lib.format.write_array_header_1_0(
+            self.member,
+            {
+                "descr": np.lib.format.dtype_to_descr(np.dtype(float)),
+                "fortran_order": False,
+                "shape": (len(self.episodes), len(self.time)),
+            },
+        )
+
+    def _add(self, name, array):
+        with self.archive.open(name + ".npy", mode="w", force_zip64=True) as member:
+            np.lib.format.write_array(member, np.asarray(array))
+
+    def _write(self, idealization):
+        row = np.asarray(idealization, dtype=float) * self.trace_factor
+        self.member.write(row.tobytes())
+
+    def close(self):
+        self.member.close()
+        self.archive.close()
+        super().close()
+
+
+class HDF5IdealizationWriter(IdealizationWriter):
+    """An HDF5 file with the datasets 'time', 'episodes', 'amplitudes' and
+    'idealization' (one compressed chunk per episode), the parameters and
+    units are attributes of the file. Requires h5py."""
+
+    def __init__(self, filepath, time, episodes, **kwargs):
+        super().__init__(filepath, time, episodes, **kwargs)
+        try:
+            import h5py
+        except ImportError:
+            raise ImportError("Exporting idealizations to HDF5 requires h5py.")
+        self.file = h5py.File(filepath, "w")
+        self.file.create_dataset("time", data=self.time * self.time_factor)
+        self.file.create_dataset("episodes", data=self.episodes)
+        if self.amplitudes is not None:
+            self.file.create_dataset("amplitudes", data=np.asarray(self.amplitudes))
+        self.dataset = self.file.create_dataset(
+            "idealization",
+            shape=(len(self.episodes), len(self.time)),
+            dtype=float,
+            chunks=(1, max(len(self.time), 1)),
+            compression="gzip",
+        )
+        self.file.attrs["time_unit"] = self.time_unit
+        self.file.attrs["trace_unit"] = self.trace_unit
+        self.file.attrs["parameters"] = json.dumps(self.parameters, default=str)
+
+    def _write(self, idealization):
+        self.dataset[self.n_written] = idealization * self.trace_factor
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+class RLEIdealizationWriter(IdealizationWriter):
+    """The idealizations run-length encoded as the records of an
+    `EventTable`, i.e. the level code and the first and last sample of every
+    run, with a JSON sidecar holding the amplitudes, the time vector and the
+    parameters, see `BinaryEventWriter`. The units are not used. Read with
+    `read_events`."""
+
+    def __init__(self, filepath, time, episodes, **kwargs):
+        super().__init__(filepath, time, episodes, **kwargs)
+        if self.amplitudes is None:
+            raise ValueError("Run-length encoding needs the amplitudes.")
+        # the amplitudes in the order of the level codes
+        self.levels = np.sort(np.asarray(self.amplitudes, dtype=float))[::-1]
+        self.writer = BinaryEventWriter(filepath, parameters=self.parameters)
+
+    def _write(self, idealization):
+        self.writer.write(
+            EventTable.from_idealization(
+                idealization, self.levels, self.time, self.episodes[self.n_written]
+            )
+        )
+
+    def close(self):
+        if self.writer.amplitudes is None:
+            self.writer.amplitudes = self.levels
+            self.writer.time = self.time
+        self.writer.close()
+        super().close()
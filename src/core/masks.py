@@ -0,0 +1,95 @@
+import logging
+
+import numpy as np
+
+
+debug_logger = logging.getLogger("ascam.debug")
+
+
+class PiezoMasks:
+    """The samples of the episodes of a series that are selected by the
+    piezo voltage, see `piezo_selection`.
+
+    The selection of an episode is computed once for every combination of
+    `active` and `deviation` and stored as the start and stop indices of the
+    runs of selected samples. The piezo voltage is not changed by filtering
+    or baseline correction, so series derived from one another share their
+    masks."""
+
+    def __init__(self, piezo):
+        """Parameters:
+            piezo [2D array or LazyBlock] - the piezo voltage of the series,
+                one episode per row"""
+
+        self.piezo = piezo
+        self._runs = dict()
+
+    def __repr__(self):
+        return f"PiezoMasks({len(self._runs)} selections)"
+
+    def _row(self, position):
+        if isinstance(self.piezo, np.ndarray):
+            return self.piezo[position]
+        return self.piezo.row(position)
+
+    def runs(self, position, active=True, deviation=0.05):
+        """Return the start and stop indices of the runs of samples of an
+        episode that are selected.
+
+        Parameters:
+            position [int] - the row of the episode in the series
+            active [bool] - select the samples where the absolute piezo
+                voltage is within `deviation` (relative) of its maximum,
+                otherwise those where it is below `deviation` of the maximum
+            deviation [float] - the relative deviation
+        Returns:
+            starts [1D int array] - the first sample of each run
+            stops [1D int array] - the sample after the last of each run"""
+
+        return self._get(position, active, deviation)[:2]
+
+    def _get(self, position, active, deviation):
+        key = (int(position), bool(active), float(deviation))
+        runs = self._runs.get(key)
+        if runs is None:
+            mask = selection_mask(self._row(position), active, deviation)
+            runs = mask_runs(mask) + (mask.size,)
+            self._runs[key] = runs
+        return runs
+
+    def mask(self, position, active=True, deviation=0.05):
+        """Return the selected samples of an episode as a boolean array."""
+        starts, stops, n_samples = self._get(position, active, deviation)
+        mask = np.zeros(n_samples, dtype=bool)
+        for start, stop in zip(starts, stops):
+            mask[start:stop] = True
+        return mask
+
+    def select(self, position, array, active=True, deviation=0.05):
+        """Return the selected samples of a row of data, if they form a
+        single run this is a view of `array`."""
+        starts, stops = self.runs(position, active, deviation)
+        if len(starts) == 1:
+            return array[starts[0] : stops[0]]
+        return np.concatenate(
+            [array[start:stop] for start, stop in zip(starts, stops)]
+            or [array[:0]]
+        )
+
+
+def selection_mask(piezo, active=True, deviation=0.05):
+    """Boolean mask of the samples `piezo_selection` selects."""
+    piezo = np.abs(piezo)
+    max_piezo = np.max(piezo, axis=-1, keepdims=True)
+    # without a piezo signal nothing is selected, as in `piezo_selection`
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if active:
+            return (max_piezo - piezo) / max_piezo < deviation
+        return piezo / max_piezo < deviation
+
+
+def mask_runs(mask):
+    """Return the start and stop indices of the runs of True in a boolean
+    array."""
+    edges = np.diff(np.concatenate(([False], mask, [False])).astype(np.int8))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
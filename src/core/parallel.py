@@ -0,0 +1,187 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+debug_logger = logging.getLogger("ascam.debug")
+
+BACKENDS = ("serial", "thread", "process")
+# upper bound on the number of samples per channel handed to one task, this
+# bounds the size of the temporary arrays the operations create
+CHUNK_SAMPLES = 2 ** 22
+
+
+class SeriesExecutor:
+    """Run series-level operations on chunks of episodes.
+
+    The episodes (rows) of a series are split into chunks which are processed
+    one after the other ('serial'), by a pool of threads ('thread') or by a
+    pool of processes ('process'). The process backend hands the blocks of
+    data to the workers through shared memory instead of pickling them.
+    Functions used with the process backend must be defined at the top level
+    of a module so that they can be sent to the workers."""
+
+    def __init__(self, backend="serial", n_workers=None):
+        if backend not in BACKENDS:
+            raise ValueError(
+                f"Unknown backend '{backend}', choose one of {BACKENDS}."
+            )
+        self.backend = backend
+        if n_workers is None:
+            n_workers = os.cpu_count() or 1
+        self.n_workers = 1 if backend == "serial" else int(n_workers)
+
+    def __repr__(self):
+        return f"SeriesExecutor(backend='{self.backend}', n_workers={self.n_workers})"
+
+    def chunks(self, n_rows, n_samples):
+        """Split `n_rows` rows into (start, stop) pairs so that each chunk
+        holds at most `CHUNK_SAMPLES` samples and every worker gets work."""
+
+        rows = max(1, CHUNK_SAMPLES // max(n_samples, 1))
+        rows = min(rows, max(1, -(-n_rows // self.n_workers)))
+        return [(start, min(start + rows, n_rows)) for start in range(0, n_rows, rows)]
+
+    def map_rows(self, func, blocks, out_width=None, row_kwargs=None, **kwargs):
+        """Apply a function that maps rows to rows to chunks of the blocks.
+
+        Parameters:
+            func - called as `func(*chunks, **kwargs)` where `chunks` are the
+                same rows of each block, returns a 2D array with one row per
+                input row
+            blocks [list of 2D arrays or None] - the data, all blocks must
+                have the same number of rows, entries that are None are
+                passed on as None
+            out_width [int] - number of columns of the output, defaults to
+                that of the first block
+            row_kwargs [dict] - keyword arguments with one entry per row,
+                `func` receives the entries of the rows in the chunk
+        Returns:
+            output [2D array] - the rows returned by `func` in order"""
+
+        n_rows, n_samples = np.shape(blocks[0])
+        if out_width is None:
+            out_width = n_samples
+        output = np.empty((n_rows, out_width))
+        self._run(func, blocks, kwargs, row_kwargs, output)
+        return output
+
+    def map_episodes(self, func, blocks, row_kwargs=None, **kwargs):
+        """Apply a function that returns one result per row to chunks of the
+        blocks, see `map_rows`.
+
+        Returns:
+            results [list] - the concatenated lists returned by `func`"""
+
+        results = list()
+        for chunk_results in self._run(func, blocks, kwargs, row_kwargs, None):
+            results.extend(chunk_results)
+        return results
+
+    def _run(self, func, blocks, kwargs, row_kwargs, output):
+        """Run `func` on all chunks with the configured backend, if `output`
+        is given the results are written to it, otherwise the results of the
+        chunks are returned."""
+
+        def chunk_kwargs(start, stop):
+            if not row_kwargs:
+                return kwargs
+            return dict(
+                kwargs, **{key: value[start:stop] for key, value in row_kwargs.items()}
+            )
+
+        n_rows, n_samples = np.shape(blocks[0])
+        chunks = self.chunks(n_rows, n_samples)
+        debug_logger.debug(
+            f"running {getattr(func, '__name__', func)} on {n_rows} episodes "
+            f"in {len(chunks)} chunks with {self}"
+        )
+        if self.backend == "process" and len(chunks) > 1:
+            return self._run_processes(func, blocks, chunk_kwargs, output, chunks)
+
+        def run_chunk(start, stop):
+            result = func(
+                *[None if b is None else b[start:stop] for b in blocks],
+                **chunk_kwargs(start, stop),
+            )
+            if output is not None:
+                output[start:stop] = result
+                return None
+            return result
+
+        if self.backend == "thread" and len(chunks) > 1:
+            with ThreadPoolExecutor(self.n_workers) as pool:
+                return list(pool.map(lambda chunk: run_chunk(*chunk), chunks))
+        return [run_chunk(start, stop) for start, stop in chunks]
+
+    def _run_processes(self, func, blocks, chunk_kwargs, output, chunks):
+        shared = list()
+        try:
+            specs = [None if b is None else _share(np.asarray(b), shared) for b in blocks]
+            out_spec = None if output is None else _share(output, shared)
+            with ProcessPoolExecutor(self.n_workers) as pool:
+                futures = [
+                    pool.submit(
+                        _run_chunk,
+                        func,
+                        specs,
+                        out_spec,
+                        start,
+                        stop,
+                        chunk_kwargs(start, stop),
+                    )
+                    for start, stop in chunks
+                ]
+                results = [future.result() for future in futures]
+            if output is not None:
+                output[:] = _view(out_spec, shared[-1])
+            return results
+        finally:
+            for shm in shared:
+                shm.close()
+                shm.unlink()
+
+
+def _share(array, shared):
+    """Copy an array to a new block of shared memory and return the
+    specification the workers use to attach to it."""
+
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared.append(shm)
+    spec = (shm.name, array.shape, array.dtype.str)
+    _view(spec, shm)[:] = array
+    return spec
+
+
+def _view(spec, shm):
+    _, shape, dtype = spec
+    return np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _run_chunk(func, specs, out_spec, start, stop, kwargs):
+    """Worker side of `SeriesExecutor._run_processes`."""
+
+    handles = list()
+    try:
+        blocks = list()
+        for spec in specs + [out_spec]:
+            if spec is None:
+                blocks.append(None)
+                continue
+            shm = shared_memory.SharedMemory(name=spec[0])
+            handles.append(shm)
+            blocks.append(_view(spec, shm)[start:stop])
+        out = blocks.pop()
+        result = func(*blocks, **kwargs)
+        if out is not None:
+            out[:] = result
+            result = None
+        # drop the views before the shared memory is closed
+        del blocks, out
+        return result
+    finally:
+        for shm in handles:
+            shm.close()
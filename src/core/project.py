@@ -0,0 +1,398 @@
+import os
+import json
+import shutil
+import logging
+
+import numpy as np
+
+from .series import Series
+from .idealization import idealization_key
+from .events import RLEIdealization
+
+
+debug_logger = logging.getLogger("ascam.debug")
+
+# version of the layout of project directories, increased whenever it
+# changes in a way older versions of ASCAM cannot read
+PROJECT_FORMAT_VERSION = 2
+PROJECT_EXTENSION = ".ascam"
+MANIFEST_NAME = "manifest.json"
+# number of episodes written at once when a channel is not held in memory
+WRITE_CHUNK_EPISODES = 64
+
+
+def project_path(filename):
+    """Return the directory of a project given the directory itself or the
+    path of its manifest."""
+    filename = filename.rstrip("/")
+    if os.path.basename(filename) == MANIFEST_NAME:
+        filename = os.path.dirname(filename)
+    return filename
+
+
+def is_project(filename):
+    return project_path(filename).endswith(PROJECT_EXTENSION)
+
+
+def save_project(recording, dirpath, idealization_parameters=None):
+    """Save a recording to a project directory.
+
+    Every channel of every series is stored as one `.npy` file that holds the
+    whole `(n_episodes, n_samples)` block, arrays that are shared between
+    series (e.g. the piezo voltage of a filtered series) are written once.
+    Everything else is stored in a JSON manifest.
+    Parameters:
+        recording [Recording] - the recording to save
+        dirpath [string] - the project directory, `PROJECT_EXTENSION` is
+            appended if it is missing
+        idealization_parameters [dict] - the amplitudes, thresholds,
+            resolution and interpolation factor of the idealizations
+    Returns:
+        dirpath [string] - the directory the project was saved to"""
+
+    dirpath = project_path(dirpath)
+    if not dirpath.endswith(PROJECT_EXTENSION):
+        dirpath += PROJECT_EXTENSION
+    debug_logger.debug(f"saving project to {dirpath}")
+    # the project is written next to the target and moved there when it is
+    # complete, the arrays of the recording may be memory mapped from the
+    # files that are replaced
+    final_dirpath = dirpath
+    dirpath = final_dirpath + ".saving"
+    if os.path.exists(dirpath):
+        shutil.rmtree(dirpath)
+    os.makedirs(dirpath)
+
+    # maps the ids of the arrays that have been written to their files
+    written = dict()
+    manifest = dict(
+        format="ascam-project",
+        version=PROJECT_FORMAT_VERSION,
+        filename=recording.filename,
+        sampling_rate=recording.sampling_rate,
+        current_datakey=recording.current_datakey,
+        current_ep_ind=int(recording.current_ep_ind),
+        lists={
+            name: [[int(i) for i in indices], key]
+            for name, (indices, key) in recording.lists.items()
+        },
+        idealization_parameters=_to_json(idealization_parameters),
+        series=dict(),
+    )
+    # series that hold the idealizations of other parameters than those
+    # saved are saved without idealizations
+    key = None
+    if idealization_parameters is not None and "seed" in idealization_parameters:
+        key = idealization_key(**idealization_parameters)
+    for number, (datakey, series) in enumerate(recording.items()):
+        directory = f"{number:03d}"
+        os.makedirs(os.path.join(dirpath, directory), exist_ok=True)
+        arrays = dict()
+        for channel in ("time", "trace", "piezo", "command"):
+            arrays[channel] = _write_channel(
+                dirpath, directory, series, channel, written
+            )
+        manifest["series"][datakey] = dict(
+            n_episodes=[int(n) for n in series.n_episodes],
+            n_samples=int(series.n_samples),
+            arrays=arrays,
+            first_activation=[
+                None if e.first_activation is None else float(e.first_activation)
+                for e in series
+            ],
+            manual_first_activation=[bool(e.manual_first_activation) for e in series],
+            idealization=_write_idealization(dirpath, directory, series)
+            if key is None or recording.idealization_keys.get(datakey, key) == key
+            else None,
+        )
+    with open(os.path.join(dirpath, MANIFEST_NAME), "w") as file:
+        json.dump(manifest, file, indent=1)
+    if os.path.exists(final_dirpath):
+        # memory mapped files cannot be removed on every platform, the arrays
+        # mapped from the replaced project are read into memory first
+        _release_memmaps(recording, final_dirpath)
+        shutil.rmtree(final_dirpath)
+    os.rename(dirpath, final_dirpath)
+    return final_dirpath
+
+
+def _release_memmaps(recording, dirpath):
+    """Read the arrays of a recording that are memory mapped from the files
+    of a project directory into memory. Arrays shared between series are
+    copied once and stay shared."""
+
+    copies = dict()
+
+    def release(array):
+        if not _is_mapped_from(array, dirpath):
+            return array
+        if id(array) not in copies:
+            copy = np.array(array)
+            copy.flags.writeable = array.flags.writeable
+            copies[id(array)] = copy
+        return copies[id(array)]
+
+    for series in recording.values():
+        series.time = release(series.time)
+        for channel, block in series._blocks.items():
+            series._blocks[channel] = release(block)
+        if getattr(series, "_piezo_masks", None) is not None:
+            series._piezo_masks.piezo = release(series._piezo_masks.piezo)
+        for episode in series:
+            idealization = episode.idealization
+            if idealization is None:
+                continue
+            for name in ("levels", "starts", "amplitudes", "time", "crossings"):
+                setattr(idealization, name, release(getattr(idealization, name)))
+    debug_logger.debug(f"read {len(copies)} memory mapped arrays from {dirpath}")
+
+
+def _is_mapped_from(array, dirpath):
+    """Whether an array is a view of a file in `dirpath`."""
+    dirpath = os.path.abspath(dirpath) + os.sep
+    while isinstance(array, np.ndarray):
+        if isinstance(array, np.memmap) and array.filename is not None:
+            return os.path.abspath(array.filename).startswith(dirpath)
+        array = array.base
+    return False
+
+
+def _write_channel(dirpath, directory, series, channel, written):
+    if channel == "time":
+        source = series.time
+    elif channel in series._lazy:
+        source = series._lazy[channel]
+    else:
+        source = series._blocks[channel]
+    if source is None:
+        return None
+    if id(source) in written:
+        return written[id(source)]
+    filename = f"{directory}/{channel}.npy"
+    path = os.path.join(dirpath, filename)
+    if isinstance(source, np.ndarray):
+        np.save(path, source)
+    else:
+        # lazy channels are written in chunks of episodes so that they need
+        # not be decoded all at once
+        block = np.lib.format.open_memmap(
+            path, mode="w+", dtype=float, shape=(len(series), series.n_samples)
+        )
+        for start in range(0, len(series), WRITE_CHUNK_EPISODES):
+            stop = min(start + WRITE_CHUNK_EPISODES, len(series))
+            for index in range(start, stop):
+                block[index] = series.row(channel, index)
+            block.flush()
+        del block
+    written[id(source)] = filename
+    return filename
+
+
+def _write_idealization(dirpath, directory, series):
+    """Write the idealizations of a series as the concatenated runs of all
+    episodes, see `RLEIdealization`. Until version 1 of the format they
+    were saved as a dense block."""
+    idealized = [e.idealization is not None for e in series]
+    if not any(idealized):
+        return None
+    first = next(e.idealization for e in series if e.idealization is not None)
+    id_time, amplitudes = first.time, first.amplitudes
+    runs = []
+    for episode in series:
+        idealization = episode.idealization
+        if idealization is not None and not np.array_equal(
+            idealization.amplitudes, amplitudes
+        ):
+            idealization = RLEIdealization.from_dense(idealization, amplitudes)
+        runs.append(idealization)
+    offsets = np.zeros(len(series) + 1, dtype=np.int64)
+    np.cumsum([0 if r is None else r.n_runs for r in runs], out=offsets[1:])
+    files = dict()
+    for name, array in (
+        ("levels", np.concatenate([r.levels for r in runs if r is not None])),
+        ("starts", np.concatenate([r.starts for r in runs if r is not None])),
+        ("run_offsets", offsets),
+        ("amplitudes", amplitudes),
+        ("id_time", id_time),
+    ):
+        np.save(os.path.join(dirpath, directory, f"{name}.npy"), array)
+        files[name] = f"{directory}/{name}.npy"
+    if any(r is not None and r.crossings is not None for r in runs):
+        # the refined crossings are optional, runs without them start at
+        # whole samples
+        crossings = np.concatenate(
+            [
+                r.starts.astype(float) if r.crossings is None else r.crossings
+                for r in runs
+                if r is not None
+            ]
+        )
+        np.save(os.path.join(dirpath, directory, "crossings.npy"), crossings)
+        files["crossings"] = f"{directory}/crossings.npy"
+    return dict(idealized=idealized, **files)
+
+
+def _to_json(parameters):
+    if parameters is None:
+        return None
+    return {
+        key: value.tolist() if isinstance(value, np.ndarray) else value
+        for key, value in parameters.items()
+    }
+
+
+def read_manifest(dirpath):
+    with open(os.path.join(project_path(dirpath), MANIFEST_NAME)) as file:
+        manifest = json.load(file)
+    if manifest.get("format") != "ascam-project":
+        raise ValueError(f"{dirpath} is not an ASCAM project.")
+    if manifest["version"] > PROJECT_FORMAT_VERSION:
+        raise ValueError(
+            f"{dirpath} was saved in version {manifest['version']} of the "
+            f"project format, this version of ASCAM reads up to version "
+            f"{PROJECT_FORMAT_VERSION}."
+        )
+    return manifest
+
+
+def load_project(recording, datakeys=None, episodes=None, mmap_mode="r"):
+    """Fill a recording with the series stored in a project directory.
+
+    Parameters:
+        recording [Recording] - recording whose `filename` is the project
+        datakeys [list of strings] - the series to load, defaults to all
+        episodes [slice or tuple] - the rows of the series to load, e.g.
+            `(10, 20)` loads the episodes in rows 10 to 19
+        mmap_mode [string] - passed to `np.load`, with the default 'r' the
+            arrays are read-only views of the files that are copied when
+            they are written to, None reads the arrays into memory
+    Returns:
+        recording - the filled recording"""
+
+    dirpath = project_path(recording.filename)
+    manifest = read_manifest(dirpath)
+    if datakeys is None:
+        datakeys = list(manifest["series"].keys())
+    if episodes is None:
+        episodes = slice(None)
+    elif not isinstance(episodes, slice):
+        episodes = slice(*episodes)
+    debug_logger.debug(
+        f"loading project {dirpath} series {datakeys} episodes {episodes}"
+    )
+
+    # every file is opened once so that arrays that were shared before
+    # saving are shared again
+    loaded = dict()
+
+    def load(filename, rows=True):
+        if filename is None:
+            return None
+        if filename not in loaded:
+            array = np.load(os.path.join(dirpath, filename), mmap_mode=mmap_mode)
+            # plain arrays are passed on unchanged by `Series`, which keeps
+            # them shared
+            loaded[filename] = np.asarray(array[episodes] if rows else array)
+        return loaded[filename]
+
+    recording.clear()
+    recording.sampling_rate = manifest["sampling_rate"]
+    for datakey in datakeys:
+        entry = manifest["series"][datakey]
+        arrays = entry["arrays"]
+        series = Series(
+            load(arrays["time"], rows=False),
+            load(arrays["trace"]),
+            entry["n_episodes"][episodes],
+            load(arrays["piezo"]),
+            load(arrays["command"]),
+            recording.sampling_rate,
+        )
+        first_activation = entry["first_activation"][episodes]
+        manual = entry["manual_first_activation"][episodes]
+        for episode, fa, is_manual in zip(series, first_activation, manual):
+            episode.first_activation = fa
+            episode.manual_first_activation = is_manual
+        idealization = entry["idealization"]
+        if idealization is not None:
+            id_time = load(idealization["id_time"], rows=False)
+            idealized = idealization["idealized"][episodes]
+            if "levels" in idealization:
+                levels = load(idealization["levels"], rows=False)
+                starts = load(idealization["starts"], rows=False)
+                offsets = load(idealization["run_offsets"], rows=False)
+                amplitudes = load(idealization["amplitudes"], rows=False)
+                crossings = None
+                if "crossings" in idealization:
+                    crossings = load(idealization["crossings"], rows=False)
+                rows = range(len(entry["n_episodes"]))[episodes]
+                for episode, row, is_idealized in zip(series, rows, idealized):
+                    if is_idealized:
+                        runs = slice(offsets[row], offsets[row + 1])
+                        episode.idealization = RLEIdealization(
+                            levels[runs],
+                            starts[runs],
+                            len(id_time),
+                            amplitudes,
+                            crossings=None if crossings is None else crossings[runs],
+                        )
+                        episode.id_time = id_time
+            else:
+                block = load(idealization["idealization"])
+                for episode, row, is_idealized in zip(series, block, idealized):
+                    if is_idealized:
+                        episode.idealization = row
+                        episode.id_time = id_time
+        recording[datakey] = series
+
+    # mark the arrays used by several series as shared, see `Series.derive`
+    for datakey in datakeys:
+        arrays = manifest["series"][datakey]["arrays"]
+        for channel in ("time", "piezo", "command"):
+            filename = arrays[channel]
+            uses = sum(
+                filename == manifest["series"][key]["arrays"][channel]
+                for key in datakeys
+            )
+            if filename is not None and uses > 1:
+                loaded[filename].flags.writeable = False
+                recording[datakey]._shared.add(channel)
+    # series with the same piezo voltage share its masks
+    piezo_masks = dict()
+    for datakey in datakeys:
+        filename = manifest["series"][datakey]["arrays"]["piezo"]
+        if filename is not None:
+            recording[datakey]._piezo_masks = piezo_masks.setdefault(
+                filename, recording[datakey].piezo_masks
+            )
+
+    # maps the rows of the saved series to those of the loaded ones
+    rows = range(len(manifest["series"][datakeys[0]]["n_episodes"]))[episodes]
+    new_rows = {row: i for i, row in enumerate(rows)}
+    recording.lists = {
+        name: ([new_rows[i] for i in indices if i in new_rows], key)
+        for name, (indices, key) in manifest["lists"].items()
+    }
+    if manifest["current_datakey"] in recording:
+        recording.current_datakey = manifest["current_datakey"]
+    else:
+        recording.current_datakey = datakeys[0]
+    n_episodes = recording.series.n_episodes
+    if manifest["current_ep_ind"] in n_episodes:
+        recording.current_ep_ind = manifest["current_ep_ind"]
+    elif n_episodes.size:
+        recording.current_ep_ind = int(n_episodes[0])
+    parameters = manifest["idealization_parameters"]
+    recording.idealization_parameters = parameters
+    if parameters is not None and "seed" in parameters:
+        # the saved idealizations are those for the saved parameters
+        key = idealization_key(**parameters)
+        for datakey, series in recording.items():
+            for episode in series.select(np.flatnonzero(series.idealized)):
+                recording.idealization_store.put(
+                    (datakey, episode.n_episode) + key, episode.idealization
+                )
+        recording.idealization_seed = parameters["seed"]
+        recording.active_idealization = key
+        recording.idealization_keys = {datakey: key for datakey in recording}
+    return recording
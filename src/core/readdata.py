@@ -1,16 +1,29 @@
 import csv
+import mmap
 import pickle
 import logging
+import threading
 
 import numpy as np
 import axographio
 from scipy.io import loadmat as scipy_loadmat
-from scipy.io.matlab.mio5 import varmats_from_mat
+from scipy.io.matlab.mio5 import varmats_from_mat, MatFile5Reader
+from scipy.io.matlab.mio5_params import (
+    miCOMPRESSED,
+    miDOUBLE,
+    mxDOUBLE_CLASS,
+)
 
 
 from ..utils.tools import parse_filename
 
 
+debug_logger = logging.getLogger("ascam.debug")
+
+# bit of the array flags that marks complex arrays in `.mat` files
+MAT_COMPLEX_FLAG = 0x0800
+
+
 def load(filename, filetype=False, dtype=None, headerlength=None, fs=None):
     """
     get data form a file
@@ -75,24 +88,18 @@ def load_matlab(filename):
 
     for variable in varmats:
         value = scipy_loadmat(variable[1])[variable[0]]
-        # the first possibility is the name in files we get, the second
-        # comes from the ASCAM data structure
-        if ("Ipatch" in variable[0] 
-                or "Column" in variable[0] 
-                or "trace" in variable[0].lower()
-                or "current" in variable[0].lower()
-            ):
+        channel = matlab_channel(variable[0])
+        if channel == "current":
             current.append(value.flatten())
             try:
                 ep_numbers.append(int(variable[0].split()[-1]))
             except (IndexError, ValueError):
                 pass
-        
-        elif "Vm" in variable[0] or "command" in variable[0].lower():
+        elif channel == "command":
             command_voltage.append(value.flatten())
-        elif "piezo" in variable[0].lower():
+        elif channel == "piezo":
             piezo.append(value.flatten())
-        elif "Time" in variable[0] or "time" in variable[0]:
+        elif channel == "time":
             time = value.flatten()
     if current:
         names.append("Current [A]")
@@ -103,6 +110,180 @@ def load_matlab(filename):
     return names, time, current, piezo, command_voltage, ep_numbers
 
 
+def matlab_channel(name):
+    """Return the channel ('current', 'command', 'piezo' or 'time') a
+    variable in a `.mat` file belongs to, or None."""
+    # the first possibility is the name in files we get, the second
+    # comes from the ASCAM data structure
+    if (
+        "Ipatch" in name
+        or "Column" in name
+        or "trace" in name.lower()
+        or "current" in name.lower()
+    ):
+        return "current"
+    elif "Vm" in name or "command" in name.lower():
+        return "command"
+    elif "piezo" in name.lower():
+        return "piezo"
+    elif "Time" in name or "time" in name:
+        return "time"
+    return None
+
+
+def load_matlab_lazy(filename):
+    """Index a `.mat` file without decoding the episodes.
+
+    Only the time vector is read, the episodes are decoded later through
+    the returned `LazyMatlabFile`.
+    Input:
+        filename [string] - name (including location) of the file to be loaded
+    Output:
+        names [list of strings] - names of the different variables
+        time [1D numpy array] - times of measurement
+        matfile [LazyMatlabFile] - the indexed file
+        current [list of ints] - positions of the current variables
+        piezo [list of ints] - positions of the piezo voltage variables
+        command_voltage [list of ints] - positions of the command voltage
+                                         variables
+        ep_numbers [list of ints] - numbers of the episodes
+    Variables are referred to by their position in the file rather than by
+    their name, because names repeat in files with more than 1000 episodes
+    (see `load_matlab`)."""
+
+    matfile = LazyMatlabFile(filename)
+    current = []
+    command_voltage = []
+    piezo = []
+    names = ["Time [ms]"]
+    ep_numbers = []
+    time = None
+    for position, name in enumerate(matfile.names):
+        channel = matlab_channel(name)
+        if channel == "current":
+            current.append(position)
+            try:
+                ep_numbers.append(int(name.split()[-1]))
+            except (IndexError, ValueError):
+                pass
+        elif channel == "command":
+            command_voltage.append(position)
+        elif channel == "piezo":
+            piezo.append(position)
+        elif channel == "time":
+            time = np.array(matfile.load(position))
+    if current:
+        names.append("Current [A]")
+    if piezo:
+        names.append("Piezo [V]")
+    if command_voltage:
+        names.append("Command Voltage [V]")
+    return names, time, matfile, current, piezo, command_voltage, ep_numbers
+
+
+class LazyMatlabFile:
+    """Index of the variables in a MATLAB (v5) file that are decoded on demand.
+
+    Opening the file only reads the header of every variable to record its
+    name and position. Variables are referred to by their position in the
+    file, names can repeat (see `load_matlab`). They are read when `load`
+    is called: plain
+    double arrays are returned as read-only views of the memory-mapped file
+    without copying, other variables (e.g. compressed ones) are decoded by
+    scipy."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._reader = MatFile5Reader(self._file)
+        self._reader.initialize_read()
+        self._reader.read_file_header()
+        self._byte_order = self._reader.byte_order
+        # the reader keeps the position in the file as state
+        self._lock = threading.Lock()
+        # (name, position of the variable, position of raw double data or
+        # None, number of values) of every variable in the order of the file
+        self.variables = []
+        self._index()
+
+    def __repr__(self):
+        return f"LazyMatlabFile({self.filename}, {len(self.variables)} variables)"
+
+    def __len__(self):
+        return len(self.variables)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    @property
+    def names(self):
+        """The names of the variables in the order of the file."""
+        return [variable[0] for variable in self.variables]
+
+    def _index(self):
+        """Walk the headers of the variables and record their positions."""
+        reader = self._reader
+        position = self._file.tell()
+        while not reader.end_of_stream():
+            start = position
+            # the tag of the variable followed by the tag and the value of
+            # the array flags
+            mdtype, _, _, _, flags = np.frombuffer(
+                self._mmap, dtype=self._byte_order + "u4", count=5, offset=start
+            )
+            header, position = reader.read_var_header()
+            name = "None" if header.name is None else header.name.decode("latin1")
+            data = None
+            count = int(np.prod(header.dims))
+            if (
+                mdtype != miCOMPRESSED
+                and header.mclass == mxDOUBLE_CLASS
+                and not flags & MAT_COMPLEX_FLAG
+            ):
+                data = self._raw_data_offset(self._file.tell(), count)
+            self.variables.append((name, start, data, count))
+            self._file.seek(position)
+        debug_logger.debug(f"indexed {len(self.variables)} variables in {self.filename}")
+
+    def _raw_data_offset(self, offset, count):
+        """Return the position of the values of an uncompressed double array
+        whose data element starts at `offset` or None if the values are not
+        stored as doubles."""
+        mdtype, byte_count = np.frombuffer(
+            self._mmap, dtype=self._byte_order + "u4", count=2, offset=offset
+        )
+        if mdtype >> 16:
+            # small data element format, at most 4 bytes of data
+            return None
+        if mdtype != miDOUBLE or byte_count != 8 * count:
+            return None
+        return offset + 8
+
+    def load(self, index):
+        """Return the values of the variable at position `index` in the file
+        as a flat array."""
+        _, start, data, count = self.variables[index]
+        if data is not None:
+            return np.frombuffer(
+                self._mmap, dtype=self._byte_order + "f8", count=count, offset=data
+            )
+        with self._lock:
+            self._file.seek(start)
+            header, _ = self._reader.read_var_header()
+            value = self._reader.read_var_array(header, process=True)
+        return value.flatten()
+
+    def close(self):
+        try:
+            self._mmap.close()
+        except BufferError:
+            # arrays returned by `load` still view the map, it is closed
+            # once they are gone
+            pass
+        self._file.close()
+
+
 def load_binary(filename, dtype, headerlength, fs):
     """
     Loads data from binary file using the numpy function fromfile,
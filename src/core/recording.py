@@ -1,19 +1,41 @@
-import copy
+import os
 import logging
 import pickle
 
 import numpy as np
 import pandas as pd
 
-from ..constants import CURRENT_UNIT_FACTORS, VOLTAGE_UNIT_FACTORS, TIME_UNIT_FACTORS
+from ..constants import (
+    CURRENT_UNIT_FACTORS,
+    VOLTAGE_UNIT_FACTORS,
+    TIME_UNIT_FACTORS,
+    LAZY_LOADING_FILE_SIZE,
+    EPISODE_CACHE_BYTES,
+    IDEALIZATION_CACHE_BYTES,
+    HISTOGRAM_CACHE_BYTES,
+    OVERVIEW_CACHE_BYTES,
+    SPLINE_CACHE_BYTES,
+)
 from ..utils import (
+    LRUCache,
     parse_filename,
-    piezo_selection,
     interval_selection,
     round_off_tables,
 )
-from .readdata import load_matlab, load_axo
-from .episode import Episode
+from .readdata import load_matlab, load_matlab_lazy, load_axo
+from .filtering import gaussian_filter_series, ck_filter_series
+from .analysis import (
+    baseline_correction_series,
+    detect_first_activation,
+    ChunkedSpline,
+    fit_splines,
+)
+from .parallel import SeriesExecutor
+from .series import Series
+from .histogram import SeriesHistogram
+from .decimation import SeriesOverview, OVERVIEW_COLUMNS
+from .idealization_export import idealization_writer
+from .project import save_project, load_project, project_path
 
 
 ana_logger = logging.getLogger("ascam.analysis")
@@ -30,6 +52,10 @@ class Recording(dict):
         trace_input_unit="A",
         piezo_input_unit="V",
         command_input_unit="V",
+        backend="serial",
+        n_workers=None,
+        lazy=None,
+        memory_budget=EPISODE_CACHE_BYTES,
     ):
         """Load data from a file.
 
@@ -42,6 +68,14 @@ class Recording(dict):
             trace_unit - the unit of electric current in the input
             piezo_unit - the unit of voltage in the piezo data in the input
             command_unit - the units in which the command voltage is given
+            backend - how series operations are run, 'serial', 'thread' or
+                'process'
+            n_workers - number of threads or processes used by the backend
+            lazy - decode the episodes of a `.mat` file only when they are
+                accessed, by default files larger than
+                `LAZY_LOADING_FILE_SIZE` are loaded lazily
+            memory_budget - number of bytes of decoded episodes that are
+                kept in memory when loading lazily
         Returns:
             recording - instance of the Recording class containing the data"""
         ana_logger.info(
@@ -53,18 +87,25 @@ class Recording(dict):
             f"command_input_unit = {command_input_unit}"
         )
 
-        recording = cls(filename, sampling_rate)
+        recording = cls(filename, sampling_rate, backend, n_workers)
 
-        filetype, _, _, _ = parse_filename(filename)
-        if filetype == "pkl":
+        filetype, _, _, _ = parse_filename(project_path(filename))
+        if filetype == "ascam":
+            recording.filename = project_path(filename)
+            return load_project(recording)
+        elif filetype == "pkl":
             recording = cls._load_from_pickle(recording)
         elif filetype == "mat":
+            if lazy is None:
+                lazy = os.path.getsize(filename) > LAZY_LOADING_FILE_SIZE
             recording = cls._load_from_matlab(
                 recording,
                 trace_input_unit=trace_input_unit,
                 piezo_input_unit=piezo_input_unit,
                 command_input_unit=command_input_unit,
                 time_input_unit=time_input_unit,
+                lazy=lazy,
+                memory_budget=memory_budget,
             )
         elif "axg" in filetype:
             recording = cls._load_from_axo(
@@ -81,7 +122,7 @@ class Recording(dict):
 
         return recording
 
-    def __init__(self, filename="", sampling_rate=4e4):
+    def __init__(self, filename="", sampling_rate=4e4, backend="serial", n_workers=None):
         super().__init__()
 
         # parameters for loading the data
@@ -91,9 +132,11 @@ class Recording(dict):
         self.sampling_rate = int(float(sampling_rate))
 
         # attributes for storing and managing the data
-        self["raw_"] = []
+        self["raw_"] = Series(sampling_rate=self.sampling_rate)
         self.current_datakey = "raw_"
         self.current_ep_ind = 0
+        # runs the operations on whole series
+        self.executor = SeriesExecutor(backend, n_workers)
 
         # variables for user created lists of episodes
         # `lists` stores the indices of the episodes in the list in the first
@@ -101,6 +144,61 @@ class Recording(dict):
         # lists[name] = ([inds], key)
         self.lists = dict()
 
+        # parameters of the idealizations stored in the episodes, if they
+        # were saved with the recording
+        self.idealization_parameters = None
+        # idealizations computed with any parameters, keyed by datakey,
+        # episode number and `IdealizationCache.key`
+        self.idealization_store = LRUCache(max_bytes=IDEALIZATION_CACHE_BYTES)
+        # key of the parameters that were activated last
+        self.active_idealization = None
+        # key of the parameters whose idealizations the episodes of each
+        # series hold, by datakey, series are brought up to date when they
+        # become the current series
+        self.idealization_keys = dict()
+        # seed for the random numbers used when idealizing
+        self.idealization_seed = np.random.SeedSequence().entropy
+        # `SeriesHistogram`s keyed by datakey and the selection of samples,
+        # they share one cache for the sorted samples of the episodes
+        self.histograms = dict()
+        self.histogram_cache = LRUCache(max_bytes=HISTOGRAM_CACHE_BYTES)
+        # `SeriesOverview`s keyed by datakey and number of columns
+        self.overviews = LRUCache(max_bytes=OVERVIEW_CACHE_BYTES)
+        # `ChunkedSpline`s of interpolated episodes keyed by datakey and
+        # episode number, they do not depend on the idealization parameters
+        self.splines = LRUCache(max_bytes=SPLINE_CACHE_BYTES)
+
+    def __getstate__(self):
+        # the histograms, overviews and splines are not saved, they are cheap
+        # to recreate
+        state = self.__dict__.copy()
+        state.pop("histograms", None)
+        state.pop("histogram_cache", None)
+        state.pop("overviews", None)
+        state.pop("splines", None)
+        return state
+
+    def __setitem__(self, datakey, series):
+        if datakey in self and hasattr(self, "idealization_store"):
+            # idealizations of a series that is replaced are invalid
+            for key in self.idealization_store.keys():
+                if key[0] == datakey:
+                    self.idealization_store.pop(key)
+        if hasattr(self, "histograms"):
+            for key in list(self.histograms):
+                if key[0] == datakey:
+                    del self.histograms[key]
+        if hasattr(self, "idealization_keys"):
+            self.idealization_keys.pop(datakey, None)
+        for name in ("overviews", "splines"):
+            cache = getattr(self, name, None)
+            if cache is None:
+                continue
+            for key in cache.keys():
+                if key[0] == datakey:
+                    cache.pop(key)
+        super().__setitem__(datakey, series)
+
     def select_episodes(self, datakey=None, lists=None):
         if datakey is None:
             datakey = self.current_datakey
@@ -109,8 +207,8 @@ class Recording(dict):
         indices = list()
         for listname in lists:
             indices.extend(self.lists[listname][0])
-        indices = np.array(list(set(indices)))
-        return np.array(self[datakey])[indices]
+        indices = np.unique(indices).astype(int)
+        return self[datakey].select(indices)
 
     def episodes_in_lists(self, names):
         if isinstance(str, names):
@@ -119,9 +217,9 @@ class Recording(dict):
         for listname in names:
             indices.extend(self.lists[listname][0])
         # remove duplicate indices
-        indices = np.array(list(set(indices)))
+        indices = np.unique(indices).astype(int)
         debug_logger.debug(f"Selected episodes: {indices}")
-        return np.array(self.series)[indices]
+        return self.series.select(indices)
 
     @property
     def series(self):
@@ -130,34 +228,54 @@ class Recording(dict):
     def episode(self, n_episode=None):
         if n_episode is None:
             n_episode = self.current_ep_ind
-        out = [e for e in self.series if e.n_episode == n_episode]
-        if out:
-            return out[0]
-        else:
+        episode = self.series.episode(n_episode)
+        if episode is None:
             debug_logger.warning(
                 f"tried to get episode with index {self.current_ep_ind} but it "
                 "doesn't exist"
             )
+        return episode
 
     def next_episode_ind(self):
-        inds = [e.n_episode for e in self.series]
-        current = np.where(np.array(inds) == self.current_ep_ind)[0]
-        if current + 1 == len(inds):
+        current = self.series.position(self.current_ep_ind)
+        if current + 1 == len(self.series):
             return 0
-        return int(current) + 1
+        return current + 1
+
+    @property
+    def backend(self):
+        return self.executor.backend
+
+    @property
+    def n_workers(self):
+        return self.executor.n_workers
+
+    def set_backend(self, backend="serial", n_workers=None):
+        """Choose how series operations are run, see `SeriesExecutor`."""
+        self.executor = SeriesExecutor(backend, n_workers)
+        debug_logger.debug(f"set executor to {self.executor}")
 
     @property
     def has_command(self):
         if self.series:
-            return True if self.episode().command is not None else False
+            return self.series.has_channel("command")
         return False
 
     @property
     def has_piezo(self):
         if self.series:
-            return True if self.episode().piezo is not None else False
+            return self.series.has_channel("piezo")
         return False
 
+    def _new_datakey(self, operation_key):
+        """Return the datakey for the result of applying an operation to the
+        current series."""
+        if self.current_datakey == "raw_":
+            # if its the first operation drop the 'raw_'
+            return operation_key
+        # if operations have been done before combine the names
+        return self.current_datakey + operation_key
+
     def baseline_correction(
         self,
         intervals=None,
@@ -170,14 +288,8 @@ class Recording(dict):
     ):
         """Apply a baseline correction to the current series."""
 
-        if self.current_datakey == "raw_":
-            # if its the first operation drop the 'raw_'
-            new_datakey = "BC_"
-        else:
-            # if operations have been done before combine the names
-            new_datakey = self.current_datakey + "BC_"
+        new_datakey = self._new_datakey("BC_")
         logging.info(f"new datakey is {new_datakey}")
-        self[new_datakey] = copy.deepcopy(self.series)
         if selection.lower() == "piezo" and not self.has_piezo:
             debug_logger.debug(
                 "selection method was set to 'piezo' but"
@@ -196,16 +308,29 @@ class Recording(dict):
         )
         if intervals is not None:
             intervals = np.array(intervals) / TIME_UNIT_FACTORS[time_unit]
-        for episode in self[new_datakey]:
-            episode.baseline_correct_episode(
-                degree=degree,
-                intervals=intervals,
-                method=method,
-                deviation=deviation,
-                selection=selection,
-                active=active,
-                sampling_rate=self.sampling_rate,
+        row_kwargs = None
+        if selection.lower() == "piezo":
+            # the piezo selection is taken from the masks of the series
+            masks = self.series.piezo_masks
+            row_kwargs = dict(
+                masks=[
+                    masks.mask(i, active, deviation) for i in range(len(self.series))
+                ]
             )
+        corrected = self.executor.map_rows(
+            baseline_correction_series,
+            [self.series.trace],
+            row_kwargs=row_kwargs,
+            time=self.series.time,
+            sampling_rate=self.sampling_rate,
+            intervals=intervals,
+            degree=degree,
+            method=method,
+            selection=selection,
+            active=active,
+            deviation=deviation,
+        )
+        self[new_datakey] = self.series.derive(corrected)
         self.current_datakey = new_datakey
         debug_logger.debug("keys of the recording are now {}".format(self.keys()))
 
@@ -217,16 +342,14 @@ class Recording(dict):
             f"sampling_rate is {self.sampling_rate}"
         )
 
-        fdatakey = f"GFILTER{filter_freq}_"
-        if self.current_datakey == "raw_":
-            # if its the first operation drop the 'raw-'
-            new_datakey = fdatakey
-        else:
-            # if operations have been done before combine the names
-            new_datakey = self.current_datakey + fdatakey
-        self[new_datakey] = copy.deepcopy(self.series)
-        for episode in self[new_datakey]:
-            episode.gauss_filter_episode(filter_freq, self.sampling_rate)
+        new_datakey = self._new_datakey(f"GFILTER{filter_freq}_")
+        filtered = self.executor.map_rows(
+            gaussian_filter_series,
+            [self.series.trace],
+            filter_frequency=filter_freq,
+            sampling_rate=self.sampling_rate,
+        )
+        self[new_datakey] = self.series.derive(filtered)
         self.current_datakey = new_datakey
 
     def CK_filter_series(
@@ -249,33 +372,31 @@ class Recording(dict):
         )
 
         n_filters = len(window_lengths)
-        fdatakey = f"CKFILTER_K{n_filters}p{weight_exponent}M{weight_window}_"
-        if self.current_datakey == "raw_":
-            # if its the first operation drop the 'raw-'
-            new_datakey = fdatakey
-        else:
-            # if operations have been done before combine the names
-            new_datakey = self.current_datakey + fdatakey
-
-        self[new_datakey] = copy.deepcopy(self.series)
-        for episode in self[new_datakey]:
-            episode.CK_filter_episode(
-                window_lengths,
-                weight_exponent,
-                weight_window,
-                apriori_f_weights,
-                apriori_b_weights,
-            )
+        new_datakey = self._new_datakey(
+            f"CKFILTER_K{n_filters}p{weight_exponent}M{weight_window}_"
+        )
+        filtered = self.executor.map_rows(
+            ck_filter_series,
+            [self.series.trace],
+            window_lengths=window_lengths,
+            weight_exponent=weight_exponent,
+            weight_window=weight_window,
+            apriori_f_weights=apriori_f_weights,
+            apriori_b_weights=apriori_b_weights,
+        )
+        self[new_datakey] = self.series.derive(filtered)
         self.current_datakey = new_datakey
 
     def detect_fa(self, threshold):
         """Apply first event detection to all episodes in the selected series"""
 
-        [
-            episode.detect_first_activation(threshold)
-            for episode in self.series
-            if not episode.manual_first_activation
-        ]
+        # the detection is a single pass over the whole block
+        first_activations = detect_first_activation(
+            self.series.time, self.series.trace, threshold
+        )
+        for episode, first_activation in zip(self.series, first_activations):
+            if not episode.manual_first_activation:
+                episode.first_activation = first_activation
 
     def series_hist(
         self,
@@ -285,46 +406,116 @@ class Recording(dict):
         n_bins=50,
         density=False,
         intervals=False,
+        lists=None,
     ):
-        """Create a histogram of all episodes in the presently selected series
-        """
+        """Create a histogram of all episodes in the presently selected series,
+        or of those in the given lists.
+
+        The counts of the episodes are cached (see `SeriesHistogram`), so
+        the histogram is only computed from the data the first time it is
+        requested for a series and a selection of samples."""
         debug_logger.debug(f"series_hist")
-        # put all piezo traces and all current traces in lists
-        piezos = [episode.piezo for episode in self.series]
-        traces = [episode.trace for episode in self.series]
-        trace_list = []
         if select_piezo and not self.has_piezo:
             debug_logger.debug(
                 (f"Tried piezo selection even though there is no piezo data!")
             )
             select_piezo = False
-        # select the time points that are used for the histogram
-        if select_piezo:
-            for piezo, trace in zip(piezos, traces):
-                time, trace_points = piezo_selection(
-                    self.episode().time, piezo, trace, active, deviation
-                )
-                trace_list.extend(trace_points)
-        elif intervals:
-            for trace in traces:
-                time, trace_points = interval_selection(
-                    self.episode().time, trace, intervals, self.sampling_rate
-                )
-                trace_list.extend(trace_points)
+        histogram = self.series_histogram(active, select_piezo, deviation, intervals)
+        if histogram.n_bins != n_bins:
+            histogram.rebin(n_bins)
+        if lists is None:
+            histogram.select()
         else:
-            trace_list = traces
-        # turn the collected traces into a 1D numpy array for the histogram
-        # function
-        trace_list = np.asarray(trace_list)
-        trace_list = trace_list.flatten()
-
-        heights, bins = np.histogram(trace_list, n_bins, density=density)
+            positions = [i for name in lists for i in self.lists[name][0]]
+            histogram.select(positions)
+        heights, bins = histogram.histogram(density)
         # get centers of all the bins
         centers = (bins[:-1] + bins[1:]) / 2
         # get the width of a(ll) bin(s)
         width = bins[1] - bins[0]
         return heights, bins, centers, width
 
+    def series_histogram(
+        self, active=True, select_piezo=True, deviation=0.05, intervals=False
+    ):
+        """Return the `SeriesHistogram` of the current series for a selection
+        of samples, creating it if necessary."""
+        if select_piezo:
+            selection = (True, active, deviation)
+        elif intervals:
+            selection = (False, np.asarray(intervals, dtype=float).tobytes())
+        else:
+            selection = (False,)
+        key = (self.current_datakey,) + selection
+        histogram = self.histograms.get(key)
+        if histogram is None or histogram.series is not self.series:
+            histogram = SeriesHistogram(
+                self.series,
+                select_piezo,
+                active,
+                deviation,
+                intervals,
+                self.sampling_rate,
+                cache=self.histogram_cache,
+            )
+            self.histograms[key] = histogram
+        return histogram
+
+    def series_overview(self, n_columns=OVERVIEW_COLUMNS):
+        """Return the `SeriesOverview` of the current series, creating it if
+        necessary."""
+        key = (self.current_datakey, n_columns)
+        overview = self.overviews.get(key)
+        if overview is None or overview.series is not self.series:
+            overview = SeriesOverview(self.series, n_columns, self.executor)
+            self.overviews.put(key, overview)
+        return overview
+
+    def episode_spline(self, n_episode=None):
+        """Return the `ChunkedSpline` of the trace of an episode in the
+        current series, creating it if necessary."""
+        if n_episode is None:
+            n_episode = self.current_ep_ind
+        key = (self.current_datakey, n_episode)
+        spline = self.splines.get(key)
+        if spline is None:
+            series = self.series
+            spline = ChunkedSpline(
+                series.row("trace", series.position(n_episode)), series.time
+            )
+            self.splines.put(key, spline)
+        return spline
+
+    def episode_splines(self, n_episodes, datakey=None, executor=None):
+        """Return the `ChunkedSpline`s of several episodes of a series, those
+        that are not cached are fitted in parallel and cached.
+
+        Args:
+            n_episodes - the numbers of the episodes
+            datakey - the series, defaults to the current one
+            executor - the `SeriesExecutor` fitting the splines, defaults to
+                that of the recording
+        Returns:
+            splines - list of `ChunkedSpline`s in the order of `n_episodes`"""
+        if datakey is None:
+            datakey = self.current_datakey
+        if executor is None:
+            executor = self.executor
+        series = self[datakey]
+        splines = [self.splines.get((datakey, n)) for n in n_episodes]
+        missing = [i for i, spline in enumerate(splines) if spline is None]
+        if missing:
+            # rows are read one by one so that lazy series are not decoded
+            # as a whole
+            signals = np.stack(
+                [series.row("trace", series.position(n_episodes[i])) for i in missing]
+            )
+            fitted = executor.map_episodes(fit_splines, [signals], time=series.time)
+            for i, spline in zip(missing, fitted):
+                splines[i] = spline
+                self.splines.put((datakey, n_episodes[i]), spline)
+        return splines
+
     def episode_hist(
         self,
         active=True,
@@ -343,9 +534,8 @@ class Recording(dict):
             select_piezo = False
         # select time points to include in histogram
         if select_piezo:
-            time, trace_points = piezo_selection(
-                self.episode().time,
-                self.episode().piezo,
+            trace_points = self.series.piezo_masks.select(
+                self.series.position(self.current_ep_ind),
                 self.episode().trace,
                 active,
                 deviation,
@@ -376,6 +566,36 @@ class Recording(dict):
         with open(filepath, "wb") as save_file:
             pickle.dump(self, save_file)
 
+    def save_project(self, filepath, idealization_parameters=None):
+        """Save the recording to a project directory, see `save_project`.
+
+        Args:
+            filepath - path of the project directory
+            idealization_parameters - dict of the parameters used to create
+                the idealizations in the recording
+        Returns:
+            the path of the project directory"""
+        debug_logger.debug(f"save_project")
+
+        if idealization_parameters is None:
+            idealization_parameters = self.idealization_parameters
+        return save_project(self, filepath, idealization_parameters)
+
+    @classmethod
+    def from_project(cls, filename, datakeys=None, episodes=None, mmap_mode="r"):
+        """Load some or all of the series in a project directory.
+
+        Args:
+            filename - path of the project directory or its manifest
+            datakeys - the series to load, defaults to all of them
+            episodes - (start, stop) of the rows of the episodes to load
+            mmap_mode - `np.load` memory maps the arrays with this mode, by
+                default they are read-only and copied when written to
+        Returns:
+            recording - instance of the Recording class containing the data"""
+        recording = cls(project_path(filename))
+        return load_project(recording, datakeys, episodes, mmap_mode)
+
     @staticmethod
     def _load_from_pickle(recording):
         """Load a recording from a '.pkl' file.
@@ -389,11 +609,72 @@ class Recording(dict):
             pickle."""
         with open(recording.filename, "rb") as file:
             data = pickle.load(file)
+            executor = recording.executor
             recording.__dict__ = data.__dict__
+            recording.executor = executor
+            recording.__dict__.setdefault("idealization_parameters", None)
+            recording.__dict__.setdefault(
+                "idealization_store", LRUCache(max_bytes=IDEALIZATION_CACHE_BYTES)
+            )
+            recording.__dict__.setdefault("active_idealization", None)
+            idealization_keys = recording.__dict__.get("idealization_keys")
+            if idealization_keys is None:
+                # the episodes of older pickles hold the active idealization
+                idealization_keys = {
+                    datakey: recording.active_idealization
+                    for datakey in data
+                    if recording.active_idealization is not None
+                }
+            recording.__dict__.setdefault(
+                "idealization_seed", np.random.SeedSequence().entropy
+            )
+            recording.histograms = dict()
+            recording.histogram_cache = LRUCache(max_bytes=HISTOGRAM_CACHE_BYTES)
+            recording.overviews = LRUCache(max_bytes=OVERVIEW_CACHE_BYTES)
+            recording.splines = LRUCache(max_bytes=SPLINE_CACHE_BYTES)
             for key, value in data.items():
+                if isinstance(value, list):
+                    value = Recording._series_from_episodes(
+                        value, recording.sampling_rate
+                    )
                 recording[key] = value
+            # replacing the series dropped their keys
+            recording.idealization_keys = idealization_keys
         return recording
 
+    @staticmethod
+    def _series_from_episodes(episodes, sampling_rate):
+        """Rebuild a series from the list of episodes that pickles saved
+        before the data of a series was held in blocks contain.
+
+        The attributes of those episodes are read from their `__dict__`,
+        because the properties of `Episode` now read from its series.
+        Args:
+            episodes - the unpickled episodes of the series
+            sampling_rate - the sampling rate of the recording
+        Returns:
+            series - instance of `Series`"""
+        states = [vars(episode) for episode in episodes]
+        piezo = [state.get("piezo") for state in states]
+        command = [state.get("command") for state in states]
+        series = Series.from_arrays(
+            states[0]["time"],
+            [state["trace"] for state in states],
+            piezo=None if any(p is None for p in piezo) else piezo,
+            command=None if any(c is None for c in command) else command,
+            ep_numbers=[state["n_episode"] for state in states],
+            sampling_rate=sampling_rate,
+        )
+        for episode, state in zip(series, states):
+            episode.first_activation = state.get("first_activation")
+            episode.manual_first_activation = state.get(
+                "manual_first_activation", False
+            )
+            if state.get("idealization") is not None:
+                episode.idealization = state["idealization"]
+                episode.id_time = state.get("id_time")
+        return series
+
     def export_idealization(
         self,
         filepath,
@@ -405,33 +686,36 @@ class Recording(dict):
         resolution,
         interpolation_factor,
     ):
-        debug_logger.debug(f"export_idealization")
+        """Export the idealizations of the episodes in the given lists of the
+        current series, one episode at a time.
 
-        if not filepath.endswith(".csv"):
-            filepath += ".csv"
+        The format is given by the extension of `filepath`: '.csv', '.npy',
+        '.npz', '.h5'/'.hdf5' (needs h5py) or '.rle' for the run-length
+        encoded levels, see `idealization_writer`. Other files are written as
+        CSV with '.csv' appended to the name.
+        Returns:
+            the path of the file"""
+        debug_logger.debug(f"export_idealization to {filepath}")
 
         episodes = self.select_episodes(lists=lists_to_save)
-
-        export_array = np.zeros(
-            shape=(len(episodes) + 1, episodes[0].idealization.size)
-        )
-        export_array[0] = self.episode().id_time * TIME_UNIT_FACTORS[time_unit]
-        for k, episode in enumerate(episodes):
-            export_array[k + 1] = (
-                episode.idealization * CURRENT_UNIT_FACTORS[trace_unit]
-            )
-        # note that we transpose the export array to export the matrix
-        np.savetxt(
+        parameters = {
+            "amplitudes": amplitudes,
+            "thresholds": thresholds,
+            "resolution": resolution,
+            "interpolation_factor": interpolation_factor,
+        }
+        with idealization_writer(
             filepath,
-            export_array.T,
-            delimiter=",",
-            header=f"amplitudes = {amplitudes};"
-            f"thresholds = {thresholds};"
-            f"resolution = {resolution};"
-            f"interpolation_factor = {interpolation_factor}"
-            "\n Time, "
-            + ", ".join(["Episode number " + str(e.n_episode) for e in episodes]),
-        )
+            episodes[0].id_time,
+            [episode.n_episode for episode in episodes],
+            time_unit=time_unit,
+            trace_unit=trace_unit,
+            amplitudes=amplitudes,
+            parameters=parameters,
+        ) as writer:
+            for episode in episodes:
+                writer.write(episode.idealization)
+        return writer.filepath
 
     def export_matlab(
         self,
@@ -462,7 +746,7 @@ class Recording(dict):
 
         # create dict to write matlab file and add the time vector
         export_dict = dict()
-        export_dict["time"] = self["raw_"][0].time * TIME_UNIT_FACTORS[time_unit]
+        export_dict["time"] = self["raw_"].time * TIME_UNIT_FACTORS[time_unit]
         fill_length = len(str(len(self[datakey])))
         episodes = self.select_episodes(datakey, lists_to_save)
         # # get the episodes we want to save
@@ -594,28 +878,21 @@ class Recording(dict):
 
         names, time, current, piezo, command, ep_numbers = load_axo(recording.filename)
         n_episodes = len(current)
-        if not piezo:
-            piezo = [None] * n_episodes
-        if not command:
-            command = [None] * n_episodes
         if not ep_numbers:
             ep_numbers = range(n_episodes)
         initial_index = ep_numbers[0]
-        recording["raw_"] = [
-            Episode(
-                time,
-                current[i],
-                n_episode=int(ep_numbers[i]),
-                piezo=piezo[i],
-                command=command[i],
-                sampling_rate=recording.sampling_rate,
-                input_time_unit=time_input_unit,
-                input_trace_unit=trace_input_unit,
-                input_piezo_unit=piezo_input_unit,
-                input_command_unit=command_input_unit,
-            )
-            for i in range(n_episodes)
-        ]
+        recording["raw_"] = Series.from_arrays(
+            time,
+            current,
+            piezo=piezo,
+            command=command,
+            ep_numbers=[int(n) for n in ep_numbers],
+            sampling_rate=recording.sampling_rate,
+            input_time_unit=time_input_unit,
+            input_trace_unit=trace_input_unit,
+            input_piezo_unit=piezo_input_unit,
+            input_command_unit=command_input_unit,
+        )
         recording.current_ep_ind = int(initial_index)
         return recording
 
@@ -626,41 +903,51 @@ class Recording(dict):
         piezo_input_unit,
         command_input_unit,
         time_input_unit,
+        lazy=False,
+        memory_budget=EPISODE_CACHE_BYTES,
     ):
         """Load data from a matlab file.
 
         This method creates a recording objects from the data in the file.
         Args:
             recording - recording object to be filled with data
+            lazy - only index the file and decode episodes on demand
+            memory_budget - size of the cache of decoded episodes in bytes
         Returns:
             recording - instance of the Recording class containing the data"""
-        debug_logger.debug(f"from_matlab")
+        debug_logger.debug(f"from_matlab, lazy={lazy}")
 
-        names, time, current, piezo, command, ep_numbers = load_matlab(
-            recording.filename
-        )
+        if lazy:
+            names, time, matfile, current, piezo, command, ep_numbers = load_matlab_lazy(
+                recording.filename
+            )
+        else:
+            names, time, current, piezo, command, ep_numbers = load_matlab(
+                recording.filename
+            )
         n_episodes = len(current)
-        if not piezo:
-            piezo = [None] * n_episodes
-        if not command:
-            command = [None] * n_episodes
         if not ep_numbers:
             ep_numbers = range(n_episodes)
         initial_index = ep_numbers[0]
-        recording["raw_"] = [
-            Episode(
+        kwargs = dict(
+            piezo=piezo,
+            command=command,
+            ep_numbers=[int(n) for n in ep_numbers],
+            sampling_rate=recording.sampling_rate,
+            input_time_unit=time_input_unit,
+            input_trace_unit=trace_input_unit,
+            input_piezo_unit=piezo_input_unit,
+            input_command_unit=command_input_unit,
+        )
+        if lazy:
+            recording["raw_"] = Series.from_source(
                 time,
-                current[i],
-                n_episode=int(ep_numbers[i]),
-                piezo=piezo[i],
-                command=command[i],
-                sampling_rate=recording.sampling_rate,
-                input_time_unit=time_input_unit,
-                input_trace_unit=trace_input_unit,
-                input_piezo_unit=piezo_input_unit,
-                input_command_unit=command_input_unit,
+                matfile.load,
+                current,
+                cache=LRUCache(max_bytes=memory_budget),
+                **kwargs,
             )
-            for i in range(n_episodes)
-        ]
+        else:
+            recording["raw_"] = Series.from_arrays(time, current, **kwargs)
         recording.current_ep_ind = int(initial_index)
         return recording
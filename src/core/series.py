@@ -0,0 +1,406 @@
+import logging
+
+import numpy as np
+
+from ..constants import CURRENT_UNIT_FACTORS, VOLTAGE_UNIT_FACTORS, TIME_UNIT_FACTORS
+from ..utils.cache import LRUCache
+from .episode import Episode
+from .masks import PiezoMasks
+
+
+debug_logger = logging.getLogger("ascam.debug")
+
+
+class Series:
+    """Columnar storage for all the episodes of one series.
+
+    Every channel (trace, piezo, command) is held in a single
+    `(n_episodes, n_samples)` array and all episodes share one time vector.
+    The `Episode` objects handed out by a series are lightweight views into
+    the rows of these arrays, so whole-series operations can work on the
+    blocks directly while per-episode code keeps working as before."""
+
+    def __init__(
+        self,
+        time=None,
+        trace=None,
+        n_episodes=None,
+        piezo=None,
+        command=None,
+        sampling_rate=4e4,
+    ):
+        """Create a series from existing arrays.
+
+        Parameters:
+            time [1D array of floats] - the time axis shared by all episodes
+            trace [2D array of floats] - current, one episode per row
+            n_episodes [list of ints] - the number of each episode, defaults
+                to the row numbers
+            piezo [2D array of floats] - piezo voltage, one episode per row
+            command [2D array of floats] - command voltage, one episode per row
+            sampling_rate [float] - sampling rate of the recording in Hz"""
+
+        if time is None:
+            time = np.zeros(0)
+        if trace is None:
+            trace = np.zeros((0, len(time)))
+        # arrays of the channels and the channels that are decoded on demand
+        self._blocks = dict()
+        self._lazy = dict()
+        self.time = np.asarray(time, dtype=float)
+        self.trace = trace
+        self.piezo = piezo
+        self.command = command
+        self.sampling_rate = sampling_rate
+        # names of the channels whose arrays are shared with other series,
+        # these are copied before they are written to
+        self._shared = set()
+
+        if n_episodes is None:
+            n_episodes = range(len(self._lazy.get("trace", self._blocks["trace"])))
+        n_episodes = np.asarray(n_episodes, dtype=int)
+        # which episodes hold an idealization, maintained by the episodes
+        self.idealized = np.zeros(n_episodes.size, dtype=bool)
+        self.episodes = [Episode(self, i, n) for i, n in enumerate(n_episodes)]
+        self.update_index()
+
+    @classmethod
+    def from_arrays(
+        cls,
+        time,
+        current,
+        piezo=None,
+        command=None,
+        ep_numbers=None,
+        sampling_rate=4e4,
+        input_time_unit="s",
+        input_trace_unit="A",
+        input_piezo_unit="V",
+        input_command_unit="V",
+    ):
+        """Create a series from the per-episode arrays returned by the loaders.
+
+        Parameters:
+            time [1D array of floats] - the time axis of the recording
+            current [list of 1D arrays] - the current of each episode
+            piezo [list of 1D arrays] - the piezo voltage of each episode
+            command [list of 1D arrays] - the command voltage of each episode
+            ep_numbers [list of ints] - the numbers of the episodes
+            input_*_unit [string] - the units of the data in the file
+        Returns:
+            series - instance of `Series` holding the data in SI units"""
+
+        time = np.asarray(time, dtype=float) / TIME_UNIT_FACTORS[input_time_unit]
+        trace = cls._stack(current, CURRENT_UNIT_FACTORS[input_trace_unit])
+        if piezo:
+            piezo = cls._stack(piezo, VOLTAGE_UNIT_FACTORS[input_piezo_unit])
+        else:
+            piezo = None
+        if command:
+            command = cls._stack(command, VOLTAGE_UNIT_FACTORS[input_command_unit])
+        else:
+            command = None
+        debug_logger.debug(
+            f"created series with {trace.shape[0]} episodes of "
+            f"{trace.shape[1]} samples"
+        )
+        return cls(time, trace, ep_numbers, piezo, command, sampling_rate)
+
+    @classmethod
+    def from_source(
+        cls,
+        time,
+        load,
+        current,
+        piezo=None,
+        command=None,
+        ep_numbers=None,
+        sampling_rate=4e4,
+        input_time_unit="s",
+        input_trace_unit="A",
+        input_piezo_unit="V",
+        input_command_unit="V",
+        cache=None,
+    ):
+        """Create a series whose episodes are decoded on demand.
+
+        Parameters:
+            time [1D array of floats] - the time axis of the recording
+            load [function] - returns the data of the variable with a given
+                key, e.g. `LazyMatlabFile.load` which takes the position of
+                the variable in the file
+            current [list] - the keys of the current variables
+            piezo [list] - the keys of the piezo variables
+            command [list] - the keys of the command variables
+            ep_numbers [list of ints] - the numbers of the episodes
+            input_*_unit [string] - the units of the data in the file
+            cache [LRUCache] - holds the decoded episodes of all channels
+        Returns:
+            series - instance of `Series` with lazy channels"""
+
+        if cache is None:
+            cache = LRUCache()
+        time = np.asarray(time, dtype=float) / TIME_UNIT_FACTORS[input_time_unit]
+        trace = LazyBlock(load, current, CURRENT_UNIT_FACTORS[input_trace_unit], cache)
+        if piezo:
+            piezo = LazyBlock(
+                load, piezo, VOLTAGE_UNIT_FACTORS[input_piezo_unit], cache
+            )
+        else:
+            piezo = None
+        if command:
+            command = LazyBlock(
+                load, command, VOLTAGE_UNIT_FACTORS[input_command_unit], cache
+            )
+        else:
+            command = None
+        debug_logger.debug(
+            f"created lazy series with {len(trace)} episodes of "
+            f"{time.size} samples and {cache}"
+        )
+        return cls(time, trace, ep_numbers, piezo, command, sampling_rate)
+
+    @staticmethod
+    def _stack(arrays, unit_factor):
+        """Stack a list of 1D arrays into one 2D block and convert it to SI
+        units without allocating a second block."""
+        block = np.vstack(arrays).astype(float)
+        block /= unit_factor
+        return block
+
+    def __getstate__(self):
+        # lazy channels read from an open file, they are stored as arrays
+        state = self.__dict__.copy()
+        state["_blocks"] = dict(self._blocks)
+        for channel, lazy in self._lazy.items():
+            state["_blocks"][channel] = lazy.materialize()
+        state["_lazy"] = dict()
+        # the masks may read from a lazy channel, they are recomputed
+        state["_piezo_masks"] = None
+        return state
+
+    def _get_channel(self, channel):
+        if channel in self._lazy:
+            debug_logger.debug(f"decoding all episodes of channel {channel}")
+            self._blocks[channel] = self._lazy.pop(channel).materialize()
+        return self._blocks[channel]
+
+    def _set_channel(self, channel, value):
+        if channel == "piezo":
+            # the masks of the previous piezo voltage no longer apply
+            self._piezo_masks = None
+        self._lazy.pop(channel, None)
+        if isinstance(value, LazyBlock):
+            self._lazy[channel] = value
+            self._blocks[channel] = None
+        elif value is None:
+            self._blocks[channel] = None
+        else:
+            self._blocks[channel] = np.asarray(value, dtype=float)
+
+    @property
+    def trace(self):
+        return self._get_channel("trace")
+
+    @trace.setter
+    def trace(self, value):
+        self._set_channel("trace", value)
+
+    @property
+    def piezo(self):
+        return self._get_channel("piezo")
+
+    @piezo.setter
+    def piezo(self, value):
+        self._set_channel("piezo", value)
+
+    @property
+    def piezo_masks(self):
+        """The `PiezoMasks` of the piezo voltage of this series."""
+        if getattr(self, "_piezo_masks", None) is None:
+            self._piezo_masks = PiezoMasks(
+                self._lazy.get("piezo", self._blocks["piezo"])
+            )
+        return self._piezo_masks
+
+    @property
+    def command(self):
+        return self._get_channel("command")
+
+    @command.setter
+    def command(self, value):
+        self._set_channel("command", value)
+
+    @property
+    def is_lazy(self):
+        """True if some channels are still read from the file on demand."""
+        return bool(self._lazy)
+
+    def has_channel(self, channel):
+        """Check whether there is data for a channel without decoding it."""
+        return channel in self._lazy or self._blocks.get(channel) is not None
+
+    def row(self, channel, index):
+        """Return the data of one episode in a channel.
+
+        Rows of lazy channels are decoded (or taken from the cache) without
+        decoding the rest of the channel."""
+        if channel in self._lazy:
+            return self._lazy[channel].row(index)
+        block = self._blocks[channel]
+        if block is None:
+            return None
+        return block[index]
+
+    def load(self):
+        """Decode all lazy channels into arrays."""
+        for channel in list(self._lazy):
+            self._get_channel(channel)
+
+    def __len__(self):
+        return len(self.episodes)
+
+    def __iter__(self):
+        return iter(self.episodes)
+
+    def __getitem__(self, index):
+        return self.episodes[index]
+
+    @property
+    def n_samples(self):
+        return self.time.size
+
+    @property
+    def n_episodes(self):
+        """Array containing the numbers of the episodes in row order."""
+        return self._n_episodes
+
+    def update_index(self):
+        """Rebuild the map from episode numbers to rows, this is only needed
+        if the number of an episode is changed."""
+        self._n_episodes = np.array(
+            [episode.n_episode for episode in self.episodes], dtype=int
+        )
+        self._positions = {int(n): i for i, n in enumerate(self._n_episodes)}
+
+    def position(self, n_episode):
+        """Return the row of the episode with the given number or None."""
+        return self._positions.get(n_episode)
+
+    def episode(self, n_episode):
+        """Return the episode with the given number or None."""
+        position = self._positions.get(n_episode)
+        if position is None:
+            return None
+        return self.episodes[position]
+
+    def derive(self, trace=None):
+        """Create a new series that shares its unchanged channels with this one.
+
+        The time axis, piezo and command voltage are not affected by
+        processing, so the derived series references the same arrays instead
+        of copying them. Only the trace is new, either the given array or a
+        copy of the trace of this series that can then be written to.
+        Shared arrays are made read-only and are copied by whichever series
+        first writes to them (see `writable`).
+        Parameters:
+            trace [2D array of floats] - the trace of the new series
+        Returns:
+            derived - a new `Series` with the same episodes as this one"""
+
+        if trace is None:
+            trace = self.trace.copy()
+        derived = Series(
+            self.time,
+            trace,
+            self.n_episodes,
+            self._blocks["piezo"],
+            self._blocks["command"],
+            self.sampling_rate,
+        )
+        for channel in ("piezo", "command"):
+            # lazy channels are never written to, they are passed on as is
+            if channel in self._lazy:
+                derived._set_channel(channel, self._lazy[channel])
+        if self.has_channel("piezo"):
+            derived._piezo_masks = self.piezo_masks
+        for channel in ("time", "piezo", "command"):
+            block = self.time if channel == "time" else self._blocks[channel]
+            if block is not None:
+                block.flags.writeable = False
+                self._shared.add(channel)
+                derived._shared.add(channel)
+        # results of analyses that do not depend on the trace are carried over
+        for episode, derived_episode in zip(self.episodes, derived.episodes):
+            derived_episode.first_activation = episode.first_activation
+            derived_episode.manual_first_activation = episode.manual_first_activation
+        debug_logger.debug(f"derived series shares {derived._shared}")
+        return derived
+
+    def writable(self, channel):
+        """Return the array of a channel, copying it first if it is shared
+        with another series or read-only."""
+        if channel in self._shared or not getattr(self, channel).flags.writeable:
+            setattr(self, channel, getattr(self, channel).copy())
+            self._shared.discard(channel)
+        return getattr(self, channel)
+
+    def select(self, indices):
+        """Return the episodes at the given positions in the series."""
+        return [self.episodes[i] for i in indices]
+
+
+class LazyBlock:
+    """The rows of one channel of a series that are decoded on demand.
+
+    Rows are decoded from their source the first time they are accessed and
+    kept in an `LRUCache`, whose memory budget bounds how much of the
+    channel is held in memory at once."""
+
+    def __init__(self, load, keys, unit_factor=1, cache=None):
+        """Parameters:
+            load [function] - returns the data stored under a key as a 1D
+                array, e.g. `LazyMatlabFile.load`
+            keys [list] - the key of each row, keys have to be unique
+            unit_factor [float] - the rows are divided by this to convert
+                them to SI units
+            cache [LRUCache] - holds the decoded rows, it can be shared by
+                several blocks as long as their keys are distinct"""
+
+        self.load = load
+        self.keys = list(keys)
+        self.unit_factor = unit_factor
+        self.cache = LRUCache() if cache is None else cache
+
+    def __len__(self):
+        return len(self.keys)
+
+    def row(self, index):
+        key = self.keys[index]
+        row = self.cache.get(key)
+        if row is None:
+            row = self._decode(key)
+            self.cache.put(key, row)
+        return row
+
+    def _decode(self, key):
+        row = np.asarray(self.load(key)).ravel()
+        if self.unit_factor != 1 or row.dtype != float:
+            row = row.astype(float)
+            row /= self.unit_factor
+        # cached rows are shared by all episodes that view them
+        row.flags.writeable = False
+        return row
+
+    def materialize(self):
+        """Decode all rows into one 2D block, rows that are cached are
+        copied from the cache, the others are not added to it."""
+        block = None
+        for i, key in enumerate(self.keys):
+            row = self.cache.get(key)
+            if row is None:
+                row = self._decode(key)
+            if block is None:
+                block = np.empty((len(self.keys), row.size))
+            block[i] = row
+        return block
@@ -4,3 +4,4 @@ from .analysis_widgets import IdealizationFrame
 from .processing_frames import BaselineFrame, FilterFrame
 from .plot_frame import PlotFrame
 from .episode_frame import EpisodeList, EpisodeFrame
+from .overview_frame import OverviewFrame
@@ -21,6 +21,7 @@ from PySide2.QtWidgets import (
     QTabBar,
     QPushButton,
     QLabel,
+    QProgressBar,
 )
 
 from .io_widgets import ExportIdealizationDialog
@@ -31,6 +32,12 @@ from ..utils.widgets import TextEdit, HistogramViewBox, EntryWidget, TableFrame
 
 debug_logger = logging.getLogger("ascam.debug")
 
+# interval in ms in which idealizations are collected from the background
+BACKGROUND_POLL_INTERVAL = 200
+# time in ms after the last move while dragging a threshold or amplitude
+# line until the idealization with the new parameters is calculated
+DRAG_COMMIT_INTERVAL = 150
+
 
 class IdealizationFrame(QWidget):
     def __init__(self, main):
@@ -47,6 +54,18 @@ class IdealizationFrame(QWidget):
 
         self.main.ep_frame.ep_list.currentItemChanged.connect(self.on_episode_click)
 
+        # the idealizations computed in the background are moved into the
+        # episodes on the GUI thread
+        self.background_timer = QtCore.QTimer(self)
+        self.background_timer.timeout.connect(self.collect_background)
+        self.background_timer.start(BACKGROUND_POLL_INTERVAL)
+
+        # while a line is dragged the idealization is only calculated once
+        # the cursor rests or the line is released
+        self.drag_timer = QtCore.QTimer(self)
+        self.drag_timer.setSingleShot(True)
+        self.drag_timer.timeout.connect(self.calculate_click)
+
     @property
     def current_tab(self):
         return self.tab_frame.currentWidget()
@@ -75,6 +94,11 @@ class IdealizationFrame(QWidget):
         self.export_idealization_button.clicked.connect(self.export_idealization)
         self.layout.addWidget(self.export_idealization_button)
 
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setFormat("Idealizing series %p%")
+        self.progress_bar.hide()
+        self.layout.addWidget(self.progress_bar)
+
         self.close_button = QPushButton("Close Tab")
         self.close_button.clicked.connect(self.close_tab)
         self.layout.addWidget(self.close_button)
@@ -89,7 +113,24 @@ class IdealizationFrame(QWidget):
         else:
             self.close_frame()
 
+    def collect_background(self):
+        cache = self.current_tab.idealization_cache
+        if cache is None or cache.worker is None:
+            self.progress_bar.hide()
+            return
+        cache.collect()
+        if cache.worker.done:
+            self.progress_bar.hide()
+        else:
+            self.progress_bar.setValue(int(100 * cache.worker.progress))
+            self.progress_bar.show()
+
     def close_frame(self):
+        self.background_timer.stop()
+        self.drag_timer.stop()
+        for tab in self.tab_frame.tabs:
+            if tab.idealization_cache is not None:
+                tab.idealization_cache.cancel_background()
         self.main.ep_frame.ep_list.currentItemChanged.disconnect(self.on_episode_click)
         self.main.plot_frame.tc_tracking = False
         self.main.tc_frame = None
@@ -104,9 +145,11 @@ class IdealizationFrame(QWidget):
 
     def export_events(self):
         self.get_params()
-        self.current_tab.idealization_cache.get_events()
+        # the events are written while the series is idealized
         filename = QFileDialog.getSaveFileName(
-            self, dir=self.main.filename[:-4] + "_events.csv", filter="*.csv"
+            self,
+            dir=self.main.filename[:-4] + "_events.csv",
+            filter="*.csv;;*.parquet;;*.feather;;*.events",
         )[0]
         self.current_tab.idealization_cache.export_events(
             filename, self.current_tab.time_unit, self.current_tab.trace_unit
@@ -128,6 +171,9 @@ class IdealizationFrame(QWidget):
     def get_params(self):
         return self.current_tab.get_params()
 
+    def read_params(self):
+        return self.current_tab.read_params()
+
     def idealization(self, n_episode=None):
         if self.current_tab.idealization_cache is not None:
             return self.current_tab.idealization_cache.idealization(n_episode)
@@ -150,9 +196,10 @@ class IdealizationFrame(QWidget):
     def track_cursor(self, y_pos):
         """Track the position of the mouse cursor over the plot and if mouse 1
         is pressed adjust the nearest threshold/amplitude line by dragging the
-        cursor."""
+        cursor. The lines follow the cursor, the idealization is calculated
+        when the cursor rests for `DRAG_COMMIT_INTERVAL` or in `finish_drag`."""
 
-        amps, thetas = self.get_params()[:2]
+        amps, thetas = self.read_params()[:2]
         if thetas.size > 0:
             tc_diff = np.min(np.abs(thetas - y_pos))
         else:
@@ -176,6 +223,13 @@ class IdealizationFrame(QWidget):
                 y_pos, self.current_tab.amp_entry.toPlainText()
             )
             self.current_tab.amp_entry.setPlainText(new_str)
+        self.main.plot_frame.plot_tc_params()
+        self.drag_timer.start(DRAG_COMMIT_INTERVAL)
+
+    def finish_drag(self):
+        """Calculate the idealization with the parameters at which a line was
+        released."""
+        self.drag_timer.stop()
         self.calculate_click()
 
 
@@ -277,6 +331,11 @@ class IdealizationTab(EntryWidget):
         self.intrp_entry = QLineEdit(self)
         self.add_row(self.intrp_entry)
 
+        refine_label = QLabel("Refine crossings")
+        self.refinement_box = QComboBox()
+        self.refinement_box.addItems(["Off", "Linear", "Cubic"])
+        self.add_row(refine_label, self.refinement_box)
+
     def toggle_drag_params(self, checked):
         self.parent.parent.main.plot_frame.tc_tracking = checked
 
@@ -300,7 +359,9 @@ class IdealizationTab(EntryWidget):
         else:
             self.threshold_entry.setEnabled(True)
 
-    def get_params(self):
+    def read_params(self):
+        """Return the parameters in the entries, without creating an
+        `IdealizationCache` for them."""
         amps = string_to_array(self.amp_entry.toPlainText())
         thresholds = string_to_array(self.threshold_entry.toPlainText())
         res_string = self.res_entry.text()
@@ -334,31 +395,47 @@ class IdealizationTab(EntryWidget):
         else:
             intrp_factor = 1
 
-        if self.check_params_changed(amps, thresholds, resolution, intrp_factor):
+        refinement = self.refinement_box.currentText().lower()
+        if refinement == "off":
+            refinement = None
+        elif intrp_factor != 1:
+            # crossings are refined at the native sampling rate
+            self.interpolate.setChecked(False)
+            intrp_factor = 1
+        return amps, thresholds, resolution, intrp_factor, refinement
+
+    def get_params(self):
+        """Return the parameters in the entries and switch to the
+        `IdealizationCache` for them, idealizing the rest of the series in
+        the background if they changed."""
+        amps, thresholds, resolution, intrp_factor, refinement = self.read_params()
+        if self.check_params_changed(
+            amps, thresholds, resolution, intrp_factor, refinement
+        ):
             debug_logger.debug(
                 f"creating new idealization cache for\n"
                 f"amp = {amps} \n"
                 f"thresholds = {thresholds}\n"
-                f"resolution = {res_string}\n"
-                f"interpolation = {intrp_string}"
+                f"resolution = {resolution}\n"
+                f"interpolation = {intrp_factor}\n"
+                f"refinement = {refinement}"
             )
-            try:
-                self.idealization_cache.clear_idealization()
-            except AttributeError as e:
-                if "'IdealizationTab' object has no attribute 'idealization_cache'" in str(
-                    e
-                ) or "object has no attribute " in str(
-                    e
-                ):
-                    pass
-                else:
-                    raise AttributeError(e)
+            # idealizations with earlier parameters are kept by the recording
+            # and are shown again if those parameters are used again
             self.idealization_cache = IdealizationCache(
-                self.parent.parent.main.data, amps, thresholds, resolution, intrp_factor
+                self.parent.parent.main.data,
+                amps,
+                thresholds,
+                resolution,
+                intrp_factor,
+                refinement=refinement,
             )
+            # the rest of the series is idealized while the user browses,
+            # the worker of the previous parameters stops by itself
+            self.idealization_cache.start_background()
         return amps, thresholds, resolution, intrp_factor
 
-    def check_params_changed(self, amp, theta, res, intrp):
+    def check_params_changed(self, amp, theta, res, intrp, refinement=None):
         changed = True
         try:
             if set(amp) != set(self.idealization_cache.amplitudes):
@@ -369,6 +446,8 @@ class IdealizationTab(EntryWidget):
                 debug_logger.debug("resolution has changed")
             elif intrp != self.idealization_cache.interpolation_factor:
                 debug_logger.debug("interpolation factor has changed")
+            elif refinement != self.idealization_cache.refinement:
+                debug_logger.debug("refinement has changed")
             else:
                 changed = False
         except AttributeError:
@@ -287,7 +287,10 @@ class ExportIdealizationWidget(BaseExportWidget):
 
     def save_click(self):
         filename, filetye = QFileDialog.getSaveFileName(
-            self, dir=self.main.filename[:-4], filter="CSV (*.csv)"
+            self,
+            dir=self.main.filename[:-4],
+            filter="CSV (*.csv);;NumPy (*.npy);;NumPy archive (*.npz);;"
+            "HDF5 (*.h5);;Run-length encoded (*.rle)",
         )
         self.main.data.export_idealization(
             filename,
@@ -22,9 +22,11 @@ from ..gui import (
     EpisodeFrame,
     IdealizationFrame,
     FirstActivationFrame,
+    OverviewFrame,
 )
 from ..utils import parse_filename, clear_qt_layout
 from ..core import Recording
+from ..core.project import project_path, PROJECT_EXTENSION
 from ..constants import TEST_FILE_NAME
 
 
@@ -83,6 +85,8 @@ class MainWindow(QMainWindow):
             "Show Command Voltage", self.plot_menu, checkable=True
         )
         self.plot_menu.addAction(self.show_command)
+        self.plot_menu.addSeparator()
+        self.plot_menu.addAction("Series Overview", lambda: OverviewFrame(self))
 
         # self.histogram_menu = self.menuBar().addMenu("Histogram")
 
@@ -96,7 +100,7 @@ class MainWindow(QMainWindow):
     def open_file(self):
         clear_qt_layout(self.central_layout)
         self.create_widgets()
-        self.filename = QFileDialog.getOpenFileName(self)[0]
+        self.filename = project_path(QFileDialog.getOpenFileName(self)[0])
         if self.filename:
             self.close_tc_frame()
             self.close_fa_frame()
@@ -106,12 +110,22 @@ class MainWindow(QMainWindow):
 
     def save_to_file(self):
         filename = QFileDialog.getSaveFileName(
-            self, dir=self.filename[:-3] + "pkl", filter="*.pkl"
+            self,
+            dir=os.path.splitext(self.filename)[0] + PROJECT_EXTENSION,
+            filter="*" + PROJECT_EXTENSION,
         )[0]
         if filename.strip():  # strip to avoid whitespace filenames
-            self.data.save_to_pickle(filename)
+            idealization_parameters = None
+            if (
+                self.tc_frame is not None
+                and self.tc_frame.current_tab.idealization_cache is not None
+            ):
+                idealization_parameters = (
+                    self.tc_frame.current_tab.idealization_cache.parameters
+                )
+            self.data.save_project(filename, idealization_parameters)
         else:
-            debug_logger.debug("Not saving to pickle - no filename given.")
+            debug_logger.debug("Not saving project - no filename given.")
 
     def launch_idealization(self):
         self.close_fa_frame()
@@ -0,0 +1,95 @@
+import logging
+
+from PySide2 import QtCore
+from PySide2.QtWidgets import QDialog, QGridLayout
+import pyqtgraph as pg
+
+
+debug_logger = logging.getLogger("ascam.debug")
+
+
+class OverviewImage(pg.ImageItem):
+    """Image item that reports the row of the image that is clicked."""
+
+    def __init__(self, on_click, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_click = on_click
+
+    def mouseClickEvent(self, event):
+        if event.button() != QtCore.Qt.LeftButton:
+            return
+        event.accept()
+        # in item coordinates a pixel is one unit, the image is transposed so
+        # that rows of the overview are along y
+        self.on_click(int(event.pos().y()))
+
+
+class OverviewFrame(QDialog):
+    """All episodes of the current series as one image, time along x and
+    episodes along y. Clicking on a row shows that episode in the main
+    window."""
+
+    def __init__(self, main):
+        super().__init__()
+        self.main = main
+        self.setWindowTitle("Series Overview")
+        self.layout = QGridLayout()
+        self.setLayout(self.layout)
+
+        height = 800
+        width = 1200
+        self.setGeometry(main.x() + width / 4, main.y() + height / 3, width, height)
+
+        self.overview = None
+        self.create_widgets()
+        self.update_image()
+
+        self.main.ep_frame.series_selection.currentTextChanged.connect(
+            self.update_image, type=QtCore.Qt.QueuedConnection
+        )
+        self.main.ep_frame.ep_list.currentItemChanged.connect(
+            self.mark_episode, type=QtCore.Qt.QueuedConnection
+        )
+        self.setModal(False)
+        self.show()
+
+    def create_widgets(self):
+        self.graphics = pg.GraphicsLayoutWidget()
+        self.layout.addWidget(self.graphics)
+        self.plot = self.graphics.addPlot()
+        self.plot.setLabel("bottom", "time", units="s")
+        self.plot.setLabel("left", "Episode (row in series)")
+        self.plot.invertY(True)
+        self.image = OverviewImage(self.jump_to_row, autoDownsample=True)
+        self.plot.addItem(self.image)
+        self.histogram = pg.HistogramLUTItem()
+        self.histogram.setImageItem(self.image)
+        self.graphics.addItem(self.histogram)
+        self.episode_line = pg.InfiniteLine(angle=0, pen=pg.mkPen("r"))
+        self.plot.addItem(self.episode_line)
+
+    def update_image(self, *args):
+        self.overview = self.main.data.series_overview()
+        image = self.overview.image
+        debug_logger.debug(f"drawing {self.overview}")
+        self.image.setImage(image.T)
+        t_start, t_stop = self.overview.time_range
+        self.image.setRect(
+            QtCore.QRectF(t_start, 0, t_stop - t_start, max(image.shape[0], 1))
+        )
+        self.mark_episode()
+
+    def mark_episode(self, *args):
+        series = self.main.data.series
+        if self.overview is None or self.overview.series is not series:
+            return
+        row = series.position(self.main.data.current_ep_ind)
+        self.episode_line.setValue(row + 0.5)
+
+    def jump_to_row(self, row):
+        n_episode = self.overview.episode(row)
+        if n_episode is None:
+            return
+        debug_logger.debug(f"overview selected episode {n_episode} in row {row}")
+        # changing the current row updates the episode and the plots
+        self.main.ep_frame.ep_list.setCurrentRow(row)
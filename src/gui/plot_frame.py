@@ -5,7 +5,9 @@ from PySide2.QtWidgets import QWidget, QGridLayout
 import numpy as np
 import pyqtgraph as pg
 
-from ..utils import clear_qt_layout
+from ..utils import clear_qt_layout, LRUCache
+from ..core.decimation import MinMaxPyramid
+from ..constants import PLOT_CACHE_BYTES
 
 GREEN = (70, 250, 150)
 ORANGE = (255, 153, 0)
@@ -37,6 +39,10 @@ class PlotFrame(QWidget):
         self.tc_tracking = False
         self.fa_tracking = False
 
+        # min/max pyramids of the plotted signals keyed by datakey, episode
+        # and channel, only what fits on the screen is handed to the plots
+        self.pyramids = LRUCache(max_bytes=PLOT_CACHE_BYTES)
+
         self.init_plots()
         self.init_hist()
 
@@ -71,6 +77,9 @@ class PlotFrame(QWidget):
         self.main.show_piezo.setChecked(val)
 
     def init_plots(self):
+        # the plotted data, updated with `setData` when the episode or the
+        # visible range changes
+        self.lines = dict()
         self.trace_viewbox = CustomHorizontalViewBox(self)
         self.trace_plot = pg.PlotWidget(viewBox=self.trace_viewbox, name=f"trace")
         self.trace_plot.setBackground("w")
@@ -80,6 +89,7 @@ class PlotFrame(QWidget):
         self.layout.setRowStretch(ind, 2)
         self.layout.setColumnStretch(0, 2)
         self.layout.setColumnStretch(1, 1)
+        self.trace_viewbox.sigXRangeChanged.connect(self.refine_lines)
 
         ind += 1
         if self.show_piezo:
@@ -130,6 +140,8 @@ class PlotFrame(QWidget):
 
     def plot_all(self):
         debug_logger.debug(f"redoing all plots for {self.main.data.current_datakey}")
+        # the data may have been changed by processing
+        self.pyramids.clear()
         self.clear_plots()
         self.clear_hist()
         self.draw_series_hist()
@@ -187,31 +199,87 @@ class PlotFrame(QWidget):
         self.hist.getAxis("bottom").setRange(0, self.hist_y_range[1])
 
     def plot_episode(self):
+        episode = self.main.data.episode()
         debug_logger.debug(
-            f"plotting episode {self.main.data.episode().n_episode} of series {self.main.data.current_datakey}"
+            f"plotting episode {episode.n_episode} of series {self.main.data.current_datakey}"
         )
         pen = pg.mkPen(color="b")
-        self.trace_line = self.trace_plot.plot(
-            self.main.data.episode().time, self.main.data.episode().trace, pen=pen
-        )
+        self.set_line("trace", self.trace_plot, episode.time, episode.trace, pen)
         if (
             self.main.tc_frame is not None
             and self.main.tc_frame.idealization() is not None
         ):
             id_pen = pg.mkPen(color=ORANGE)
-            self.trace_plot.plot(
-                self.main.tc_frame.time(), self.main.tc_frame.idealization(), pen=id_pen
+            self.set_steps(
+                "idealization",
+                self.trace_plot,
+                self.main.tc_frame.idealization(),
+                id_pen,
             )
+        else:
+            self.remove_line("idealization")
         if self.show_command:
-            self.command_plot.plot(
-                self.main.data.episode().time, self.main.data.episode().command, pen=pen
+            self.set_line(
+                "command", self.command_plot, episode.time, episode.command, pen
             )
         if self.show_piezo:
-            self.piezo_plot.plot(
-                self.main.data.episode().time, self.main.data.episode().piezo, pen=pen
-            )
+            self.set_line("piezo", self.piezo_plot, episode.time, episode.piezo, pen)
         self.set_viewbox_limits()
 
+    def pyramid(self, channel, time, data):
+        """Return the `MinMaxPyramid` of a signal of the current episode."""
+        key = (self.main.data.current_datakey, self.main.data.current_ep_ind, channel)
+        pyramid = self.pyramids.get(key)
+        if pyramid is None or not _same_data(pyramid.data, data):
+            pyramid = MinMaxPyramid(time, data)
+            self.pyramids.put(key, pyramid)
+        return pyramid
+
+    def set_line(self, name, plot, time, data, pen):
+        """Show a signal in a plot, the line is created the first time and
+        updated with the envelope of the visible range afterwards."""
+        pyramid = self.pyramid(name, time, data)
+        line = self.lines.get(name, (None, None))[0]
+        if line is None or line.getViewBox() is None:
+            line = plot.plot(pen=pen)
+        else:
+            line.setPen(pen)
+        self.lines[name] = (line, pyramid)
+        line.setData(*pyramid.envelope(*self.visible_range(), self.n_pixels()))
+
+    def set_steps(self, name, plot, idealization, pen):
+        """Show an `RLEIdealization` as a line through the ends of its runs,
+        which needs two points per run at any zoom level."""
+        line = self.lines.get(name, (None, None))[0]
+        if line is None or line.getViewBox() is None:
+            line = plot.plot(pen=pen)
+        else:
+            line.setPen(pen)
+        self.lines[name] = (line, None)
+        line.setData(*idealization.outline())
+
+    def remove_line(self, name):
+        line = self.lines.pop(name, None)
+        if line is not None and line[0].getViewBox() is not None:
+            line[0].getViewBox().removeItem(line[0])
+
+    def visible_range(self):
+        """The visible time range, None if the whole episode is shown."""
+        if self.trace_viewbox.autoRangeEnabled()[0]:
+            return None, None
+        return self.trace_viewbox.viewRange()[0]
+
+    def n_pixels(self):
+        return max(int(self.trace_viewbox.width()), 100)
+
+    def refine_lines(self, *args):
+        """Replace the data of the lines by the envelope of the visible
+        range, called when the view is zoomed or panned."""
+        t_start, t_stop = self.visible_range()
+        for line, pyramid in self.lines.values():
+            if pyramid is not None and line.getViewBox() is not None:
+                line.setData(*pyramid.envelope(t_start, t_stop, self.n_pixels()))
+
     def set_viewbox_limits(self):
         time_max = np.max(self.main.data.episode().time)
         time_min = np.min(self.main.data.episode().time)
@@ -248,6 +316,12 @@ class PlotFrame(QWidget):
             xMin=-0.05, xMax=1.05, yMin=trace_min, yMax=trace_max
         )
 
+    def time_limits(self):
+        """First and last time point of the episode, horizontal lines need
+        no more points."""
+        time = self.main.data.episode().time
+        return np.array([time[0], time[-1]])
+
     def plot_fa_threshold(self, threshold):
         debug_logger.debug(f"plotting first activation threshold at {threshold}")
         pen = pg.mkPen(
@@ -255,7 +329,7 @@ class PlotFrame(QWidget):
         )
         self.clear_fa_threshold()
 
-        time = self.main.data.episode().time
+        time = self.time_limits()
         hist_x = np.arange(
             np.min([*self.hist_y_range]), np.max([*self.hist_y_range]), 0.1
         )
@@ -303,7 +377,7 @@ class PlotFrame(QWidget):
         self.clear_theta_lines()
         self.theta_lines = []
         self.theta_hist_lines = []
-        time = self.main.data.episode().time
+        time = self.time_limits()
         hist_x = np.arange(
             np.min([*self.hist_y_range]), np.max([*self.hist_y_range]), 0.1
         )
@@ -323,7 +397,7 @@ class PlotFrame(QWidget):
         self.clear_amp_lines()
         self.amp_lines = []
         self.amp_hist_lines = []
-        time = self.main.data.episode().time
+        time = self.time_limits()
         hist_x = np.arange(
             np.min([*self.hist_y_range]), np.max([*self.hist_y_range]), 0.1
         )
@@ -336,7 +410,7 @@ class PlotFrame(QWidget):
             )
 
     def plot_tc_params(self):
-        amps, thresh, resolution, intrp_factor = self.main.tc_frame.get_params()
+        amps, thresh = self.main.tc_frame.read_params()[:2]
         if self.main.tc_frame.current_tab.show_amp_check.isChecked():
             self.plot_amp_lines(amps)
         else:
@@ -352,12 +426,20 @@ class PlotFrame(QWidget):
 
     def clear_plots(self):
         debug_logger.debug(f"clearing plots")
-        self.trace_plot.clear()
+        self.clear_plot(self.trace_plot)
         self.clear_tc_lines()
         if self.show_command and self.command_plot is not None:
-            self.command_plot.clear()
+            self.clear_plot(self.command_plot)
         if self.show_piezo and self.piezo_plot is not None:
-            self.piezo_plot.clear()
+            self.clear_plot(self.piezo_plot)
+
+    def clear_plot(self, plot):
+        """Remove all items from a plot except the lines of the data, which
+        are reused by the next episode."""
+        lines = [line for line, _ in self.lines.values()]
+        for item in list(plot.getPlotItem().items):
+            if not any(item is line for line in lines):
+                plot.removeItem(item)
 
     def clear_tc_lines(self):
         self.clear_amp_lines()
@@ -403,6 +485,14 @@ class PlotFrame(QWidget):
         self.draw_episode_hist()
 
 
+def _same_data(a, b):
+    """Check whether two arrays are views of the same memory."""
+    return (
+        a.shape == b.shape
+        and a.__array_interface__["data"][0] == b.__array_interface__["data"][0]
+    )
+
+
 class CustomViewBox(pg.ViewBox):
     def __init__(self, parent, *args, **kwds):
         pg.ViewBox.__init__(self, *args, **kwds)
@@ -420,6 +510,8 @@ class CustomViewBox(pg.ViewBox):
             if self.parent.tc_tracking:
                 pos = self.mapSceneToView(ev.pos()).y()
                 self.parent.main.tc_frame.track_cursor(pos)
+                if ev.isFinish():
+                    self.parent.main.tc_frame.finish_drag()
             elif self.parent.fa_tracking:
                 pos = self.mapSceneToView(ev.pos()).y()
                 self.parent.main.fa_frame.drag_fa_threshold(pos)
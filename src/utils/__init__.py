@@ -5,9 +5,12 @@ from .tools import (
     piezo_selection,
     update_number_in_string,
     interval_selection,
+    interval_indices,
+    select_indices,
     round_off_tables,
     parse_filename,
     array_to_string,
     string_to_array,
 )
+from .cache import LRUCache
 from .logging_setup import initialize_logger
@@ -0,0 +1,122 @@
+import logging
+import threading
+from collections import OrderedDict
+
+
+debug_logger = logging.getLogger("ascam.debug")
+
+
+def _nbytes(value):
+    """Size of a cached value, arrays report their buffer size and tuples
+    or lists of arrays the sum of those."""
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(v) for v in value)
+    return getattr(value, "nbytes", 0)
+
+
+class LRUCache:
+    """Mapping that forgets the least recently used entries.
+
+    The cache can be bounded by the number of entries, by the total size of
+    the values in bytes or both. An entry that is larger than the whole
+    memory budget is not stored at all. The cache may be used from several
+    threads."""
+
+    def __init__(self, max_items=None, max_bytes=None, sizeof=_nbytes):
+        """Create an empty cache.
+
+        Parameters:
+            max_items [int] - maximum number of entries, unbounded if None
+            max_bytes [int] - maximum total size of the values, unbounded
+                if None
+            sizeof [function] - returns the size of a value in bytes"""
+
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        return (
+            f"LRUCache({len(self)} entries, {self.nbytes} bytes, "
+            f"max_items={self.max_items}, max_bytes={self.max_bytes})"
+        )
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries.keys())
+
+    def get(self, key, default=None):
+        """Return the value stored under `key` and mark it as recently used."""
+        with self._lock:
+            try:
+                value, _ = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entries if the
+        cache is full."""
+        size = self.sizeof(value)
+        with self._lock:
+            self.pop(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                debug_logger.debug(
+                    f"not caching {key}, {size} bytes exceed the budget"
+                )
+                return
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            self._evict()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            try:
+                value, size = self._entries.pop(key)
+            except KeyError:
+                return default
+            self.nbytes -= size
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def resize(self, max_items=None, max_bytes=None):
+        """Change the bounds of the cache, evicting entries if necessary."""
+        with self._lock:
+            self.max_items = max_items
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self):
+        while self._entries and (
+            (self.max_items is not None and len(self._entries) > self.max_items)
+            or (self.max_bytes is not None and self.nbytes > self.max_bytes)
+        ):
+            _, (_, size) = self._entries.popitem(last=False)
+            self.nbytes -= size
@@ -34,12 +34,14 @@ def parse_filename(filename):
         filetype_long = "matlab"
     elif filetype == "pkl":
         filetype_long = "pickle"
+    elif filetype == "ascam":
+        filetype_long = "ascam project"
     elif filetype in ("txt", "axgt"):
         filetype = "tdt"
         filetype_long = "tab-delimited-text"
     else:
         raise Exception(
-            "Uknown filetype, can only read '.mat', '.axg*', '.csv', '.pkl'"
+            "Uknown filetype, can only read '.mat', '.axg*', '.csv', '.pkl', '.ascam'"
         )
     filename = filename[slash + 1 :]
     return filetype, path, filetype_long, filename
@@ -85,17 +87,39 @@ def interval_selection(time, signal, intervals, fs):
     return the signal at the times specified in the interval
     the function assumes `time` and `intervals` to have the same units and
     fs to have the reciprocal unit (eg. s, s and hz)
+    `signal` can be a 2D block with one episode per row, then the same
+    samples are selected from every row
+    a single interval selects a view of the data, several intervals are
+    concatenated into one array
     """
-    time_out = []
-    signal_out = []
-    if isinstance(intervals[0], (np.ndarray, list)):
-        for ival in intervals:
-            time_out.extend(time[int(ival[0] * fs) : int(ival[-1] * fs)])
-            signal_out.extend(signal[int(ival[0] * fs) : int(ival[-1] * fs)])
-    elif isinstance(intervals[0], (float, int)):
-        time_out = time[int(intervals[0] * fs) : int(intervals[-1] * fs)]
-        signal_out = signal[int(intervals[0] * fs) : int(intervals[1] * fs)]
-    return time_out, signal_out
+    indices = interval_indices(intervals, fs)
+    return select_indices(time, indices), select_indices(signal, indices)
+
+
+def interval_indices(intervals, fs):
+    """
+    convert an interval or a list of intervals to a list of (start, stop)
+    pairs of sample indices, stop is exclusive
+    """
+    if not len(intervals):
+        return []
+    if isinstance(intervals[0], (np.ndarray, list, tuple)):
+        return [(int(ival[0] * fs), int(ival[-1] * fs)) for ival in intervals]
+    return [(int(intervals[0] * fs), int(intervals[-1] * fs))]
+
+
+def select_indices(array, indices):
+    """
+    select the samples in the (start, stop) ranges from the last axis of an
+    array, a single range gives a view
+    """
+    if len(indices) == 1:
+        start, stop = indices[0]
+        return array[..., start:stop]
+    return np.concatenate(
+        [array[..., start:stop] for start, stop in indices] or [array[..., :0]],
+        axis=-1,
+    )
 
 
 def update_number_in_string(new_val, string):
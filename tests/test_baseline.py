@@ -0,0 +1,62 @@
+import pytest
+import numpy as np
+
+from src.core.analysis import baseline_correction_series
+
+
+def reference_correction(time, signal, selected, method, degree):
+    t, s = time[selected], signal[selected]
+    if method == "offset":
+        return signal - np.mean(s)
+    return signal - np.polyval(np.polyfit(t, s, degree), time)
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(4)
+    n_episodes, n_samples = 12, 500
+    time = np.arange(n_samples) / 1e4
+    signals = rng.normal(0, 1, (n_episodes, n_samples)) + 50 * time ** 2
+    piezo = np.zeros((n_episodes, n_samples))
+    # two groups of episodes with different piezo selections
+    piezo[::2, 100:300] = 5
+    piezo[1::2, 200:450] = 5
+    return time, signals, piezo
+
+
+@pytest.mark.parametrize("method", ["Polynomial", "offset"])
+@pytest.mark.parametrize("degree", [1, 2, 4])
+@pytest.mark.parametrize("selection", ["piezo", "intervals", "none"])
+def test_batched_correction_equals_per_episode_fits(data, method, degree, selection):
+    time, signals, piezo = data
+    intervals = [[0, 0.005], [0.03, 0.04]]
+    corrected = baseline_correction_series(
+        signals,
+        piezo,
+        time,
+        1e4,
+        intervals=intervals,
+        degree=degree,
+        method=method,
+        selection=selection,
+        active=True,
+    )
+    for signal, episode_piezo, result in zip(signals, piezo, corrected):
+        if selection == "piezo":
+            selected = episode_piezo > 4
+        elif selection == "intervals":
+            selected = np.zeros(time.size, dtype=bool)
+            selected[0:50] = selected[300:400] = True
+        else:
+            selected = np.ones(time.size, dtype=bool)
+        np.testing.assert_allclose(
+            result,
+            reference_correction(time, signal, selected, method.lower(), degree),
+            atol=1e-9,
+        )
+
+
+def test_unknown_method_raises(data):
+    time, signals, piezo = data
+    with pytest.raises(ValueError):
+        baseline_correction_series(signals, piezo, time, method="spline")
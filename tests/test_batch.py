@@ -0,0 +1,68 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.core import Recording, Series
+from src.batch import load_pipeline, run_pipeline
+
+
+PIPELINE = {
+    "steps": [
+        {"step": "gauss_filter", "filter_freq": 2000},
+        {"step": "idealize", "amplitudes": [0, -1], "trace_unit": "pA"},
+        {"step": "export_events", "time_unit": "ms"},
+        {"step": "detect_first_activation", "threshold": -0.5, "trace_unit": "pA"},
+        {"step": "export_first_activation"},
+        {"step": "save_project"},
+    ]
+}
+
+
+@pytest.fixture
+def projects(tmp_path):
+    rng = np.random.default_rng(11)
+    time = np.arange(2000) / 4e4
+    paths = []
+    for n in range(3):
+        current = rng.normal(0, 0.05e-12, (5, 2000))
+        current[:, 600:1200] -= 1e-12
+        recording = Recording(f"recording{n}.mat")
+        recording["raw_"] = Series.from_arrays(time, list(current))
+        recording.lists = {"All": (list(range(5)), None)}
+        paths.append(recording.save_project(str(tmp_path / f"recording{n}")))
+    return paths
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_pipeline_writes_the_outputs_of_every_file(projects, tmp_path, n_workers):
+    output_dir = tmp_path / "results"
+    results = run_pipeline(PIPELINE, projects, str(output_dir), n_workers)
+    assert [error for _, _, error in results] == [None] * len(projects)
+    for n, (filename, outputs, _) in enumerate(results):
+        assert filename == projects[n]
+        assert len(outputs) == 3
+        events = pd.read_csv(output_dir / f"recording{n}_events.csv", skiprows=1)
+        # one opening per episode
+        assert (events["Amplitude [pA]"] == -1).sum() == 5
+        first = pd.read_csv(output_dir / f"recording{n}_first_activation.csv")
+        np.testing.assert_allclose(first["First Activation Time [ms]"], 15, atol=0.1)
+        loaded = Recording.from_file(outputs[-1])
+        assert loaded.current_datakey == "GFILTER2000_"
+        assert loaded.idealization_parameters is not None
+
+
+def test_failing_files_are_reported(projects, tmp_path):
+    results = run_pipeline(
+        PIPELINE, [projects[0], str(tmp_path / "missing.mat")], str(tmp_path), 1
+    )
+    assert results[0][2] is None
+    assert "missing.mat" in results[1][2]
+
+
+def test_unknown_steps_are_rejected(tmp_path):
+    path = tmp_path / "pipeline.json"
+    path.write_text(json.dumps({"steps": [{"step": "idealise"}]}))
+    with pytest.raises(ValueError, match="idealise"):
+        load_pipeline(str(path))
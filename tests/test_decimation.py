@@ -0,0 +1,61 @@
+import pytest
+import numpy as np
+
+from src.core import Series, SeriesExecutor
+from src.core.decimation import MinMaxPyramid, SeriesOverview
+
+
+@pytest.fixture
+def pyramid():
+    n_samples = 100003
+    time = np.arange(n_samples) / 1e5
+    data = np.random.default_rng(5).normal(size=n_samples)
+    return MinMaxPyramid(time, data)
+
+
+@pytest.mark.parametrize("n_pixels", [10, 500, 2000])
+@pytest.mark.parametrize("t_range", [(None, None), (0.1, 0.35), (0.9, 2.0)])
+def test_envelope_keeps_the_extrema_of_the_range(pyramid, n_pixels, t_range):
+    time, data = pyramid.envelope(*t_range, n_pixels=n_pixels)
+    start, stop = t_range
+    start = 0 if start is None else start
+    stop = np.inf if stop is None else stop
+    visible = (pyramid.time >= start) & (pyramid.time < stop)
+    assert data.max() >= pyramid.data[visible].max()
+    assert data.min() <= pyramid.data[visible].min()
+    # about two points per pixel, the bins are at most `factor` times finer
+    assert time.size <= 2 * pyramid.factor * (n_pixels + 2) + 2
+    assert time[0] == pyramid.time[0]
+    assert np.all(np.diff(time) >= 0)
+
+
+def test_short_ranges_show_the_samples(pyramid):
+    time, data = pyramid.envelope(0.5, 0.501, n_pixels=1000)
+    selected = (pyramid.time >= time[1]) & (pyramid.time <= time[-2])
+    np.testing.assert_array_equal(data[1:-1], pyramid.data[selected])
+
+
+def test_levels_hold_the_extrema_of_their_bins(pyramid):
+    level = 3
+    size = pyramid.factor ** level
+    bins = pyramid.data[: size * 10].reshape(10, size)
+    np.testing.assert_array_equal(pyramid.mins[level][:10], bins.min(axis=1))
+    np.testing.assert_array_equal(pyramid.maxs[level][:10], bins.max(axis=1))
+
+
+@pytest.mark.parametrize("backend", [None, "serial", "thread"])
+@pytest.mark.parametrize("n_columns", [7, 100, 5000])
+def test_overview_rows_are_bin_means_of_the_episodes(backend, n_columns):
+    rng = np.random.default_rng(5)
+    traces = rng.normal(0, 1, (12, 1000))
+    series = Series.from_arrays(np.arange(1000) / 4e4, list(traces))
+    executor = None if backend is None else SeriesExecutor(backend, 2)
+    overview = SeriesOverview(series, n_columns, executor)
+    n_columns = min(n_columns, 1000)
+    assert overview.image.shape == (12, n_columns)
+    edges = np.linspace(0, 1000, n_columns + 1).astype(int)
+    for row, trace in enumerate(traces):
+        means = [trace[a:b].mean() for a, b in zip(edges[:-1], edges[1:])]
+        np.testing.assert_allclose(overview.image[row], means, rtol=1e-5, atol=1e-6)
+    assert overview.episode(3) == series.n_episodes[3]
+    assert overview.episode(12) is None
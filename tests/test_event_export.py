@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.core import Recording, Series, IdealizationCache
+from src.core.event_export import read_events
+from src.utils import round_off_tables
+
+
+@pytest.fixture
+def cache():
+    rng = np.random.default_rng(8)
+    n_episodes, n_samples = 10, 1000
+    time = np.arange(n_samples) / 4e4
+    current = rng.normal(0, 0.3e-12, (n_episodes, n_samples))
+    current[:, 300:700] -= 1e-12
+    recording = Recording("test.mat")
+    recording["raw_"] = Series.from_arrays(time, list(current))
+    return IdealizationCache(recording, np.array([0, -1e-12]), None, None, 1)
+
+
+def pandas_export(cache, time_unit, trace_unit):
+    """The events as the table was exported with pandas before."""
+    parameters = (
+        f"amplitudes = {cache.amplitudes} [A];"
+        + f"thresholds = {cache.thresholds} [A];"
+        + f"resolution = {cache.resolution} [s];"
+        + f"interpolation_factor = {cache.interpolation_factor}\n"
+    )
+    header = [
+        "Episode Number",
+        f"Amplitude [{trace_unit}]",
+        f"Duration [{time_unit}]",
+        f"t_start [{time_unit}]",
+        f"t_stop [{time_unit}]",
+    ]
+    table = pd.DataFrame(cache.get_events(time_unit, trace_unit), columns=header)
+    table = round_off_tables(
+        table, ["int", trace_unit, time_unit, time_unit, time_unit]
+    )
+    return parameters + table.to_csv()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 64])
+def test_csv_export_equals_the_pandas_table(cache, tmp_path, chunk_size):
+    path = cache.export_events(str(tmp_path / "events"), "ms", "pA", chunk_size)
+    assert path.endswith("events.csv")
+    assert cache.data.series.idealized.all()
+    with open(path) as file:
+        exported = file.read()
+    assert exported == pandas_export(cache, "ms", "pA")
+
+
+def test_csv_header_names_the_refinement_when_it_is_set(cache, tmp_path):
+    cache.refinement = "linear"
+    path = cache.export_events(str(tmp_path / "events.csv"))
+    with open(path) as file:
+        parameters = file.readline()
+    assert parameters.startswith("amplitudes = [ 0.e+00 -1.e-12] [A];")
+    assert parameters.endswith(";interpolation_factor = 1;refinement = linear\n")
+
+
+@pytest.mark.parametrize("mmap_mode", [None, "r"])
+def test_binary_export_round_trip(cache, tmp_path, mmap_mode):
+    path = cache.export_events(str(tmp_path / "events.events"), chunk_size=4)
+    events = read_events(path, mmap_mode)
+    table = cache.event_table()
+    np.testing.assert_array_equal(events.records, table.records)
+    np.testing.assert_allclose(events.amplitudes, table.amplitudes)
+    np.testing.assert_allclose(events.time, table.time)
+    np.testing.assert_allclose(events.to_array("us", "pA"), table.to_array("us", "pA"))
+
+
+@pytest.mark.parametrize("extension", [".parquet", ".feather"])
+def test_arrow_export(cache, tmp_path, extension):
+    pytest.importorskip("pyarrow")
+    path = cache.export_events(str(tmp_path / ("events" + extension)), chunk_size=4)
+    if extension == ".parquet":
+        exported = pd.read_parquet(path)
+    else:
+        exported = pd.read_feather(path)
+    np.testing.assert_allclose(exported.to_numpy(), cache.get_events("us", "pA"))
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from src.core.analysis import Idealizer
+from src.core.events import EventTable, RLEIdealization, EVENT_DTYPE
+
+
+traces = [
+    np.array([1, 1, 2, 1, 1, 1], dtype=float),
+    np.array([2, 1, 1, 2, 2, 3, 3], dtype=float),
+    np.array([3, 3, 3], dtype=float),
+]
+
+
+@pytest.mark.parametrize("trace", traces)
+def test_event_table_matches_extract_events(trace):
+    time = np.arange(len(trace)) * 0.5
+    amplitudes = np.array([3, 2, 1], dtype=float)
+    table = EventTable.from_idealization(trace, amplitudes, time, n_episode=4)
+    assert table.records.dtype == EVENT_DTYPE
+    events = Idealizer.extract_events(trace, time)
+    np.testing.assert_array_equal(table.amplitude, events[:, 0])
+    np.testing.assert_allclose(table.duration, events[:, 1])
+    np.testing.assert_array_equal(table.t_start, events[:, 2])
+    np.testing.assert_array_equal(table.t_stop, events[:, 3])
+    assert np.all(table.episode == 4)
+
+
+def test_concatenate_and_select():
+    time = np.arange(7) * 1e-4
+    amplitudes = np.array([3, 2, 1], dtype=float)
+    tables = [
+        EventTable.from_idealization(trace, amplitudes, time[: len(trace)], n)
+        for n, trace in enumerate(traces)
+    ]
+    table = EventTable.concatenate(tables, time=time)
+    assert len(table) == sum(len(t) for t in tables)
+    np.testing.assert_array_equal(table.episode, [0, 0, 0, 1, 1, 1, 1, 2])
+    selected = table[table.level == 0]
+    np.testing.assert_array_equal(selected.n_samples, [2, 3])
+    array = table.to_array(time_unit="ms", trace_unit="A")
+    assert array.shape == (len(table), 5)
+    np.testing.assert_allclose(array[:, 2], table.n_samples * 0.1)
+
+
+@pytest.mark.parametrize("trace", traces)
+def test_rle_idealization_renders_the_trace(trace):
+    time = np.arange(len(trace)) * 0.5
+    amplitudes = np.array([3, 2, 1], dtype=float)
+    rle = RLEIdealization.from_dense(trace, amplitudes, time)
+    np.testing.assert_array_equal(np.asarray(rle), trace)
+    np.testing.assert_array_equal(rle * 2, trace * 2)
+    for start, stop in [(0, 2), (1, 5), (2, 3), (-2, None)]:
+        np.testing.assert_array_equal(rle[start:stop], trace[start:stop])
+    table = EventTable.from_idealization(trace, amplitudes, time, n_episode=2)
+    np.testing.assert_array_equal(rle.records(2), table.records)
+    outline_time, outline = rle.outline()
+    np.testing.assert_array_equal(np.interp(time, outline_time, outline), trace)
+
+
+def test_rle_from_levels_and_runs_agree():
+    levels = np.array([0, 0, 1, 1, 1, 0, 2], dtype=np.int8)
+    amplitudes = np.array([0, -1, -2.0])
+    rle = RLEIdealization.from_levels(levels, amplitudes)
+    np.testing.assert_array_equal(rle.starts, [0, 2, 5, 6])
+    np.testing.assert_array_equal(rle.lengths, [2, 3, 1, 1])
+    runs = RLEIdealization.from_runs(rle.levels, rle.lengths, amplitudes)
+    np.testing.assert_array_equal(np.asarray(runs), amplitudes[levels])
+    assert rle.nbytes < amplitudes[levels].nbytes
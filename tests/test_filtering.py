@@ -0,0 +1,55 @@
+import pytest
+import numpy as np
+
+from src.core.filtering import (
+    ChungKennedyFilter,
+    VectorizedChungKennedyFilter,
+    gaussian_filter,
+    gaussian_filter_series,
+    select_convolution_method,
+)
+
+
+@pytest.mark.parametrize("method", ["direct", "fft", "overlap-add", "auto"])
+@pytest.mark.parametrize("filter_frequency", [100, 1000, 15000])
+def test_gaussian_filter_series(method, filter_frequency):
+    signals = np.random.default_rng(0).normal(size=(5, 3000))
+    out = gaussian_filter_series(signals, filter_frequency, 4e4, method=method)
+    expected = [gaussian_filter(s, filter_frequency, 4e4) for s in signals]
+    assert out.shape == signals.shape
+    assert np.allclose(out, expected, rtol=0, atol=1e-12)
+
+
+def test_select_convolution_method():
+    assert select_convolution_method(3, 1000) == "direct"
+    assert select_convolution_method(201, 1000) == "fft"
+    assert select_convolution_method(201, 10 ** 6) == "overlap-add"
+
+
+ck_parameters = [
+    # (window_lengths, weight_exponent, weight_window, boundary_mode, scale)
+    ([4, 8, 16, 32], 2, 64, "increasing", 1),
+    ([3, 5], 1, 7, "increasing", 1),
+    ([1, 2, 10], 4, 3, "padded", 1),
+    ([4, 8], 2, 16, "increasing", 1e-12),
+]
+
+
+@pytest.mark.parametrize(
+    "window_lengths, weight_exponent, weight_window, mode, scale", ck_parameters
+)
+def test_vectorized_ck_filter_matches_loops(
+    window_lengths, weight_exponent, weight_window, mode, scale
+):
+    rng = np.random.default_rng(1)
+    data = scale * (rng.normal(size=(3, 500)) + (rng.random((3, 500)) < 0.4))
+    apriori = list(rng.random(len(window_lengths)) + 0.5)
+    reference = ChungKennedyFilter(
+        window_lengths, weight_exponent, weight_window, apriori, apriori, mode
+    )
+    vectorized = VectorizedChungKennedyFilter(
+        window_lengths, weight_exponent, weight_window, apriori, apriori, mode
+    )
+    expected = np.array([reference.apply_filter(row) for row in data])
+    assert np.allclose(vectorized.apply_filter(data), expected, rtol=1e-8, atol=0)
+    assert np.allclose(vectorized.apply_filter(data[0]), expected[0], rtol=1e-8, atol=0)
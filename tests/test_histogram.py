@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from src.core import Recording, Series
+from src.core.histogram import SeriesHistogram, bin_sorted
+from src.utils import piezo_selection, LRUCache
+
+
+@pytest.fixture
+def recording():
+    rng = np.random.default_rng(3)
+    n_episodes, n_samples = 20, 2000
+    time = np.arange(n_samples) / 4e4
+    current = rng.normal(0, 1, (n_episodes, n_samples))
+    piezo = np.zeros((n_episodes, n_samples))
+    piezo[:, 500:1500] = 5
+    recording = Recording("test.mat")
+    recording["raw_"] = Series.from_arrays(time, list(current), piezo=list(piezo))
+    recording.lists = {
+        "All": (list(range(n_episodes)), None),
+        "some": ([1, 4, 9], None),
+    }
+    return recording
+
+
+@pytest.mark.parametrize("n_bins", [1, 7, 50, 301])
+def test_bin_sorted_equals_np_histogram(n_bins):
+    samples = np.random.default_rng(n_bins).normal(0, 1, 10000)
+    edges = np.histogram_bin_edges(samples, n_bins)
+    np.testing.assert_array_equal(
+        bin_sorted(np.sort(samples), edges), np.histogram(samples, n_bins)[0]
+    )
+
+
+@pytest.mark.parametrize("select_piezo", [True, False])
+def test_series_hist_equals_histogram_of_all_samples(recording, select_piezo):
+    series = recording.series
+    if select_piezo:
+        samples = [
+            piezo_selection(series.time, e.piezo, e.trace)[1] for e in series
+        ]
+    else:
+        samples = [e.trace for e in series]
+    for n_bins in (50, 120):
+        heights, bins = np.histogram(np.concatenate(samples), n_bins)
+        result = recording.series_hist(select_piezo=select_piezo, n_bins=n_bins)
+        np.testing.assert_array_equal(result[0], heights)
+        np.testing.assert_allclose(result[1], bins)
+
+
+def test_adding_and_subtracting_episodes(recording):
+    histogram = SeriesHistogram(recording.series, select_piezo=False)
+    histogram.subtract([3, 5])
+    expected = histogram.counts[[i for i in range(20) if i not in (3, 5)]]
+    np.testing.assert_array_equal(histogram.histogram()[0], expected.sum(axis=0))
+    histogram.add([3])
+    histogram.add([3])
+    assert histogram.histogram()[0].sum() == 19 * 2000
+
+    heights = recording.series_hist(select_piezo=False, lists=["some"])[0]
+    assert heights.sum() == 3 * 2000
+
+
+@pytest.mark.parametrize("max_bytes", [None, 10 * 2000 * 8])
+def test_samples_are_sorted_on_rebin_if_they_fit(recording, max_bytes):
+    cache = LRUCache(max_bytes=max_bytes)
+    histogram = SeriesHistogram(recording.series, select_piezo=False, cache=cache)
+    # the first histogram is counted without sorting
+    assert len(cache) == 0
+    histogram.rebin(30)
+    assert len(cache) == (20 if max_bytes is None else 0)
+    samples = recording.series.trace.ravel()
+    expected, edges = np.histogram(samples, 30)
+    np.testing.assert_array_equal(histogram.histogram()[0], expected)
+    np.testing.assert_allclose(histogram.edges, edges)
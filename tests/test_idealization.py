@@ -2,6 +2,7 @@ import pytest
 import numpy as np
 
 from src.core.idealization import Idealizer
+from src.core.analysis import episode_rng, interpolate, ChunkedSpline
 
 
 # (trace, events)
@@ -70,3 +71,127 @@ def test_extract_events(trace, events):
     print(out)
     print(events)
     assert np.all(out == events)
+
+
+@pytest.mark.parametrize(
+    "amplitudes, thresholds",
+    [
+        (np.array([0, -1, -2.0]), np.array([-0.5, -1.5])),
+        (np.array([0, -2, -1.0]), np.array([-1.6, -0.3])),
+        (np.array([0, -1.0]), None),
+        (np.array([1.0]), None),
+        (-np.arange(20.0), -np.arange(19.0) - 0.5),
+    ],
+)
+def test_classify_levels(amplitudes, thresholds):
+    signals = np.random.default_rng(0).normal(-1, 3, (3, 500))
+    levels = Idealizer.classify(signals, amplitudes, thresholds)
+    assert levels.dtype == np.int8 and levels.shape == signals.shape
+    if thresholds is None:
+        sorted_amps = np.sort(amplitudes)[::-1]
+        thresholds = (sorted_amps[1:] + sorted_amps[:-1]) / 2
+    # every sample lies between the thresholds around its level
+    bounds = np.r_[np.inf, np.sort(thresholds)[::-1], -np.inf]
+    assert np.all(signals < bounds[levels])
+    assert np.all(signals >= bounds[levels + 1])
+    np.testing.assert_array_equal(
+        Idealizer.threshold_crossing(signals[1], amplitudes, thresholds),
+        Idealizer.level_amplitudes(amplitudes)[levels[1]],
+    )
+
+
+@pytest.mark.parametrize("resolution", [2, 3.5, 6])
+def test_resolution_is_reproducible_with_seed(resolution):
+    rng = np.random.default_rng(4)
+    trace = np.repeat(rng.integers(0, 3, 400), rng.integers(1, 8, 400)).astype(float)
+    time = np.arange(trace.size) * 1e-4
+    first = Idealizer.apply_resolution(
+        trace, time, resolution * 1e-4, np.random.default_rng(11)
+    )
+    second = Idealizer.apply_resolution(
+        trace, time, resolution * 1e-4, np.random.default_rng(11)
+    )
+    np.testing.assert_array_equal(first, second)
+    values, starts, lengths = Idealizer.runs(first)
+    assert np.all(lengths >= resolution)
+    np.testing.assert_array_equal(np.repeat(values, lengths), first)
+
+
+def test_series_idealization_matches_episodes():
+    signals = np.random.default_rng(5).normal(-0.5, 0.6, (4, 1000))
+    time = np.arange(1000) * 1e-4
+    amplitudes = np.array([0, -1.0])
+    n_episodes = [3, 7, 8, 12]
+    series = Idealizer.idealize_series(
+        signals, time, amplitudes, resolution=5e-4, seed=42, n_episodes=n_episodes
+    )
+    for signal, n_episode, idealization in zip(signals, n_episodes, series):
+        expected, _ = Idealizer.idealize_episode(
+            signal,
+            time,
+            amplitudes,
+            resolution=5e-4,
+            rng=episode_rng(42, n_episode),
+        )
+        np.testing.assert_array_equal(idealization, expected)
+
+
+def test_resolved_runs_are_events():
+    signal = np.random.default_rng(9).normal(-0.5, 0.6, 2000)
+    time = np.arange(2000) * 1e-4
+    amplitudes = np.array([0, -1.0])
+    idealization, _ = Idealizer.idealize_episode(
+        signal, time, amplitudes, resolution=5e-4, rng=episode_rng(1, 0)
+    )
+    dense = Idealizer.apply_resolution(
+        Idealizer.threshold_crossing(signal, amplitudes),
+        time,
+        5e-4,
+        episode_rng(1, 0),
+    )
+    np.testing.assert_array_equal(idealization, dense)
+    # neighbouring runs merged by the resolution form one run
+    np.testing.assert_array_equal(idealization.starts, Idealizer.runs(dense)[1])
+
+
+@pytest.mark.parametrize("chunk_values", [7, 1000, 2**20])
+def test_chunked_interpolation_matches_full_spline(chunk_values):
+    signals = np.random.default_rng(3).normal(-0.5, 0.6, (3, 3000))
+    time = np.arange(3000) * 1e-4
+    amplitudes = np.array([0, -0.5, -1.0])
+    spline = ChunkedSpline(signals, time, chunk_size=500)
+    interpolated, id_time = interpolate(signals, time, 10)
+    np.testing.assert_allclose(spline(id_time), interpolated, atol=1e-12)
+    idealizations = Idealizer.classify_spline(
+        spline, id_time, amplitudes, chunk_values=chunk_values
+    )
+    for row, idealization in zip(interpolated, idealizations):
+        dense = Idealizer.threshold_crossing(row, amplitudes)
+        np.testing.assert_array_equal(idealization, dense)
+        np.testing.assert_array_equal(idealization.starts, Idealizer.runs(dense)[1])
+
+
+@pytest.mark.parametrize("method", ["linear", "cubic"])
+def test_refined_crossings_lie_between_samples(method):
+    # the sine crosses the threshold at multiples of 4 pi samples
+    position = np.arange(40.0)
+    signal = np.sin(position / 4) - 0.25
+    time = position * 1e-4
+    amplitudes = np.array([0.5, -1.0])
+    thresholds = np.array([-0.25])
+    idealization, _ = Idealizer.idealize_episode(
+        signal, time, amplitudes, thresholds, refinement=method
+    )
+    crossings = idealization.crossings[1:]
+    assert idealization.crossings[0] == 0
+    np.testing.assert_array_less(idealization.starts[1:] - 1, crossings + 1e-12)
+    np.testing.assert_array_less(crossings, idealization.starts[1:] + 1e-12)
+    exact = np.arange(1, 4) * 4 * np.pi
+    np.testing.assert_allclose(
+        crossings, exact, atol=0.01 if method == "linear" else 1e-3
+    )
+    resolved = Idealizer.resolve(idealization, time, 5e-4)
+    np.testing.assert_array_equal(
+        resolved.crossings,
+        idealization.crossings[np.isin(idealization.starts, resolved.starts)],
+    )
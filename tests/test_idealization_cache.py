@@ -0,0 +1,162 @@
+import numpy as np
+import pytest
+
+from src.core import Recording, Series, IdealizationCache
+from src.core.analysis import Idealizer
+
+
+@pytest.fixture
+def recording():
+    rng = np.random.default_rng(6)
+    n_episodes, n_samples = 5, 1000
+    states = rng.integers(0, 2, (n_episodes, n_samples // 10)).repeat(10, axis=1)
+    current = list(-states + rng.normal(0, 0.3, (n_episodes, n_samples)))
+    recording = Recording("test.mat")
+    recording["raw_"] = Series.from_arrays(
+        np.arange(n_samples) / 4e4, current, input_trace_unit="pA"
+    )
+    recording.lists = {"All": (list(range(n_episodes)), None)}
+    return recording
+
+
+def test_switching_parameters_restores_idealizations(recording):
+    amplitudes = np.array([0, -1e-12])
+    first = IdealizationCache(recording, amplitudes, None, 1e-4, 1)
+    first.idealize_series()
+    idealization = recording.series[2].idealization
+
+    second = IdealizationCache(recording, amplitudes, None, 2e-4, 1)
+    assert not recording.series.idealized.any()
+    second.idealize_episode(0)
+    np.testing.assert_array_equal(recording.series.idealized, [1, 0, 0, 0, 0])
+
+    IdealizationCache(recording, amplitudes, None, 1e-4, 1)
+    assert recording.series.idealized.all()
+    assert recording.series[2].idealization is idealization
+
+
+def test_replacing_a_series_invalidates_its_idealizations(recording):
+    cache = IdealizationCache(recording, np.array([0, -1e-12]), None, None, 1)
+    cache.idealize_series()
+    assert len(recording.idealization_store) == 5
+    recording["raw_"] = recording["raw_"].derive()
+    assert len(recording.idealization_store) == 0
+
+
+def test_activation_only_touches_the_current_series(recording):
+    recording["filtered_"] = recording["raw_"].derive()
+    amplitudes = np.array([0, -1e-12])
+    recording.current_datakey = "filtered_"
+    first = IdealizationCache(recording, amplitudes, None, None, 1)
+    first.idealize_series()
+    recording.current_datakey = "raw_"
+    second = IdealizationCache(recording, amplitudes, None, 1e-4, 1)
+    second.idealize_series()
+    # the other series keeps its episodes until it becomes current again
+    assert recording["filtered_"].idealized.all()
+    assert recording.idealization_keys == {"filtered_": first.key, "raw_": second.key}
+    recording.current_datakey = "filtered_"
+    second.activate()
+    assert not recording["filtered_"].idealized.any()
+    first.activate()
+    assert recording["filtered_"].idealized.all()
+
+
+def test_spline_is_reused_when_thresholds_change(recording):
+    amplitudes = np.array([0, -1e-12])
+    first = IdealizationCache(recording, amplitudes, None, None, 5)
+    first.idealize_episode(1)
+    spline = recording.splines.get(("raw_", 1))
+    assert spline is not None
+
+    second = IdealizationCache(recording, amplitudes, np.array([-0.3e-12]), None, 5)
+    second.idealize_episode(1)
+    assert recording.splines.get(("raw_", 1)) is spline
+    assert len(recording.series[1].idealization) == len(second.id_time())
+    recording["raw_"] = recording["raw_"].derive()
+    assert len(recording.splines) == 0
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_series_idealization_reuses_splines(recording, background):
+    amplitudes = np.array([0, -1e-12])
+    first = IdealizationCache(recording, amplitudes, None, None, 3)
+    if background:
+        first.start_background().wait()
+        first.collect()
+    else:
+        first.idealize_series()
+    splines = [recording.splines.get(("raw_", n)) for n in range(5)]
+    assert all(spline is not None for spline in splines)
+
+    thresholds = np.array([-0.3e-12])
+    second = IdealizationCache(recording, amplitudes, thresholds, None, 3)
+    if background:
+        second.start_background().wait()
+        second.collect()
+    else:
+        second.idealize_series()
+    for n, spline in enumerate(splines):
+        assert recording.splines.get(("raw_", n)) is spline
+    expected = Idealizer.idealize_series(
+        recording.series.trace, recording.series.time, amplitudes, thresholds, None, 3
+    )
+    for episode, idealization in zip(recording.series, expected):
+        np.testing.assert_array_equal(episode.idealization, idealization)
+
+
+def test_event_tables_use_refined_crossings(recording):
+    amplitudes = np.array([0, -1e-12])
+    plain = IdealizationCache(recording, amplitudes, None, None, 1).event_table()
+    cache = IdealizationCache(recording, amplitudes, None, None, 1, refinement="cubic")
+    events = cache.event_table()
+    np.testing.assert_array_equal(events.records, plain.records)
+    dt = recording.series.time[1] - recording.series.time[0]
+    assert not np.allclose(events.duration, plain.duration)
+    np.testing.assert_allclose(
+        events.duration.sum(), len(recording.series) * recording.series.n_samples * dt
+    )
+    np.testing.assert_array_less(np.abs(events.t_start - plain.t_start), dt + 1e-12)
+    heights, bins = cache.dwell_time_hist(-1e-12, n_bins=10, log_times=False)
+    expected, _ = np.histogram(events[events.level == 1].duration * 1e3, bins)
+    np.testing.assert_array_equal(heights, np.sqrt(expected))
+
+
+def test_background_idealization_matches_series(recording):
+    amplitudes = np.array([0, -1e-12])
+    cache = IdealizationCache(recording, amplitudes, None, 1e-4, 1)
+    worker = cache.start_background()
+    worker.wait(timeout=10)
+    assert worker.progress == 1
+    assert cache.collect() == 5
+    assert recording.series.idealized.all()
+    background = [e.idealization for e in recording.series]
+
+    cache.clear_idealization()
+    recording.idealization_store.clear()
+    cache.idealize_series()
+    for idealization, episode in zip(background, recording.series):
+        np.testing.assert_array_equal(idealization, episode.idealization)
+
+
+def test_background_idealization_stops_when_parameters_change(recording):
+    amplitudes = np.array([0, -1e-12])
+    cache = IdealizationCache(recording, amplitudes, None, None, 1)
+    worker = cache.start_background()
+    IdealizationCache(recording, amplitudes, None, 1e-4, 1)
+    worker.wait(timeout=10)
+    assert cache.collect() == 0
+    assert not recording.series.idealized.any()
+
+
+def test_foreground_episode_during_background_idealization(recording):
+    amplitudes = np.array([0, -1e-12])
+    cache = IdealizationCache(recording, amplitudes, None, 1e-4, 1)
+    worker = cache.start_background()
+    cache.idealize_episode(3)
+    foreground = recording.series[3].idealization
+    worker.wait(timeout=10)
+    cache.collect()
+    assert recording.series.idealized.all()
+    assert worker.n_done == 5
+    assert recording.series[3].idealization is foreground
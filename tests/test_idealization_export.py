@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from src.core import Recording, Series, IdealizationCache, read_events
+
+
+AMPLITUDES = np.array([0, -1e-12])
+
+
+@pytest.fixture
+def recording():
+    rng = np.random.default_rng(4)
+    n_episodes, n_samples = 6, 5000
+    time = np.arange(n_samples) / 4e4
+    current = rng.normal(0, 0.3e-12, (n_episodes, n_samples))
+    current[:, 1000:3000] -= 1e-12
+    recording = Recording("test.mat")
+    recording["raw_"] = Series.from_arrays(
+        time, list(current), ep_numbers=list(range(3, 3 + n_episodes))
+    )
+    recording.lists = {"All": (list(range(n_episodes)), None), "odd": ([1, 3], "o")}
+    IdealizationCache(recording, AMPLITUDES, None, None, 2).idealize_series()
+    return recording
+
+
+def export(recording, path, lists=("All",)):
+    return recording.export_idealization(
+        str(path), list(lists), "ms", "pA", AMPLITUDES, None, None, 2
+    )
+
+
+def test_csv_export_equals_savetxt_of_the_matrix(recording, tmp_path):
+    path = export(recording, tmp_path / "idealization")
+    assert path.endswith("idealization.csv")
+    episodes = recording.series
+    matrix = np.array(
+        [episodes[0].id_time * 1e3] + [e.idealization * 1e12 for e in episodes]
+    )
+    np.savetxt(
+        tmp_path / "reference.csv",
+        matrix.T,
+        delimiter=",",
+        header="amplitudes = [ 0.e+00 -1.e-12];thresholds = None;resolution = None;"
+        "interpolation_factor = 2\n Time, "
+        + ", ".join(f"Episode number {e.n_episode}" for e in episodes),
+    )
+    with open(path) as exported, open(tmp_path / "reference.csv") as reference:
+        assert exported.read() == reference.read()
+
+
+def test_npy_export(recording, tmp_path):
+    path = export(recording, tmp_path / "idealization.npy", ["odd"])
+    matrix = np.load(path)
+    episodes = recording.series
+    np.testing.assert_allclose(matrix[0], episodes[0].id_time * 1e3)
+    np.testing.assert_allclose(matrix[1], episodes[1].idealization * 1e12)
+    np.testing.assert_allclose(matrix[2], episodes[3].idealization * 1e12)
+
+
+def test_npz_export(recording, tmp_path):
+    path = export(recording, tmp_path / "idealization.npz")
+    with np.load(path) as archive:
+        np.testing.assert_array_equal(archive["episodes"], recording.series.n_episodes)
+        np.testing.assert_allclose(archive["time"], recording.series[0].id_time * 1e3)
+        np.testing.assert_allclose(
+            archive["idealization"],
+            [e.idealization * 1e12 for e in recording.series],
+        )
+        assert "interpolation_factor" in str(archive["parameters"])
+
+
+def test_rle_export_decodes_to_the_idealization(recording, tmp_path):
+    path = export(recording, tmp_path / "idealization.rle")
+    events = read_events(path)
+    for episode in recording.series:
+        runs = events[events.episode == episode.n_episode]
+        decoded = np.repeat(runs.amplitude, runs.n_samples)
+        np.testing.assert_array_equal(decoded, episode.idealization)
+
+
+def test_hdf5_export(recording, tmp_path):
+    h5py = pytest.importorskip("h5py")
+    path = export(recording, tmp_path / "idealization.h5")
+    with h5py.File(path, "r") as file:
+        np.testing.assert_allclose(
+            file["idealization"][:], [e.idealization * 1e12 for e in recording.series]
+        )
+        assert file.attrs["trace_unit"] == "pA"
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+import scipy.io
+
+from src.core import Recording
+from src.utils import LRUCache
+
+
+@pytest.fixture
+def matfile(tmp_path, request):
+    rng = np.random.default_rng(2)
+    data = {"Time": np.arange(500) / 4e4}
+    for i in range(12):
+        data[f"Ipatch {i + 1}"] = rng.normal(size=500)
+        data[f"Piezo {i + 1}"] = np.r_[np.zeros(100), np.ones(300), np.zeros(100)]
+    filename = str(tmp_path / "recording.mat")
+    scipy.io.savemat(filename, data, do_compression=request.param)
+    return filename
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_bytes=3 * 80)
+    for key in range(3):
+        cache.put(key, np.zeros(10))
+    cache.get(0)
+    cache.put(3, np.zeros(10))
+    assert cache.keys() == [2, 0, 3]
+    assert cache.nbytes == 240
+    cache.put(4, np.zeros(100))
+    assert 4 not in cache
+
+
+@pytest.mark.parametrize("matfile", [False, True], indirect=True)
+def test_lazy_recording_matches_eager(matfile):
+    eager = Recording.from_file(matfile, trace_input_unit="pA", lazy=False)
+    lazy = Recording.from_file(
+        matfile, trace_input_unit="pA", lazy=True, memory_budget=4 * 500 * 8
+    )
+    series = lazy["raw_"]
+    assert series.is_lazy and lazy.has_piezo
+    for episode, expected in zip(series, eager["raw_"]):
+        np.testing.assert_array_equal(episode.trace, expected.trace)
+        np.testing.assert_array_equal(episode.piezo, expected.piezo)
+    assert series._lazy["trace"].cache.nbytes <= 4 * 500 * 8
+    for select_piezo in (True, False):
+        np.testing.assert_array_equal(
+            lazy.series_hist(select_piezo=select_piezo)[0],
+            eager.series_hist(select_piezo=select_piezo)[0],
+        )
+    np.testing.assert_array_equal(series.trace, eager["raw_"].trace)
+
+
+def test_lazy_loading_keeps_variables_with_repeated_names(tmp_path):
+    # names wrap around in files with more than 1000 episodes, a second
+    # file of variables is appended after the header of the first
+    rng = np.random.default_rng(4)
+    first, second = str(tmp_path / "first.mat"), str(tmp_path / "second.mat")
+    traces = rng.normal(size=(2, 200))
+    scipy.io.savemat(first, {"Time": np.arange(200) / 4e4, "Ipatch 001": traces[0]})
+    scipy.io.savemat(second, {"Ipatch 001": traces[1]})
+    filename = str(tmp_path / "recording.mat")
+    with open(filename, "wb") as file:
+        file.write(open(first, "rb").read())
+        # the header of a `.mat` file takes 128 bytes
+        file.write(open(second, "rb").read()[128:])
+    eager = Recording.from_file(filename, lazy=False)
+    lazy = Recording.from_file(filename, lazy=True)
+    assert len(eager["raw_"]) == len(lazy["raw_"]) == 2
+    np.testing.assert_array_equal(lazy["raw_"].trace, eager["raw_"].trace)
+    np.testing.assert_array_equal(lazy["raw_"].trace, traces)
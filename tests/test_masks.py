@@ -0,0 +1,59 @@
+import pytest
+import numpy as np
+
+from src.core.series import Series
+from src.core.analysis import baseline_correction
+from src.utils import piezo_selection
+
+
+@pytest.fixture
+def series():
+    rng = np.random.default_rng(2)
+    n_samples = 1000
+    time = np.arange(n_samples) / 4e4
+    current = [rng.normal(0, 1, n_samples) for _ in range(4)]
+    piezo = [np.zeros(n_samples) for _ in range(4)]
+    piezo[0][100:400] = 5
+    piezo[1][100:200] = -3
+    piezo[1][600:700] = -3
+    piezo[2][:] = 1 + rng.normal(0, 0.02, n_samples)
+    piezo[3][500:] = np.linspace(0, 2, 500)
+    return Series.from_arrays(time, current, piezo=piezo)
+
+
+@pytest.mark.parametrize("active", [True, False])
+@pytest.mark.parametrize("deviation", [0.01, 0.05, 0.5])
+def test_masks_select_like_piezo_selection(series, active, deviation):
+    for position, episode in enumerate(series):
+        expected = piezo_selection(
+            series.time, episode.piezo, episode.trace, active, deviation
+        )[1]
+        selected = series.piezo_masks.select(
+            position, episode.trace, active, deviation
+        )
+        np.testing.assert_array_equal(selected, expected)
+        mask = series.piezo_masks.mask(position, active, deviation)
+        np.testing.assert_array_equal(episode.trace[mask], expected)
+
+
+def test_single_run_is_a_view(series):
+    trace = series[0].trace
+    assert np.shares_memory(series.piezo_masks.select(0, trace), trace)
+
+
+def test_derived_series_share_masks(series):
+    derived = series.derive()
+    assert derived.piezo_masks is series.piezo_masks
+    derived.writable("piezo")
+    assert derived.piezo_masks is not series.piezo_masks
+
+
+def test_baseline_correction_with_mask(series):
+    episode = series[0]
+    mask = series.piezo_masks.mask(0, active=False)
+    np.testing.assert_allclose(
+        baseline_correction(
+            series.time, episode.trace, 4e4, piezo=episode.piezo, mask=mask
+        ),
+        baseline_correction(series.time, episode.trace, 4e4, piezo=episode.piezo),
+    )
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from src.core.parallel import SeriesExecutor
+from src.core.filtering import gaussian_filter_series
+from src.core.analysis import Idealizer
+
+
+@pytest.fixture
+def signals():
+    rng = np.random.default_rng(0)
+    return rng.normal(size=(7, 2000))
+
+
+@pytest.mark.parametrize("backend", ["serial", "thread", "process"])
+def test_map_rows_matches_direct_call(signals, backend):
+    executor = SeriesExecutor(backend, n_workers=2)
+    result = executor.map_rows(
+        gaussian_filter_series, [signals], filter_frequency=1e3, sampling_rate=4e4
+    )
+    expected = gaussian_filter_series(signals, 1e3, 4e4)
+    np.testing.assert_allclose(result, expected)
+
+
+@pytest.mark.parametrize("backend", ["serial", "thread", "process"])
+def test_map_episodes_keeps_order(signals, backend):
+    executor = SeriesExecutor(backend, n_workers=3)
+    time = np.arange(signals.shape[1]) / 4e4
+    amplitudes = np.array([0, 1])
+    results = executor.map_episodes(
+        Idealizer.idealize_series, [signals], time=time, amplitudes=amplitudes
+    )
+    assert len(results) == len(signals)
+    for signal, idealization in zip(signals, results):
+        expected, _ = Idealizer.idealize_episode(signal, time, amplitudes)
+        np.testing.assert_array_equal(idealization, expected)
+
+
+def test_chunks_cover_all_rows():
+    executor = SeriesExecutor("thread", n_workers=4)
+    chunks = executor.chunks(10, 100)
+    assert chunks[0][0] == 0 and chunks[-1][1] == 10
+    assert all(a[1] == b[0] for a, b in zip(chunks, chunks[1:]))
+    assert len(chunks) == 4
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        SeriesExecutor("gpu")
@@ -0,0 +1,159 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from src.core import Recording, Series, IdealizationCache
+from src.core.episode import Episode
+
+
+@pytest.fixture
+def recording():
+    rng = np.random.default_rng(3)
+    n_episodes, n_samples = 8, 400
+    time = np.arange(n_samples) / 4e4
+    piezo = [np.r_[np.zeros(100), np.ones(200), np.zeros(100)]] * n_episodes
+    current = [rng.normal(0, 0.1, n_samples) for _ in range(n_episodes)]
+    recording = Recording("test.mat")
+    recording["raw_"] = Series.from_arrays(
+        time, current, piezo=piezo, ep_numbers=list(range(1, n_episodes + 1))
+    )
+    recording.lists = {"All": (list(range(n_episodes)), None), "odd": ([1, 3, 5], "o")}
+    recording.current_ep_ind = 1
+    recording.gauss_filter_series(1000)
+    recording.series[2].first_activation = 0.004
+    recording.series[2].manual_first_activation = True
+    return recording
+
+
+def test_project_round_trip(recording, tmp_path):
+    path = recording.save_project(str(tmp_path / "session"))
+    assert path.endswith(".ascam")
+    loaded = Recording.from_file(path)
+    assert list(loaded.keys()) == list(recording.keys())
+    assert loaded.current_datakey == recording.current_datakey
+    assert loaded.lists == recording.lists
+    for datakey, series in recording.items():
+        np.testing.assert_array_equal(loaded[datakey].trace, series.trace)
+        np.testing.assert_array_equal(loaded[datakey].n_episodes, series.n_episodes)
+    assert loaded.series[2].first_activation == 0.004
+    assert loaded.series[2].manual_first_activation
+    # channels shared before saving are stored once and shared again
+    assert loaded["raw_"].piezo is loaded[recording.current_datakey].piezo
+
+
+def test_project_arrays_are_memory_mapped_copy_on_write(recording, tmp_path):
+    path = recording.save_project(str(tmp_path / "session"))
+    loaded = Recording.from_project(path)
+    trace = loaded.series.trace
+    assert not trace.flags.writeable and not trace.flags.owndata
+    loaded.series[0].trace = np.zeros(trace.shape[1])
+    assert not loaded.series[0].trace.any()
+    np.testing.assert_array_equal(trace, recording.series.trace)
+
+
+def test_project_partial_load(recording, tmp_path):
+    path = recording.save_project(str(tmp_path / "session"))
+    loaded = Recording.from_project(path, datakeys=["raw_"], episodes=(2, 6))
+    assert list(loaded.keys()) == ["raw_"]
+    np.testing.assert_array_equal(loaded.series.n_episodes, [3, 4, 5, 6])
+    np.testing.assert_array_equal(loaded.series.trace, recording["raw_"].trace[2:6])
+    assert loaded.lists["odd"] == ([1, 3], "o")
+    assert loaded.current_ep_ind == 3
+
+
+def test_project_keeps_the_runs_of_idealizations(recording, tmp_path):
+    cache = IdealizationCache(recording, np.array([0, -0.1]), None, 1e-4, 2)
+    cache.idealize_series()
+    path = recording.save_project(str(tmp_path / "session"), cache.parameters)
+    loaded = Recording.from_file(path)
+    partial = Recording.from_project(path, episodes=(2, 6))
+    for episode, partial_episode in zip(recording.series[2:6], partial.series):
+        np.testing.assert_array_equal(partial_episode.idealization, episode.idealization)
+    for episode, loaded_episode in zip(recording.series, loaded.series):
+        np.testing.assert_array_equal(loaded_episode.idealization, episode.idealization)
+        np.testing.assert_array_equal(loaded_episode.id_time, episode.id_time)
+        np.testing.assert_array_equal(
+            loaded_episode.idealization.starts, episode.idealization.starts
+        )
+    assert loaded.active_idealization == cache.key
+
+
+def test_project_keeps_refined_crossings(recording, tmp_path):
+    cache = IdealizationCache(
+        recording, np.array([0, -0.1]), None, None, 1, refinement="linear"
+    )
+    cache.idealize_series()
+    path = recording.save_project(str(tmp_path / "session"), cache.parameters)
+    loaded = Recording.from_file(path)
+    for episode, loaded_episode in zip(recording.series, loaded.series):
+        np.testing.assert_array_equal(
+            loaded_episode.idealization.crossings, episode.idealization.crossings
+        )
+    assert loaded.active_idealization == cache.key
+
+
+def test_legacy_pickle_with_episode_lists(tmp_path):
+    # before series held their data in blocks, a series was a list of
+    # episodes that held their own arrays
+    rng = np.random.default_rng(8)
+    time = np.arange(300) / 4e4
+    episodes = []
+    for n_episode in (4, 5, 6):
+        episode = Episode.__new__(Episode)
+        episode.__dict__.update(
+            time=time,
+            trace=rng.normal(size=300),
+            _id_time=time,
+            piezo=np.ones(300),
+            command=None,
+            first_activation=0.001 * n_episode,
+            manual_first_activation=n_episode == 5,
+            idealization=np.repeat([0.0, -1.0, 0.0], 100) if n_episode == 6 else None,
+            id_time=time if n_episode == 6 else None,
+            n_episode=n_episode,
+        )
+        episodes.append(episode)
+    legacy = Recording("legacy.pkl")
+    dict.__setitem__(legacy, "raw_", episodes)
+    filename = str(tmp_path / "legacy.pkl")
+    with open(filename, "wb") as file:
+        pickle.dump(legacy, file)
+
+    loaded = Recording.from_file(filename)
+    series = loaded["raw_"]
+    np.testing.assert_array_equal(series.n_episodes, [4, 5, 6])
+    np.testing.assert_array_equal(series.trace[1], episodes[1].__dict__["trace"])
+    np.testing.assert_array_equal(series.piezo, np.ones((3, 300)))
+    assert series.command is None
+    assert series[0].first_activation == 0.004
+    assert series[1].manual_first_activation and not series[0].manual_first_activation
+    np.testing.assert_array_equal(series.idealized, [False, False, True])
+    np.testing.assert_array_equal(series[2].idealization, np.repeat([0, -1, 0], 100))
+    np.testing.assert_array_equal(series[2].id_time, time)
+
+
+def test_saving_over_a_loaded_project_releases_its_files(recording, tmp_path):
+    IdealizationCache(recording, np.array([0, -0.5]), None, None, 1).idealize_series()
+    path = recording.save_project(str(tmp_path / "session"))
+    loaded = Recording.from_project(path)
+    assert isinstance(loaded.series.trace.base, np.memmap)
+    loaded.save_project(path)
+    episode = loaded.series[0]
+    for array in (loaded.series.trace, loaded.series.time, episode.idealization.levels):
+        while array is not None:
+            assert not isinstance(array, np.memmap)
+            array = array.base
+    # arrays shared before saving stay shared
+    assert loaded["raw_"].piezo is loaded[loaded.current_datakey].piezo
+    np.testing.assert_array_equal(loaded.series.trace, recording.series.trace)
+    resaved = Recording.from_project(path)
+    np.testing.assert_array_equal(resaved.series.trace, recording.series.trace)
+
+
+def test_project_load_with_stepped_slice_maps_lists(recording, tmp_path):
+    path = recording.save_project(str(tmp_path / "session"))
+    loaded = Recording.from_project(path, episodes=slice(1, 8, 2))
+    np.testing.assert_array_equal(loaded.series.n_episodes, [2, 4, 6, 8])
+    assert loaded.lists["odd"] == ([0, 1, 2], "o")
+    assert loaded.lists["All"] == ([0, 1, 2, 3], None)
@@ -0,0 +1,61 @@
+import pytest
+import numpy as np
+
+from src.core.series import Series
+
+
+@pytest.fixture
+def series():
+    time = np.arange(10) / 10
+    current = [np.arange(10) + 10 * i for i in range(3)]
+    piezo = [np.ones(10) for _ in range(3)]
+    return Series.from_arrays(
+        time, current, piezo=piezo, ep_numbers=[4, 5, 6], input_trace_unit="pA"
+    )
+
+
+def test_series_is_columnar(series):
+    assert series.trace.shape == (3, 10)
+    assert series.piezo.shape == (3, 10)
+    assert series.command is None
+    assert np.all(series.n_episodes == [4, 5, 6])
+    assert series[1].trace[0] == pytest.approx(10e-12)
+
+
+def test_episodes_are_views(series):
+    episode = series[2]
+    assert np.shares_memory(episode.trace, series.trace)
+    assert episode.time is series.time
+    episode.trace = np.zeros(10)
+    assert np.all(series.trace[2] == 0)
+    assert np.all(series.trace[1] != 0)
+
+
+def test_derived_series_shares_unchanged_channels(series):
+    derived = series.derive()
+    assert derived.piezo is series.piezo
+    assert derived.time is series.time
+    assert not np.shares_memory(derived.trace, series.trace)
+    assert np.all(derived.n_episodes == series.n_episodes)
+
+
+def test_writing_shared_channel_copies_it(series):
+    derived = series.derive()
+    derived[0].piezo = np.zeros(10)
+    assert derived.piezo is not series.piezo
+    assert np.all(series.piezo == 1)
+    assert np.all(derived.piezo[0] == 0)
+
+
+def test_episode_lookup_by_number(series):
+    assert series.position(5) == 1
+    assert series.episode(6) is series[2]
+    assert series.episode(7) is None
+
+
+def test_idealized_bitmap_follows_episodes(series):
+    assert not series.idealized.any()
+    series[1].idealization = np.zeros(10)
+    np.testing.assert_array_equal(series.idealized, [False, True, False])
+    series[1].idealization = None
+    assert not series.idealized.any()
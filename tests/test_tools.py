@@ -0,0 +1,56 @@
+import pytest
+import numpy as np
+
+from src.utils import interval_selection
+
+
+def reference_selection(time, signal, intervals, fs):
+    time_out = []
+    signal_out = []
+    if isinstance(intervals[0], (np.ndarray, list)):
+        for ival in intervals:
+            time_out.extend(time[int(ival[0] * fs) : int(ival[-1] * fs)])
+            signal_out.extend(signal[int(ival[0] * fs) : int(ival[-1] * fs)])
+    else:
+        time_out = time[int(intervals[0] * fs) : int(intervals[-1] * fs)]
+        signal_out = signal[int(intervals[0] * fs) : int(intervals[1] * fs)]
+    return time_out, signal_out
+
+
+@pytest.mark.parametrize(
+    "intervals",
+    [
+        [0.001, 0.01],
+        [[0.001, 0.01]],
+        [[0, 0.002], [0.005, 0.0125], [0.02, 0.03]],
+        [np.array([0.0001, 0.0003]), np.array([0.01, 0.1])],
+    ],
+)
+def test_interval_selection_equals_reference(intervals):
+    fs = 4e4
+    time = np.arange(1000) / fs
+    signal = np.random.default_rng(0).normal(size=1000)
+    selected = interval_selection(time, signal, intervals, fs)
+    expected = reference_selection(time, signal, intervals, fs)
+    np.testing.assert_array_equal(selected[0], expected[0])
+    np.testing.assert_array_equal(selected[1], expected[1])
+
+
+def test_single_interval_is_a_view():
+    time = np.arange(100) / 100
+    signal = np.arange(100.0)
+    _, selected = interval_selection(time, signal, [0.1, 0.5], 100)
+    assert np.shares_memory(selected, signal)
+
+
+def test_batched_selection_selects_every_row():
+    fs = 100
+    time = np.arange(100) / fs
+    block = np.arange(500.0).reshape(5, 100)
+    intervals = [[0.1, 0.2], [0.5, 0.55]]
+    selected_time, selected = interval_selection(time, block, intervals, fs)
+    assert selected.shape == (5, selected_time.size)
+    for row, selected_row in zip(block, selected):
+        np.testing.assert_array_equal(
+            selected_row, interval_selection(time, row, intervals, fs)[1]
+        )